@@ -0,0 +1,55 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Task switch and socket echo benchmarks on other event loop
+classes, made green with ``greenio.install``: the plain selector loop
+and uvloop (if it's installed).  The asyncio versions run on loops of
+the same classes without greenio."""
+import functools
+
+import greenio
+from greenio import asyncio
+
+import bench_socket
+import bench_tasks
+
+
+BACKENDS = [('selector', asyncio.SelectorEventLoop)]
+try:
+    import uvloop
+except ImportError:
+    pass
+else:
+    BACKENDS.append(('uvloop', uvloop.new_event_loop))
+
+
+def on_backend(new_loop, green, func, loop, number):
+    # Run on a loop of the backend instead of the one "run.py" created
+    backend_loop = new_loop()
+    if green:
+        greenio.install(backend_loop)
+    asyncio.set_event_loop(backend_loop)
+    try:
+        func(backend_loop, number)
+    finally:
+        asyncio.set_event_loop(loop)
+        backend_loop.close()
+
+
+WORKLOADS = [
+    ('yield_from_pending', 20000, bench_tasks.greenio_yield_from_pending,
+     bench_tasks.asyncio_yield_from_pending),
+    ('echo_socketpair_latency', 5000,
+     functools.partial(bench_socket.greenio_echo, bench_socket.socketpair, 1),
+     functools.partial(bench_socket.asyncio_echo, bench_socket.socketpair,
+                       1)),
+]
+
+BENCHMARKS = []
+for backend, new_loop in BACKENDS:
+    for name, number, greenio_func, asyncio_func in WORKLOADS:
+        BENCHMARKS.append((
+            'backend_{}_{}'.format(backend, name), number,
+            functools.partial(on_backend, new_loop, True, greenio_func),
+            functools.partial(on_backend, new_loop, False, asyncio_func)))
@@ -0,0 +1,108 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Small-message benchmarks of ``ReadFile`` and ``WriteFile``, the
+way database drivers use them: lots of short lines and writes."""
+import socket as std_socket
+
+import greenio
+import greenio.socket as greensocket
+from greenio import asyncio
+
+
+LINE = b'x' * 30 + b'\n'
+
+
+def greenio_readline(loop, number):
+    writer, reader = std_socket.socketpair()
+
+    def write():
+        sock = greensocket.socket.from_socket(writer)
+        for i in range(number // 1000):
+            sock.sendall(LINE * 1000)
+        sock.close()
+
+    def read():
+        sock = greensocket.socket.from_socket(reader)
+        rfile = sock.makefile('rb')
+        for i in range(number):
+            rfile.readline()
+        sock.close()
+
+    loop.run_until_complete(asyncio.wait(
+        [greenio.task(write, loop=loop)(), greenio.task(read, loop=loop)()]))
+
+
+def asyncio_readline(loop, number):
+    writer, reader = std_socket.socketpair()
+    writer.setblocking(False)
+
+    @asyncio.coroutine
+    def write():
+        for i in range(number // 1000):
+            yield from loop.sock_sendall(writer, LINE * 1000)
+        writer.close()
+
+    @asyncio.coroutine
+    def read():
+        stream, stream_writer = yield from asyncio.open_connection(
+            sock=reader, loop=loop)
+        for i in range(number):
+            yield from stream.readline()
+        stream_writer.close()
+
+    loop.run_until_complete(asyncio.wait(
+        [loop.create_task(write()), loop.create_task(read())]))
+
+
+def greenio_write(loop, number):
+    writer, reader = std_socket.socketpair()
+
+    def write():
+        sock = greensocket.socket.from_socket(writer)
+        wfile = sock.makefile('wb', 65536)
+        for i in range(number):
+            wfile.write(LINE)
+        wfile.flush()
+        sock.close()
+
+    def read():
+        sock = greensocket.socket.from_socket(reader)
+        while sock.recv(65536):
+            pass
+        sock.close()
+
+    loop.run_until_complete(asyncio.wait(
+        [greenio.task(write, loop=loop)(), greenio.task(read, loop=loop)()]))
+
+
+def asyncio_write(loop, number):
+    writer, reader = std_socket.socketpair()
+    reader.setblocking(False)
+
+    @asyncio.coroutine
+    def write():
+        stream_reader, stream = yield from asyncio.open_connection(
+            sock=writer, loop=loop)
+        for i in range(number):
+            stream.write(LINE)
+            if not i % 1000:
+                yield from stream.drain()
+        yield from stream.drain()
+        stream.close()
+
+    @asyncio.coroutine
+    def read():
+        while (yield from loop.sock_recv(reader, 65536)):
+            pass
+        reader.close()
+
+    loop.run_until_complete(asyncio.wait(
+        [loop.create_task(write()), loop.create_task(read())]))
+
+
+BENCHMARKS = [
+    ('readfile_readline', 50000, greenio_readline, asyncio_readline),
+    ('writefile_write', 50000, greenio_write, asyncio_write),
+]
@@ -0,0 +1,71 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Calls into an event loop running in another thread, made by 100
+concurrent tasks: ``greenio.call_in_loop`` vs
+``asyncio.run_coroutine_threadsafe``."""
+import threading
+
+import greenio
+from greenio import asyncio
+
+
+CONCURRENCY = 100
+
+
+def start_loop(new_loop):
+    loop = new_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    return loop, thread
+
+
+def stop_loop(loop, thread):
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def noop(value):
+    return value
+
+
+def greenio_call_in_loop(loop, number):
+    other, thread = start_loop(greenio.GreenEventLoopPolicy().new_event_loop)
+
+    def caller():
+        for i in range(number // CONCURRENCY):
+            greenio.call_in_loop(other, noop, i)
+
+    try:
+        loop.run_until_complete(asyncio.wait(
+            [greenio.task(caller, loop=loop)() for i in range(CONCURRENCY)]))
+    finally:
+        stop_loop(other, thread)
+
+
+def asyncio_call_in_loop(loop, number):
+    other, thread = start_loop(asyncio.new_event_loop)
+
+    @asyncio.coroutine
+    def remote(value):
+        return value
+
+    @asyncio.coroutine
+    def caller():
+        for i in range(number // CONCURRENCY):
+            yield from asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(remote(i), other),
+                loop=loop)
+
+    try:
+        loop.run_until_complete(asyncio.wait(
+            [loop.create_task(caller()) for i in range(CONCURRENCY)]))
+    finally:
+        stop_loop(other, thread)
+
+
+BENCHMARKS = [
+    ('call_in_loop', 20000, greenio_call_in_loop, asyncio_call_in_loop),
+]
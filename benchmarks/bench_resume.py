@@ -0,0 +1,44 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Measure how fast green tasks are resumed after "yield_from".
+
+Run with ``python3 benchmarks/run.py resume``.
+"""
+import greenio
+from greenio import asyncio
+
+
+TASKS = 100
+
+
+def greenio_resume(loop, number):
+    """Run green tasks, each waiting for futures resolved by the event
+    loop, *number* times in total."""
+
+    def waiter():
+        for i in range(number // TASKS):
+            fut = asyncio.Future(loop=loop)
+            loop.call_soon(fut.set_result, i)
+            greenio.yield_from(fut)
+
+    loop.run_until_complete(asyncio.wait(
+        [greenio.task(waiter, loop=loop)() for i in range(TASKS)]))
+
+
+def asyncio_resume(loop, number):
+    @asyncio.coroutine
+    def waiter():
+        for i in range(number // TASKS):
+            fut = asyncio.Future(loop=loop)
+            loop.call_soon(fut.set_result, i)
+            yield from fut
+
+    loop.run_until_complete(asyncio.wait(
+        [loop.create_task(waiter()) for i in range(TASKS)]))
+
+
+BENCHMARKS = [
+    ('resume', 100000, greenio_resume, asyncio_resume),
+]
@@ -0,0 +1,163 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Echo benchmarks of ``greenio.socket`` over a socketpair and over
+TCP loopback: round trips of 1 byte (latency) and of 64 KiB
+(throughput) messages; and UDP ingestion with ``recv_many``."""
+import functools
+import socket as std_socket
+
+import greenio
+import greenio.socket as greensocket
+from greenio import asyncio
+
+
+def socketpair():
+    return std_socket.socketpair()
+
+
+def loopback_pair():
+    listener = std_socket.socket()
+    try:
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        client = std_socket.create_connection(listener.getsockname())
+        server, addr = listener.accept()
+    finally:
+        listener.close()
+    client.setsockopt(std_socket.IPPROTO_TCP, std_socket.TCP_NODELAY, 1)
+    server.setsockopt(std_socket.IPPROTO_TCP, std_socket.TCP_NODELAY, 1)
+    return client, server
+
+
+def greenio_echo(make_pair, size, loop, number):
+    client, server = make_pair()
+    message = b'x' * size
+
+    def echo():
+        sock = greensocket.socket.from_socket(server)
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            sock.sendall(data)
+        sock.close()
+
+    def ping():
+        sock = greensocket.socket.from_socket(client)
+        for i in range(number):
+            sock.sendall(message)
+            received = 0
+            while received < size:
+                received += len(sock.recv(65536))
+        sock.close()
+
+    loop.run_until_complete(asyncio.wait(
+        [greenio.task(echo, loop=loop)(), greenio.task(ping, loop=loop)()]))
+
+
+def asyncio_echo(make_pair, size, loop, number):
+    client, server = make_pair()
+    client.setblocking(False)
+    server.setblocking(False)
+    message = b'x' * size
+
+    @asyncio.coroutine
+    def echo():
+        while True:
+            data = yield from loop.sock_recv(server, 65536)
+            if not data:
+                break
+            yield from loop.sock_sendall(server, data)
+        server.close()
+
+    @asyncio.coroutine
+    def ping():
+        for i in range(number):
+            yield from loop.sock_sendall(client, message)
+            received = 0
+            while received < size:
+                received += len((yield from loop.sock_recv(client, 65536)))
+        client.close()
+
+    loop.run_until_complete(asyncio.wait(
+        [loop.create_task(echo()), loop.create_task(ping())]))
+
+
+BENCHMARKS = []
+for name, make_pair in [('socketpair', socketpair),
+                        ('loopback', loopback_pair)]:
+    for size, label, number in [(1, 'latency', 5000),
+                                (65536, 'throughput_64k', 500)]:
+        BENCHMARKS.append((
+            'echo_{}_{}'.format(name, label), number,
+            functools.partial(greenio_echo, make_pair, size),
+            functools.partial(asyncio_echo, make_pair, size)))
+
+
+# UDP ingestion: bursts of datagrams received with "recv_many" vs
+# an asyncio datagram protocol
+
+UDP_BURST = 32
+
+
+def udp_pair():
+    receiver = std_socket.socket(std_socket.AF_INET, std_socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    sender = std_socket.socket(std_socket.AF_INET, std_socket.SOCK_DGRAM)
+    sender.connect(receiver.getsockname())
+    return sender, receiver
+
+
+def greenio_udp_recv_many(loop, number):
+    sender, receiver = udp_pair()
+    buffers = [bytearray(2048) for i in range(UDP_BURST)]
+
+    def ingest():
+        sock = greensocket.socket.from_socket(receiver)
+        for i in range(number):
+            for j in range(UDP_BURST):
+                sender.send(b'x' * 100)
+            received = 0
+            while received < UDP_BURST:
+                received += len(sock.recv_many(buffers))
+        sock.close()
+
+    loop.run_until_complete(greenio.task(ingest, loop=loop)())
+    sender.close()
+
+
+class _Counter(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = 0
+        self.waiter = None
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        if self.received == UDP_BURST:
+            self.received = 0
+            self.waiter.set_result(None)
+
+
+def asyncio_udp_recv_many(loop, number):
+    sender, receiver = udp_pair()
+    receiver.setblocking(False)
+
+    @asyncio.coroutine
+    def ingest():
+        transport, protocol = yield from loop.create_datagram_endpoint(
+            _Counter, sock=receiver)
+        for i in range(number):
+            protocol.waiter = loop.create_future()
+            for j in range(UDP_BURST):
+                sender.send(b'x' * 100)
+            yield from protocol.waiter
+        transport.close()
+
+    loop.run_until_complete(ingest())
+    sender.close()
+
+
+BENCHMARKS.append(('udp_recv_many', 1000,
+                   greenio_udp_recv_many, asyncio_udp_recv_many))
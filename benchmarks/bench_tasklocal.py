@@ -0,0 +1,49 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Resume green tasks that inherit 0, 10 and 10000 ``greenio.local``
+objects set by their parent task, and read one of them on every step:
+the cost of switching between tasks doesn't depend on the number of
+locals.
+
+Run with ``python3 benchmarks/run.py tasklocal``.
+"""
+import greenio
+from greenio import asyncio
+
+
+TASKS = 100
+
+
+def resume_with_locals(count):
+    locals_ = [greenio.local() for i in range(count)]
+    current = greenio.local()
+
+    def bench(loop, number):
+        def waiter():
+            for i in range(number // TASKS):
+                fut = asyncio.Future(loop=loop)
+                loop.call_soon(fut.set_result, i)
+                greenio.yield_from(fut)
+                current.value
+
+        def parent():
+            # Set once here, and inherited by the waiters without copying
+            for data in locals_:
+                data.value = 0
+            current.value = 0
+            greenio.yield_from(asyncio.wait(
+                [greenio.task(waiter, loop=loop)() for i in range(TASKS)],
+                loop=loop))
+
+        loop.run_until_complete(greenio.task(parent, loop=loop)())
+
+    return bench
+
+
+BENCHMARKS = [
+    ('resume_locals_0', 100000, resume_with_locals(0), None),
+    ('resume_locals_10', 100000, resume_with_locals(10), None),
+    ('resume_locals_10000', 100000, resume_with_locals(10000), None),
+]
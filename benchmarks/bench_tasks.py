@@ -0,0 +1,82 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Benchmarks of green tasks and "yield_from"."""
+import greenio
+from greenio import asyncio
+
+
+def greenio_yield_from_pending(loop, number):
+    def test():
+        for i in range(number):
+            fut = asyncio.Future(loop=loop)
+            loop.call_soon(fut.set_result, i)
+            greenio.yield_from(fut)
+
+    loop.run_until_complete(greenio.task(test, loop=loop)())
+
+
+def asyncio_yield_from_pending(loop, number):
+    @asyncio.coroutine
+    def test():
+        for i in range(number):
+            fut = asyncio.Future(loop=loop)
+            loop.call_soon(fut.set_result, i)
+            yield from fut
+
+    loop.run_until_complete(test())
+
+
+def greenio_yield_from_done(loop, number):
+    fut = asyncio.Future(loop=loop)
+    fut.set_result(None)
+
+    def test():
+        for i in range(number):
+            greenio.yield_from(fut)
+
+    loop.run_until_complete(greenio.task(test, loop=loop)())
+
+
+def asyncio_yield_from_done(loop, number):
+    fut = asyncio.Future(loop=loop)
+    fut.set_result(None)
+
+    @asyncio.coroutine
+    def test():
+        for i in range(number):
+            yield from fut
+
+    loop.run_until_complete(test())
+
+
+def greenio_task_create(loop, number):
+    # The tasks are created and run in batches, so that the greenlets
+    # of the finished ones can be reused
+    def noop():
+        pass
+
+    green_noop = greenio.task(noop, loop=loop)
+    for i in range(number // 100):
+        loop.run_until_complete(asyncio.wait(
+            [green_noop() for j in range(100)]))
+
+
+def asyncio_task_create(loop, number):
+    @asyncio.coroutine
+    def noop():
+        pass
+
+    for i in range(number // 100):
+        loop.run_until_complete(asyncio.wait(
+            [loop.create_task(noop()) for j in range(100)]))
+
+
+BENCHMARKS = [
+    ('yield_from_pending', 20000,
+     greenio_yield_from_pending, asyncio_yield_from_pending),
+    ('yield_from_done', 100000,
+     greenio_yield_from_done, asyncio_yield_from_done),
+    ('task_create', 20000, greenio_task_create, asyncio_task_create),
+]
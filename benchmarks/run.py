@@ -0,0 +1,141 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Run greenio benchmarks.
+
+Usage:
+  python3 benchmarks/run.py [-r REPEAT] [-g] [-o FILE] [-c FILE] [pattern]
+
+Where:
+  -r: number of runs of each benchmark, the best one is reported
+  -g: don't run the plain asyncio versions of the benchmarks
+  -o: save the results as JSON to FILE
+  -c: compare the results with a JSON FILE saved before
+  pattern: optional regex patterns to match benchmark names
+
+Every "bench_*.py" module in this directory defines a ``BENCHMARKS``
+list of ``(name, number, greenio_func, asyncio_func)`` tuples.  Both
+functions are called as ``func(loop, number)`` and perform *number*
+operations: the first one with green tasks on a greenio event loop,
+the second one (if not None) with plain asyncio coroutines on a
+default event loop, for comparison.  Results are in microseconds per
+operation.
+"""
+from __future__ import print_function
+import argparse
+import glob
+import json
+import os
+import platform
+import re
+import sys
+import time
+
+import greenio
+from greenio import asyncio
+
+
+if hasattr(time, 'perf_counter'):
+    _clock = time.perf_counter
+else:
+    _clock = time.time
+
+
+def load_benchmarks(patterns):
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, dirname)
+    benchmarks = []
+    for filename in sorted(glob.glob(os.path.join(dirname, 'bench_*.py'))):
+        modname = os.path.splitext(os.path.basename(filename))[0]
+        module = __import__(modname)
+        for bench in module.BENCHMARKS:
+            if not patterns or any(re.search(pat, bench[0])
+                                   for pat in patterns):
+                benchmarks.append(bench)
+    return benchmarks
+
+
+def measure(new_loop, func, number, repeat):
+    best = None
+    for i in range(repeat):
+        loop = new_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            started = _clock()
+            func(loop, number)
+            elapsed = _clock() - started
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / number * 1e6
+
+
+def run(benchmarks, repeat, greenio_only=False):
+    results = {}
+    green_policy = greenio.GreenEventLoopPolicy()
+    for name, number, greenio_func, asyncio_func in benchmarks:
+        asyncio.set_event_loop_policy(green_policy)
+        try:
+            result = {'number': number,
+                      'greenio': measure(green_policy.new_event_loop,
+                                         greenio_func, number, repeat)}
+        finally:
+            asyncio.set_event_loop_policy(None)
+        if asyncio_func is not None and not greenio_only:
+            result['asyncio'] = measure(asyncio.new_event_loop,
+                                        asyncio_func, number, repeat)
+        results[name] = result
+        print_result(name, result)
+    return results
+
+
+def print_result(name, result):
+    line = '{:<32} {:>10.2f} usec'.format(name, result['greenio'])
+    if 'asyncio' in result:
+        line += '   asyncio {:>10.2f} usec ({:.2f}x)'.format(
+            result['asyncio'], result['greenio'] / result['asyncio'])
+    print(line)
+
+
+def compare(results, filename):
+    with open(filename) as f:
+        base = json.load(f)['benchmarks']
+    print()
+    print('Compared with {}:'.format(filename))
+    for name in sorted(results):
+        if name not in base:
+            continue
+        old = base[name]['greenio']
+        new = results[name]['greenio']
+        print('{:<32} {:>10.2f} -> {:>10.2f} usec ({:+.1f}%)'.format(
+            name, old, new, (new - old) / old * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run greenio benchmarks.')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-g', '--greenio-only', action='store_true')
+    parser.add_argument('-o', '--output', metavar='FILE')
+    parser.add_argument('-c', '--compare', metavar='FILE')
+    parser.add_argument('pattern', nargs='*')
+    args = parser.parse_args()
+
+    results = run(load_benchmarks(args.pattern), args.repeat,
+                  args.greenio_only)
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'asyncio': asyncio.__name__,
+                       'benchmarks': results},
+                      f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
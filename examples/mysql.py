@@ -32,6 +32,7 @@ class GreenConnection(connections.Connection):
 if __name__ == '__main__':
     import greenio
     import time
+    from greenio.pool import Pool
 
     @asyncio.coroutine
     def sleeper():
@@ -42,9 +43,8 @@ if __name__ == '__main__':
 
     @greenio.task
     def db():
-        conn = GreenConnection(host='localhost')
-
-        try:
+        # Connections are returned to the pool and reused by the next task
+        with pool.connection() as conn:
             with conn as cur:
                 print('>> sleeping')
                 st = time.monotonic()
@@ -62,8 +62,6 @@ if __name__ == '__main__':
                 en = time.monotonic() - st
                 assert en >= 1
                 print('<< sleeping {:.3f}s'.format(en))
-        finally:
-            conn.close()
 
     @asyncio.coroutine
     def run():
@@ -72,5 +70,7 @@ if __name__ == '__main__':
 
     asyncio.set_event_loop_policy(greenio.GreenEventLoopPolicy())
     loop = asyncio.get_event_loop()
+    pool = Pool(lambda: GreenConnection(host='localhost'), maxsize=4,
+                check=lambda conn: conn.open, loop=loop)
     loop.run_until_complete(run())
     loop.close()
@@ -95,6 +95,13 @@ if __name__ == '__main__':
     import greenio
     import time
     import asyncio
+    from greenio.pool import Pool
+
+    def connect():
+        connection = connector_factory(
+            'pq://postgres@localhost:5432', async=True)()
+        connection.connect()
+        return connection
 
     @asyncio.coroutine
     def sleeper():
@@ -105,11 +112,8 @@ if __name__ == '__main__':
 
     @greenio.task
     def db():
-        connection = connector_factory(
-            'pq://postgres@localhost:5432', async=True)()
-        connection.connect()
-
-        try:
+        # Connections are returned to the pool and reused by the next task
+        with pool.connection() as connection:
             print('>> sleeping')
             st = time.monotonic()
             connection.execute('SELECT pg_sleep(2)')
@@ -119,8 +123,6 @@ if __name__ == '__main__':
 
             ps = connection.prepare('SELECT 42')
             print('"SELECT 42" -> {!r}'.format(ps()))
-        finally:
-            connection.close()
 
     @asyncio.coroutine
     def run():
@@ -129,5 +131,7 @@ if __name__ == '__main__':
 
     asyncio.set_event_loop_policy(greenio.GreenEventLoopPolicy())
     loop = asyncio.get_event_loop()
+    pool = Pool(connect, maxsize=4, check=lambda conn: not conn.closed,
+                loop=loop)
     loop.run_until_complete(run())
     loop.close()
@@ -5,11 +5,17 @@
 
 """greenio package allows to compose greenlets and asyncio coroutines."""
 
-__all__ = ['task', 'yield_from']
+__all__ = ['task', 'yield_from', 'set_fast_path_budget',
+           'GreenletPool', 'get_greenlet_pool', 'run_in_executor',
+           'patch', 'unpatch', 'gather', 'first_completed',
+           'install', 'call_in_loop', 'local']
 
 
 import greenlet
+import heapq
+import operator
 import sys
+import weakref
 
 try:
     import asyncio
@@ -63,61 +69,325 @@ class _LoopGreenlet(greenlet.greenlet):
     its "run_*" methods executed in _LoopGreenlet context"""
 
 
+def _run_task_steps():
+    # Body of "_TaskGreenlet".  It's a plain function, not a method:
+    # what "run" is called with (and "run" itself) stays referenced
+    # until it returns, and a greenlet referencing itself that way is
+    # never freed.  Steps are passed in with "switch" only.
+    work = greenlet.getcurrent().parent.switch(None)
+    while work is not None:
+        step, value, exc = work
+        work = None
+        step(value, exc)
+        # Don't keep the last task alive while we're idle in the pool
+        step = value = exc = None
+        work = greenlet.getcurrent().parent.switch(None)
+
+
 class _TaskGreenlet(greenlet.greenlet):
     """Each task (and its subsequent coroutines) decorated with
-    ``@greenio.task`` is executed in this greenlet"""
+    ``@greenio.task`` is executed in this greenlet.
+
+    The greenlet doesn't finish on its own: after running a task step
+    (switched in as a ``(step, value, exc)`` tuple) it switches back to
+    its parent and waits for the next step, which lets ``GreenletPool``
+    reuse it for another task.  Switching None in finishes it, and so
+    does dropping the last reference to it."""
+
+    task = None
+
+    def __init__(self):
+        super(_TaskGreenlet, self).__init__(_run_task_steps)
+        # Start it, so that it waits for a step
+        self.switch()
+
+    def finish(self):
+        self.parent = greenlet.getcurrent()
+        self.switch(None)
+
+
+DEFAULT_POOL_SIZE = 256
+
+
+class GreenletPool(object):
+    """A bounded stack of idle task greenlets of an event loop.
+
+    Creating a greenlet (and its stack) for every step of every task
+    is expensive when there are lots of short tasks, so ``GreenTask``
+    takes greenlets from the pool and gives them back once a step
+    finishes without a "yield_from" call.  Use ``maxsize=0`` to
+    disable pooling."""
+
+    def __init__(self, maxsize=DEFAULT_POOL_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._idle = []
+
+    def __len__(self):
+        return len(self._idle)
+
+    def acquire(self):
+        if self._idle:
+            self.hits += 1
+            gl = self._idle.pop()
+            # The pooled greenlet might have been created by another
+            # "run_*" call, whose "_LoopGreenlet" is long dead
+            gl.parent = greenlet.getcurrent()
+            return gl
+        self.misses += 1
+        return _TaskGreenlet()
+
+    def release(self, gl):
+        if len(self._idle) < self.maxsize:
+            self._idle.append(gl)
+        else:
+            gl.finish()
+
+    def clear(self):
+        idle = self._idle
+        self._idle = []
+        for gl in idle:
+            gl.finish()
+
+    def stats(self):
+        return {'size': len(self._idle),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses}
+
+
+_greenlet_pools = weakref.WeakKeyDictionary()
+
+
+def get_greenlet_pool(loop=None):
+    """Return the ``GreenletPool`` used by green tasks of the *loop*."""
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    try:
+        return _greenlet_pools[loop]
+    except KeyError:
+        pool = _greenlet_pools[loop] = GreenletPool()
+        return pool
+
+
+class _Timer(object):
+    __slots__ = ('when', 'callback', 'args', 'cancelled', '_timers')
+
+    def __init__(self, when, callback, args, timers):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self._timers = timers
+
+    def __lt__(self, other):
+        return self.when < other.when
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.callback = self.args = None
+            self._timers._timer_cancelled()
+
+
+class _Timers(object):
+    """A heap of timeouts of an event loop.
+
+    All timeouts share a single event loop timer, armed for the
+    earliest of them.  Cancelled timeouts stay in the heap until
+    they're due (or until they make up most of the heap), so arming
+    and cancelling a timeout around every socket operation doesn't
+    involve the event loop at all."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._heap = []
+        self._cancelled = 0
+        self._handle = None
+        self._handle_when = None
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def call_at(self, when, callback, *args):
+        timer = _Timer(when, callback, args, self)
+        heapq.heappush(self._heap, timer)
+        if self._handle is None or when < self._handle_when:
+            self._schedule(when)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self._loop.time() + delay, callback, *args)
+
+    def _schedule(self, when):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle_when = when
+        self._handle = self._loop.call_at(when, self._run)
+
+    def _run(self):
+        self._handle = None
+        now = self._loop.time()
+
+        # Callbacks can cancel other timers, which might rebuild the heap
+        while self._heap and self._heap[0].when <= now:
+            timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                self._cancelled -= 1
+                continue
+            timer.cancelled = True
+            try:
+                timer.callback(*timer.args)
+            except Exception as exc:
+                self._loop.call_exception_handler({
+                    'message': 'Exception in greenio timer callback',
+                    'exception': exc})
+
+        if self._heap:
+            self._schedule(self._heap[0].when)
+
+    def _timer_cancelled(self):
+        self._cancelled += 1
+        if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+            # Too many cancelled timeouts, drop them
+            self._heap = [timer for timer in self._heap if not timer.cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+
+def _get_timers(loop):
+    # Kept on the loop rather than in a WeakKeyDictionary: the timers
+    # (and their armed loop handle) reference the loop, which would
+    # keep it alive forever
+    try:
+        return loop._greenio_timers
+    except AttributeError:
+        timers = loop._greenio_timers = _Timers(loop)
+        return timers
+
+
+def _current_task_switchers(module):
+    """Return the functions that make a task the current one of its
+    event loop (as reported by "Task.current_task") and back, called
+    as ``enter(loop, task)`` and ``leave(loop, task)``.
+
+    A green task stops being current whenever it switches out of its
+    greenlet in the middle of "Task._step", and becomes current again
+    when it's resumed."""
+
+    tasks = getattr(module, 'tasks', None)
+    enter = getattr(tasks, '_enter_task', None)
+    if enter is not None:
+        # Python 3.7+
+        return staticmethod(enter), staticmethod(tasks._leave_task)
+    # Bound methods of the dict itself, without any Python-level calls;
+    # "pop(loop, task)" takes the task as a (never used) default value
+    current_tasks = getattr(module.Task, '_current_tasks', None)
+    if current_tasks is None:
+        # A Task implementation greenio can't drive (e.g. the C one of
+        # Python 3.6); don't break the import, tasks fail in "_step"
+        current_tasks = {}
+    return current_tasks.__setitem__, current_tasks.pop
+
+
+if sys.version_info >= (3,):
+    _exc_traceback = operator.attrgetter('__traceback__')
+else:
+    def _exc_traceback(exc):
+        if hasattr(exc, '__traceback__'):
+            return exc.__traceback__
+        return sys.exc_info()[2]
+
+
+# Collects stats of green tasks, see "greenio.stats"
+_monitor = None
+
+# Greenlets have their own "contextvars" context (greenlet 0.4.17+)
+_GR_CONTEXT = hasattr(greenlet.getcurrent(), 'gr_context')
 
 
 class _GreenTaskMixin(object):
     def __init__(self, *args, **kwargs):
         self._greenlet = None
+        self._green_fast_calls = 0
+        self._green_canceller = None
+        self._green_stats = None
+        # Green-task-local data is inherited from the green task that
+        # creates this one and copied on the first write; see
+        # "greenio.tasklocal"
+        self._green_locals = None
+        self._green_locals_shared = False
+        parent = greenlet.getcurrent()
+        if isinstance(parent, _TaskGreenlet) and parent.task is not None:
+            parent = parent.task
+            if parent._green_locals:
+                self._green_locals = parent._green_locals
+                self._green_locals_shared = parent._green_locals_shared = True
         super(_GreenTaskMixin, self).__init__(*args, **kwargs)
+        self._green_pool = get_greenlet_pool(self._loop)
+
+    def cancel(self):
+        canceller = self._green_canceller
+        if canceller is None or self.done():
+            return super(_GreenTaskMixin, self).cancel()
+
+        # The task is suspended without a future to cancel (see
+        # "_suspend"), so throw CancelledError into it ourselves
+        self._green_canceller = None
+        canceller()
+        self._loop.call_soon(self._step, None, asyncio.CancelledError())
+        return True
 
     def _step(self, value=None, exc=None):
-        if self._greenlet is None:
+        monitor = _monitor
+        if monitor is not None:
+            monitor.step_started(self)
+
+        gl = self._greenlet
+        if gl is None:
             # Means that the task is not currently in a suspended greenlet
             # waiting for results for "yield_from"
-            ovr = super(_GreenTaskMixin, self)._step
-            self._greenlet = _TaskGreenlet(ovr)
+            gl = self._greenlet = self._green_pool.acquire()
 
             # Store a reference to the current task for "yield_from"
-            self._greenlet.task = self
+            gl.task = self
+            if _GR_CONTEXT:
+                # Run in the context of the task (Python 3.7+), not in
+                # whatever context the pooled greenlet was left in
+                gl.gr_context = getattr(self, '_context', None)
 
             # Now invoke overloaded "Task._step" in "_TaskGreenlet"
-            result = self._greenlet.switch(value, exc)
-
-            # If "result" is "_YIELDED" it means that the "yield_from"
-            # method was called
-            if result is not _YIELDED:
-                # And if not - then task jumped out of greenlet without
-                # calling "yield_from"
-                self._greenlet.task = None
-                self._greenlet = None
-            else:
-                self.__class__._current_tasks.pop(self._loop)
+            result = gl.switch((super(_GreenTaskMixin, self)._step, value,
+                                exc))
         else:
             # The task is in the greenlet, that means that we have a result
             # for the "yield_from"
 
-            self.__class__._current_tasks[self._loop] = self
+            self._green_enter_task(self._loop, self)
+            gl.parent = greenlet.getcurrent()
 
             if exc is not None:
-                if hasattr(exc, '__traceback__'):
-                    tb = exc.__traceback__
-                else:
-                    tb = sys.exc_info()[2]
-                result = self._greenlet.throw(
-                    type(exc), exc, tb)
+                result = gl.throw(type(exc), exc, _exc_traceback(exc))
             else:
-                result = self._greenlet.switch(value)
+                result = gl.switch(value)
+
+        # If "result" is "_YIELDED" it means that the "yield_from"
+        # method was called
+        if result is not _YIELDED:
+            # And if not - then task jumped out of greenlet without
+            # calling "yield_from", so the greenlet is free again
+            gl.task = None
+            self._green_pool.release(gl)
+            self._greenlet = gl = None
+        else:
+            # "Task._step" is not finished yet, but the task is not
+            # running anymore
+            self._green_leave_task(self._loop, self)
 
-            # Again, if "result" is "_YIELDED" then we just called "yield_from"
-            # again
-            if result is not _YIELDED:
-                self._greenlet.task = None
-                self._greenlet = None
-            else:
-                self.__class__._current_tasks.pop(self._loop)
+        if monitor is not None:
+            monitor.step_finished(self, gl)
 
 
 class _GreenLoopMixin(object):
@@ -134,7 +404,7 @@ class _GreenLoopMixin(object):
 
 
 class GreenTask(_GreenTaskMixin, asyncio.Task):
-    pass
+    _green_enter_task, _green_leave_task = _current_task_switchers(asyncio)
 
 
 class GreenUnixSelectorLoop(_GreenLoopMixin, asyncio.SelectorEventLoop):
@@ -143,14 +413,67 @@ class GreenUnixSelectorLoop(_GreenLoopMixin, asyncio.SelectorEventLoop):
 
 
 class GreenEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    """Event loop policy creating green event loops.
+
+    If *loop_factory* is given (e.g. ``uvloop.new_event_loop``), the
+    loops it creates are made green with ``install``."""
+
+    def __init__(self, loop_factory=None):
+        super(GreenEventLoopPolicy, self).__init__()
+        self._loop_factory = loop_factory
+
     def new_event_loop(self):
+        if self._loop_factory is not None:
+            return install(self._loop_factory())
         return GreenUnixSelectorLoop()
 
 
+def _green_task_factory(loop, coro, **kwargs):
+    if trollius is not None and trollius is not asyncio and \
+            isinstance(loop, trollius.AbstractEventLoop):
+        return GreenTrolliusTask(coro, loop=loop, **kwargs)
+    return GreenTask(coro, loop=loop, **kwargs)
+
+
+def _green_run_method(method):
+    def run(*args, **kwargs):
+        return _LoopGreenlet(method).switch(*args, **kwargs)
+
+    run.__name__ = method.__name__
+    run.__doc__ = method.__doc__
+    return run
+
+
+def install(loop):
+    """Make an event loop of any class (uvloop, a custom loop...) run
+    green tasks, and return it.
+
+    ``run_until_complete`` and ``run_forever`` of the *loop* are
+    wrapped to run the loop in a greenlet, like ``_GreenLoopMixin``
+    does, and a task factory creating green tasks is installed with
+    ``loop.set_task_factory``."""
+
+    if _is_green_loop(loop):
+        return loop
+    if loop.get_task_factory() is not None:
+        raise RuntimeError('the event loop has a task factory already')
+    loop.set_task_factory(_green_task_factory)
+    loop.run_until_complete = _green_run_method(loop.run_until_complete)
+    loop.run_forever = _green_run_method(loop.run_forever)
+    loop._greenio_installed = True
+    return loop
+
+
+def _is_green_loop(loop):
+    return (isinstance(loop, _GreenLoopMixin) or
+            getattr(loop, '_greenio_installed', False))
+
+
 if trollius is not None:
     if trollius is not asyncio:
         class GreenTrolliusTask(_GreenTaskMixin, trollius.Task):
-            pass
+            _green_enter_task, _green_leave_task = \
+                _current_task_switchers(trollius)
 
         class GreenTrolliusUnixSelectorLoop(_GreenLoopMixin,
                                             trollius.SelectorEventLoop):
@@ -167,10 +490,25 @@ if trollius is not None:
         GreenTrolliusEventLoopPolicy = GreenEventLoopPolicy
 
 
-def yield_from(future, loop=None):
-    """A function to use instead of ``yield from`` statement."""
+_fast_path_budget = None
 
-    future = _async(future, loop)
+
+def set_fast_path_budget(budget):
+    """Make a task yield to the event loop on every *budget*-th
+    consecutive ``yield_from`` call on an already completed future.
+
+    By default (``None``) such calls always return synchronously,
+    which can starve other tasks if a task keeps getting completed
+    futures."""
+
+    global _fast_path_budget
+    if budget is not None and budget < 1:
+        raise ValueError('budget must be a positive integer or None')
+    _fast_path_budget = budget
+
+
+def _task_greenlet():
+    """Return the greenlet of the green task we're running in."""
 
     gl = greenlet.getcurrent()
 
@@ -178,7 +516,7 @@ def yield_from(future, loop=None):
         if not isinstance(gl.parent, _LoopGreenlet):
             raise RuntimeError(
                 '"greenio.yield_from" requires GreenEventLoopPolicy '
-                'or compatible')
+                'or a loop set up with "greenio.install"')
             # or something went horribly wrong...
 
         if not isinstance(gl, _TaskGreenlet):
@@ -187,6 +525,49 @@ def yield_from(future, loop=None):
                 '"greenio.task" or a subsequent coroutine')
             # ...ditto
 
+    return gl
+
+
+def _suspend(gl, canceller=None):
+    """Switch out of the task greenlet *gl* until its task is woken
+    up with ``_resume``.
+
+    Unlike "yield_from" there is no future to wait for.  *canceller*
+    is called if the task is cancelled meanwhile (or already), and
+    must make sure that ``_resume`` won't be called."""
+
+    task = gl.task
+    if task._must_cancel:
+        task._must_cancel = False
+        if canceller is not None:
+            canceller()
+        raise asyncio.CancelledError()
+    task._green_canceller = canceller
+    return gl.parent.switch(_YIELDED)
+
+
+def _resume(task, value=None, exc=None):
+    """Wake up *task* suspended with ``_suspend``: return *value*
+    from it, or raise *exc* in it."""
+
+    task._green_canceller = None
+    task._step(value, exc)
+
+
+def _wake(task, value=None, exc=None):
+    """Schedule ``_resume`` of *task*.  The task can't be cancelled
+    from this point until it's resumed."""
+
+    task._green_canceller = None
+    task._loop.call_soon(_resume, task, value, exc)
+
+
+def yield_from(future, loop=None):
+    """A function to use instead of ``yield from`` statement."""
+
+    future = _async(future, loop)
+
+    gl = _task_greenlet()
     task = gl.task
 
     if not isinstance(future, _FUTURE_CLASSES):
@@ -194,6 +575,16 @@ def yield_from(future, loop=None):
             'greenlet.yield_from was supposed to receive only Futures, '
             'got {!r} in task {!r}'.format(future, task))
 
+    # The future is resolved already, so there is no need to wait for the
+    # event loop to call "_wakeup" (unless the task is being cancelled)
+    if future.done() and not task._must_cancel:
+        if _fast_path_budget is None:
+            return future.result()
+        task._green_fast_calls += 1
+        if task._green_fast_calls < _fast_path_budget:
+            return future.result()
+    task._green_fast_calls = 0
+
     # "_wakeup" will call the "_step" method (which we overloaded in
     # GreenTask, and therefore wakeup the awaiting greenlet)
     future.add_done_callback(task._wakeup)
@@ -221,5 +612,20 @@ def task(func, loop=None):
     return task_wrapper
 
 
+def _call_boxed(func, *args):
+    """Call ``func(*args)`` in a task and return its result in a 1-tuple,
+    so that a generator or a future it returns isn't run or awaited
+    by the task as a coroutine."""
+
+    return (func(*args),)
+
+
 class _YIELDED(object):
     """Marker, don't use it"""
+
+
+from .executor import run_in_executor
+from .monkey import patch, unpatch
+from .fanout import gather, map, first_completed
+from .mailbox import call_in_loop
+from .tasklocal import local
@@ -0,0 +1,186 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Run blocking calls from green tasks in thread or process pools.
+
+Blocking code that ``greenio.socket`` can't help with (file I/O,
+CPU-bound parsing, C drivers) stalls all tasks of the event loop.
+``run_in_executor`` moves such calls out of the loop thread and
+suspends only the calling task::
+
+    @greenio.task
+    def handler():
+        data = greenio.run_in_executor(parse, payload)
+
+Each event loop has an ``Executor``, see ``get_executor`` and
+``set_executor``.
+"""
+from __future__ import absolute_import
+import concurrent.futures
+import functools
+import weakref
+
+from greenio import asyncio
+
+from . import _task_greenlet, _suspend, _resume
+from .locks import _Waiter, _Waiters
+
+
+__all__ = ['Executor', 'get_executor', 'set_executor', 'run_in_executor']
+
+
+DEFAULT_MAX_WORKERS = 5
+
+
+class Executor(object):
+    """Runs calls of green tasks in a ``concurrent.futures`` *executor*
+    (a thread pool of *max_workers* threads by default).
+
+    At most *limit* calls are submitted to the executor at a time
+    (None means no limit); tasks calling ``run`` beyond that wait for
+    their turn in FIFO order.  The submitted calls keep their slots
+    until they actually finish, even if the calling task is cancelled
+    meanwhile."""
+
+    def __init__(self, executor=None, max_workers=None, limit=None,
+                 loop=None):
+        if limit is not None and limit < 1:
+            raise ValueError('limit must be a positive integer or None')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        # The executor is cached per loop in a WeakKeyDictionary, so
+        # it must not keep the loop alive
+        self._loop_ref = weakref.ref(loop)
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers or DEFAULT_MAX_WORKERS)
+        self.executor = executor
+        self.limit = limit
+
+        self._running = 0
+        # No loop, which the executor must not keep alive; there are no
+        # timeouts to schedule
+        self._waiters = _Waiters()
+
+        self.submitted = 0
+        self.completed = 0
+        self.max_queued = 0
+
+    def stats(self):
+        """Return the numbers of running and queued calls, and the
+        largest queue length so far."""
+
+        return {'running': self._running,
+                'queued': len(self._waiters),
+                'max_queued': self.max_queued,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'limit': self.limit}
+
+    def _wait_turn(self):
+        queued = len(self._waiters) + 1
+        if queued > self.max_queued:
+            self.max_queued = queued
+        self._waiters.wait()
+
+    def _release(self):
+        # Hand the slot over to the next task in line, if any
+        if self._waiters.wake() is None:
+            self._running -= 1
+
+    def _call_finished(self, waiter, cfut):
+        # Called in a worker thread (or right away, if "cfut" is done)
+        loop = self._loop_ref()
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._finish, waiter, cfut)
+        except RuntimeError:
+            # The event loop is closed
+            pass
+
+    def _finish(self, waiter, cfut):
+        self.completed += 1
+        self._release()
+        if waiter.pending:
+            waiter.pending = False
+            if cfut.cancelled():
+                # The executor was shut down
+                _resume(waiter.task, None, asyncio.CancelledError())
+                return
+            exc = cfut.exception()
+            if exc is None:
+                _resume(waiter.task, cfut.result())
+            else:
+                _resume(waiter.task, None, exc)
+
+    def run(self, func, *args):
+        """Call ``func(*args)`` in the executor and return its result;
+        must be called from a green task."""
+
+        gl = _task_greenlet()
+        if self.limit is not None and self._running >= self.limit:
+            # "_release" passes its slot to us
+            self._wait_turn()
+        else:
+            self._running += 1
+
+        try:
+            cfut = self.executor.submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        self.submitted += 1
+
+        waiter = _Waiter(gl.task, None)
+        cfut.add_done_callback(
+            functools.partial(self._call_finished, waiter))
+
+        def cancel():
+            waiter.pending = False
+            cfut.cancel()
+
+        return _suspend(gl, cancel)
+
+    def close(self, wait=True):
+        """Shut down the executor, if it was created by us."""
+
+        if self._own_executor:
+            self.executor.shutdown(wait)
+
+
+_executors = weakref.WeakKeyDictionary()
+
+
+def get_executor(loop=None):
+    """Return the ``Executor`` used by ``run_in_executor`` in green
+    tasks of the *loop*."""
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    try:
+        return _executors[loop]
+    except KeyError:
+        executor = _executors[loop] = Executor(loop=loop)
+        return executor
+
+
+def set_executor(executor, loop=None):
+    """Make *executor* (an ``Executor``, or a ``concurrent.futures``
+    executor to wrap in one) the executor of the *loop*."""
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    if not isinstance(executor, Executor):
+        executor = Executor(executor, loop=loop)
+    _executors[loop] = executor
+
+
+def run_in_executor(func, *args):
+    """Call ``func(*args)`` in the executor of the current event loop
+    and return its result, suspending only the calling green task."""
+
+    task = _task_greenlet().task
+    return get_executor(task._loop).run(func, *args)
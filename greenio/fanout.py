@@ -0,0 +1,196 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Run plain callables concurrently from a green task.
+
+Each callable runs in a child green task (so it can use ``yield_from``
+and green sockets), and the calling task waits for them without
+futures or ``asyncio.wait``::
+
+    @greenio.task
+    def handler(ids):
+        user, orders = greenio.gather(lambda: get_user(uid),
+                                      lambda: get_orders(uid))
+        for row in greenio.map(fetch, ids, concurrency=10):
+            ...
+
+If a child fails, or the calling task is cancelled, the children still
+running are cancelled and the error is raised in the calling task.
+"""
+from __future__ import absolute_import
+import collections
+
+from greenio import asyncio
+
+from . import task, _task_greenlet, _suspend, _resume, _call_boxed
+
+
+# "map" is left out not to shadow the builtin on "import *"; use
+# "greenio.map"
+__all__ = ['gather', 'first_completed']
+
+
+class _Children(object):
+    """Child tasks of a green task, reported as they finish."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self.running = set()
+        self.done = collections.deque()
+        self.closed = False
+        self._waiter = None
+
+    def spawn(self, func, *args):
+        # Results of the children are unpacked with "_result"
+        child = task(_call_boxed, loop=self._loop)(func, *args)
+        self.running.add(child)
+        child.add_done_callback(self._child_done)
+        return child
+
+    def _child_done(self, child):
+        self.running.discard(child)
+        if self.closed:
+            # Errors of the other children are dropped once one of them
+            # was raised in the parent
+            if not child.cancelled():
+                child.exception()
+            return
+        self.done.append(child)
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            _resume(waiter)
+
+    def next_done(self):
+        """Return the next finished child, waiting for it if needed."""
+
+        if not self.done:
+            gl = _task_greenlet()
+            self._waiter = gl.task
+
+            def cancel():
+                self._waiter = None
+
+            _suspend(gl, cancel)
+        return self.done.popleft()
+
+    def close(self):
+        """Cancel the children that are still running."""
+
+        self.closed = True
+        self._waiter = None
+        for child in self.done:
+            if not child.cancelled():
+                child.exception()
+        self.done.clear()
+        for child in list(self.running):
+            child.cancel()
+
+
+def _result(child):
+    return child.result()[0]
+
+
+def _children():
+    return _Children(_task_greenlet().task._loop)
+
+
+def gather(*funcs, **kwargs):
+    """Call *funcs* in child tasks and return the list of their results.
+
+    The first error of a child is raised, unless *return_exceptions* is
+    set, in which case exceptions are returned in place of results."""
+
+    return_exceptions = kwargs.pop('return_exceptions', False)
+    if kwargs:
+        raise TypeError('unexpected keyword arguments: {}'.format(
+            ', '.join(kwargs)))
+
+    children = _children()
+    tasks = [children.spawn(func) for func in funcs]
+    try:
+        for i in range(len(tasks)):
+            child = children.next_done()
+            if not return_exceptions:
+                # Raises if the child failed or was cancelled
+                _result(child)
+    finally:
+        children.close()
+
+    results = []
+    for child in tasks:
+        if child.cancelled():
+            results.append(asyncio.CancelledError())
+        elif child.exception() is not None:
+            results.append(child.exception())
+        else:
+            results.append(_result(child))
+    return results
+
+
+def map(func, iterable, concurrency=None, ordered=True):
+    """Call *func* for every item of *iterable* in child tasks, and
+    yield the results as the children finish.
+
+    At most *concurrency* children run at once (None means no limit),
+    and items are taken from *iterable* only when a child can start.
+    If *ordered* is set, results are yielded in the order of the
+    items, otherwise in the order the children finish."""
+
+    if concurrency is not None and concurrency < 1:
+        raise ValueError('concurrency must be a positive integer or None')
+    return _map(func, iterable, concurrency, ordered)
+
+
+def _map(func, iterable, concurrency, ordered):
+    children = _children()
+    items = iter(iterable)
+    exhausted = False
+    positions = {}
+    started = 0
+    # Results that finished before the results of earlier items
+    finished = {}
+    next_position = 0
+    try:
+        while True:
+            while not exhausted and (concurrency is None or
+                                     len(children.running) < concurrency):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    positions[children.spawn(func, item)] = started
+                    started += 1
+
+            if not positions:
+                break
+            child = children.next_done()
+            position = positions.pop(child)
+            result = _result(child)
+            if not ordered:
+                yield result
+                continue
+            finished[position] = result
+            while next_position in finished:
+                yield finished.pop(next_position)
+                next_position += 1
+    finally:
+        children.close()
+
+
+def first_completed(*funcs):
+    """Call *funcs* in child tasks and return the result of the first
+    one to finish (or raise its error); the others are cancelled."""
+
+    if not funcs:
+        raise ValueError('no functions given')
+    children = _children()
+    for func in funcs:
+        children.spawn(func)
+    try:
+        child = children.next_done()
+    finally:
+        children.close()
+    return _result(child)
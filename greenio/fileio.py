@@ -0,0 +1,439 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Green file I/O for regular files and pipes.
+
+``open`` returns file objects with the API of the ``makefile``
+objects of ``greenio.socket``, and must be used in green tasks::
+
+    @greenio.task
+    def tail(path):
+        with greenio.fileio.open(path, 'rb') as f:
+            for line in iter(f.readline, b''):
+                ...
+
+Pipes, FIFOs and terminals are non-blocking and wait for readiness
+in the event loop.  Regular files are always "ready" as far as the
+event loop is concerned, so they are read and written in the thread
+pool of ``greenio.executor``, in large chunks aligned to ``CHUNK_SIZE``
+to make few round trips to it.  Files of ``MMAP_THRESHOLD`` bytes and
+more are memory-mapped: their pages are faulted in by the thread
+pool, and ``readexactly`` and ``peek`` return views of the mapping
+without copying.
+"""
+from __future__ import absolute_import
+import errno
+import mmap
+import os
+import stat
+
+from greenio import asyncio
+
+from . import _task_greenlet
+from .executor import get_executor
+from .socket import ReadFile, WriteFile, _wait_fd, _TRY_AGAIN, _tobytes
+
+
+__all__ = ['open', 'PipeReader', 'PipeWriter', 'FileReader', 'FileWriter',
+           'MappedFile']
+
+
+# Regular files are read in multiples of this size, at offsets aligned
+# to it
+CHUNK_SIZE = 1024 * 1024
+
+# Regular files of this size and larger are memory-mapped for reading
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# Bytes read from pipes at once
+PIPE_BUFFER_SIZE = 65536
+
+_PAGE_SIZE = mmap.PAGESIZE
+
+
+class _FileMixin(object):
+    """Ownership of the file descriptor of a green file object."""
+
+    def _init_fd(self, fd, closefd):
+        self._fd = fd
+        self._closefd = closefd
+        self.closed = False
+
+    def fileno(self):
+        return self._fd
+
+    def _close_fd(self):
+        if not self.closed:
+            self.closed = True
+            if self._closefd:
+                os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _run_in_executor(loop, func, *args):
+    return get_executor(loop).run(func, *args)
+
+
+if hasattr(os, 'pread'):
+    _pread = os.pread
+else:
+    # Python 2: each file has only one read in flight at a time
+    def _pread(fd, size, offset):
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+
+def _write_all(fd, buffers):
+    # Called in a worker thread
+    if hasattr(os, 'writev'):
+        while buffers:
+            sent = os.writev(fd, buffers)
+            while sent:
+                size = len(buffers[0])
+                if sent < size:
+                    buffers[0] = memoryview(buffers[0])[sent:]
+                    break
+                buffers.pop(0)
+                sent -= size
+    else:
+        data = memoryview(b''.join(buffers))
+        while data:
+            data = data[os.write(fd, data):]
+
+
+class PipeReader(_FileMixin, ReadFile):
+    """Reader for the read end of a pipe, a FIFO or a terminal; the
+    file descriptor *fd* is made non-blocking."""
+
+    def __init__(self, loop, fd, bufsize=PIPE_BUFFER_SIZE, exact=True,
+                 closefd=True):
+        ReadFile.__init__(self, loop, None, bufsize, exact)
+        self._init_fd(fd, closefd)
+        _set_nonblocking(fd)
+
+    def _recv(self, size=0):
+        self.recv_calls += 1
+        self.last_recv_calls += 1
+        size = max(size, self._bufsize)
+        while True:
+            try:
+                data = os.read(self._fd, size)
+                break
+            except OSError as exc:
+                if exc.errno not in _TRY_AGAIN:
+                    raise
+            _wait_fd(self._loop, self._fd, self._loop.add_reader,
+                     self._loop.remove_reader, None)
+        if data:
+            self._chunks.append(data)
+            self._size += len(data)
+        else:
+            self._eof = True
+        return len(data)
+
+    def read(self, size=-1):
+        if size < 0:
+            return _read_all(self)
+        return ReadFile.read(self, size)
+
+    def close(self):
+        self._close_fd()
+
+
+class FileReader(_FileMixin, ReadFile):
+    """Reader for regular files, reading in the thread pool.
+
+    Every read from the file is of at least *bufsize* bytes and ends
+    at a multiple of ``CHUNK_SIZE``."""
+
+    def __init__(self, loop, fd, bufsize=CHUNK_SIZE, exact=True,
+                 closefd=True):
+        ReadFile.__init__(self, loop, None, bufsize, exact)
+        self._init_fd(fd, closefd)
+        self._offset = os.lseek(fd, 0, os.SEEK_CUR)
+
+    def _recv(self, size=0):
+        self.recv_calls += 1
+        self.last_recv_calls += 1
+        end = self._offset + max(size, self._bufsize)
+        end += -end % CHUNK_SIZE
+        data = _run_in_executor(self._loop, _pread, self._fd,
+                                end - self._offset, self._offset)
+        if data:
+            self._offset += len(data)
+            self._chunks.append(data)
+            self._size += len(data)
+        else:
+            self._eof = True
+        return len(data)
+
+    def read(self, size=-1):
+        if size < 0:
+            return _read_all(self)
+        return ReadFile.read(self, size)
+
+    def tell(self):
+        return self._offset - self._size
+
+    def close(self):
+        self._close_fd()
+
+
+def _read_all(reader):
+    chunks = []
+    while True:
+        data = reader.read(max(reader._bufsize, reader._size))
+        if not data:
+            return b''.join(chunks)
+        chunks.append(data)
+
+
+def _prefault(buf, start, end):
+    # Called in a worker thread: touch a byte of every page, so that
+    # reading the range later doesn't block the event loop on page
+    # faults
+    buf[start:end:_PAGE_SIZE]
+
+
+class MappedFile(_FileMixin):
+    """Reader for a memory-mapped regular file.
+
+    Pages are faulted in by the thread pool at least ``CHUNK_SIZE``
+    bytes ahead of the reads.  ``readexactly`` and ``peek`` return
+    memoryviews of the mapping, which must be released before the
+    file is closed to unmap it right away."""
+
+    def __init__(self, loop, fd, closefd=True):
+        self._loop = loop
+        self._init_fd(fd, closefd)
+        self._size = os.fstat(fd).st_size
+        self._mmap = mmap.mmap(fd, self._size, access=mmap.ACCESS_READ)
+        self._pos = os.lseek(fd, 0, os.SEEK_CUR)
+        # Pages up to this offset were faulted in
+        self._faulted = self._pos - self._pos % _PAGE_SIZE
+        self.reads = 0
+        self.prefaults = 0
+
+    def _available(self, size):
+        # Make up to *size* bytes at the current position readable
+        # without blocking, and return how many there are
+        end = min(self._pos + size, self._size)
+        if end > self._faulted:
+            stop = min(max(end, self._faulted + CHUNK_SIZE), self._size)
+            stop += -stop % _PAGE_SIZE
+            self.prefaults += 1
+            _run_in_executor(self._loop, _prefault, self._mmap,
+                             self._faulted, stop)
+            self._faulted = stop
+        return max(end - self._pos, 0)
+
+    def _take(self, size):
+        pos = self._pos
+        self._pos += size
+        return memoryview(self._mmap)[pos:pos + size]
+
+    def read(self, size=-1):
+        self.reads += 1
+        if size < 0:
+            size = self._size
+        return _tobytes(self._take(self._available(size)))
+
+    def readinto(self, buf):
+        self.reads += 1
+        size = self._available(len(buf))
+        memoryview(buf)[:size] = self._take(size)
+        return size
+
+    def readline(self, limit=-1):
+        self.reads += 1
+        end = self._size if limit < 0 else min(self._pos + limit, self._size)
+        start = self._pos
+        while True:
+            stop = min(self._faulted, end)
+            idx = self._mmap.find(b'\n', start, stop)
+            if idx >= 0:
+                stop = idx + 1
+                break
+            if stop == end:
+                break
+            start = stop
+            self._available(stop - self._pos + CHUNK_SIZE)
+        return _tobytes(self._take(stop - self._pos))
+
+    def readexactly(self, size):
+        """Read exactly *size* bytes and return them as a memoryview of
+        the mapping.
+
+        Raises ``asyncio.IncompleteReadError`` if EOF is reached
+        first."""
+
+        self.reads += 1
+        available = self._available(size)
+        if available < size:
+            partial = _tobytes(self._take(available))
+            raise asyncio.IncompleteReadError(partial, size)
+        return self._take(size)
+
+    def peek(self, size=0):
+        """Return a memoryview of the mapping at the current position,
+        without consuming it."""
+
+        self.reads += 1
+        size = self._available(max(size, 1))
+        end = max(self._pos + size, min(self._faulted, self._size))
+        return memoryview(self._mmap)[self._pos:end]
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views of the mapping are still alive; it's unmapped when
+            # they're released
+            pass
+        self._close_fd()
+
+
+class PipeWriter(_FileMixin, WriteFile):
+    """Writer for the write end of a pipe or a FIFO; the file
+    descriptor *fd* is made non-blocking.
+
+    Writes are queued until *bufsize* bytes are pending or ``flush``
+    is called, like with the ``WriteFile`` of sockets."""
+
+    def __init__(self, loop, fd, bufsize=0, closefd=True):
+        WriteFile.__init__(self, loop, None, bufsize)
+        self._init_fd(fd, closefd)
+        _set_nonblocking(fd)
+
+    def flush(self):
+        if not self._pending:
+            return
+        data = memoryview(b''.join(self._pending))
+        self._pending = []
+        self._pending_size = 0
+        while data:
+            try:
+                data = data[os.write(self._fd, data):]
+            except OSError as exc:
+                if exc.errno not in _TRY_AGAIN:
+                    raise
+                _wait_fd(self._loop, self._fd, self._loop.add_writer,
+                         self._loop.remove_writer, None)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.flush()
+            finally:
+                self._close_fd()
+
+
+class FileWriter(_FileMixin, WriteFile):
+    """Writer for regular files, writing in the thread pool.
+
+    Writes are queued until *bufsize* bytes are pending or ``flush``
+    is called, and are written with one ``os.writev`` call."""
+
+    def __init__(self, loop, fd, bufsize=CHUNK_SIZE, closefd=True):
+        WriteFile.__init__(self, loop, None, bufsize)
+        self._init_fd(fd, closefd)
+
+    def flush(self):
+        if not self._pending:
+            return
+        buffers = self._pending
+        self._pending = []
+        self._pending_size = 0
+        _run_in_executor(self._loop, _write_all, self._fd, buffers)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self.flush()
+            finally:
+                self._close_fd()
+
+
+def _set_nonblocking(fd):
+    try:
+        import fcntl
+    except ImportError:
+        return
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+_OPEN_FLAGS = {
+    'rb': os.O_RDONLY,
+    'wb': os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+    'ab': os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+}
+
+
+def open(file, mode='rb', buffering=-1, closefd=True):
+    """Open *file* (a path or a file descriptor) for green I/O.
+
+    Only the binary modes 'rb', 'wb' and 'ab' are supported.
+    *buffering* is the read chunk size for readers, and the number of
+    bytes writers queue before writing (0 writes right away); -1
+    picks a default for the kind of the file.  Must be called from a
+    green task."""
+
+    if mode not in _OPEN_FLAGS:
+        raise ValueError('invalid mode: {!r}'.format(mode))
+    loop = _task_greenlet().task._loop
+
+    if isinstance(file, int):
+        fd = file
+    else:
+        # Opening a FIFO blocks until the other side opens it, unless
+        # it's done in non-blocking mode; for regular files the flag
+        # makes no difference
+        flags = _OPEN_FLAGS[mode]
+        try:
+            fd = _run_in_executor(loop, os.open, file,
+                                  flags | getattr(os, 'O_NONBLOCK', 0), 0o666)
+        except OSError as exc:
+            if exc.errno != errno.ENXIO:
+                raise
+            # A FIFO without readers: wait for one in the thread pool
+            fd = _run_in_executor(loop, os.open, file, flags, 0o666)
+        closefd = True
+
+    try:
+        st_mode = os.fstat(fd).st_mode
+        if (stat.S_ISFIFO(st_mode) and mode == 'rb' and
+                not isinstance(file, int)):
+            # Reads return EOF until the first writer opens the FIFO, so
+            # wait for one in the thread pool, like a blocking open does
+            fifo_fd = fd
+            fd = _run_in_executor(loop, os.open, file, os.O_RDONLY)
+            os.close(fifo_fd)
+        regular = stat.S_ISREG(st_mode)
+        if mode == 'rb':
+            if not regular:
+                bufsize = buffering if buffering > 0 else PIPE_BUFFER_SIZE
+                return PipeReader(loop, fd, bufsize, closefd=closefd)
+            if buffering < 0 and os.fstat(fd).st_size >= MMAP_THRESHOLD:
+                return MappedFile(loop, fd, closefd=closefd)
+            bufsize = buffering if buffering > 0 else CHUNK_SIZE
+            return FileReader(loop, fd, bufsize, closefd=closefd)
+        if not regular:
+            return PipeWriter(loop, fd, max(buffering, 0), closefd=closefd)
+        bufsize = buffering if buffering >= 0 else CHUNK_SIZE
+        return FileWriter(loop, fd, bufsize, closefd=closefd)
+    except BaseException:
+        if closefd:
+            os.close(fd)
+        raise
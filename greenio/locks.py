@@ -0,0 +1,307 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Synchronization primitives for green tasks.
+
+Unlike the asyncio ones, these block the calling task greenlet
+directly, without ``yield_from`` and without a future per wait, and
+follow the ``threading`` API::
+
+    lock = Lock()
+
+    @greenio.task
+    def worker():
+        with lock:
+            ...
+
+Waiting tasks are served in FIFO order: a released lock (or
+semaphore slot) is handed over to the first waiting task directly,
+so a task that keeps re-acquiring a lock can't starve the others.
+All blocking methods must be called from a green task.
+"""
+from __future__ import absolute_import
+import collections
+
+from greenio import asyncio
+
+from . import _task_greenlet, _suspend, _resume, _wake, _get_timers
+
+
+__all__ = ['Lock', 'Semaphore', 'BoundedSemaphore', 'Event', 'Condition']
+
+
+class _Waiter(object):
+    __slots__ = ('task', 'value', 'pending')
+
+    def __init__(self, task, value):
+        self.task = task
+        self.value = value
+        self.pending = True
+
+
+class _Waiters(object):
+    """A FIFO queue of green tasks waiting for something.
+
+    Shared by the primitives of this module, ``greenio.queues``,
+    ``greenio.pool`` and ``greenio.executor``."""
+
+    def __init__(self, loop=None):
+        self._loop = loop
+        self._waiters = collections.deque()
+
+    def __len__(self):
+        return len(self._waiters)
+
+    def _expire(self, waiter):
+        if waiter.pending:
+            waiter.pending = False
+            self._waiters.remove(waiter)
+            _resume(waiter.task, None, asyncio.TimeoutError())
+
+    def wait(self, timeout=None, value=None):
+        """Suspend the current task until it's woken up by ``wake``;
+        *value* is kept in the waiter for the waking side.  Raises
+        ``asyncio.TimeoutError`` after *timeout* seconds."""
+
+        gl = _task_greenlet()
+        waiter = _Waiter(gl.task, value)
+        self._waiters.append(waiter)
+        handle = None
+        if timeout is not None:
+            handle = _get_timers(waiter.task._loop).call_later(
+                timeout, self._expire, waiter)
+
+        def cancel():
+            waiter.pending = False
+            self._waiters.remove(waiter)
+
+        try:
+            return _suspend(gl, cancel)
+        finally:
+            if handle is not None:
+                handle.cancel()
+
+    def wake(self, value=None, exc=None):
+        """Wake up the first waiting task, making its ``wait`` return
+        *value* (or raise *exc*).  Return the waiter, or None if
+        there's none."""
+
+        if not self._waiters:
+            return None
+        waiter = self._waiters.popleft()
+        waiter.pending = False
+        _wake(waiter.task, value, exc)
+        return waiter
+
+    def wake_all(self, value=None):
+        while self._waiters:
+            self.wake(value)
+
+
+class Lock(object):
+    """A mutex lock for green tasks."""
+
+    def __init__(self, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._locked = False
+        self._waiters = _Waiters(loop)
+
+    def __repr__(self):
+        return '<{} [{}, waiters:{}]>'.format(
+            self.__class__.__name__,
+            'locked' if self._locked else 'unlocked', len(self._waiters))
+
+    def locked(self):
+        return self._locked
+
+    def acquire(self, blocking=True, timeout=None):
+        """Acquire the lock, waiting for up to *timeout* seconds if
+        *blocking*; return True on success."""
+
+        if not self._locked:
+            self._locked = True
+            return True
+        if not blocking:
+            return False
+        try:
+            # The lock stays locked, "release" passes it to us
+            self._waiters.wait(timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def release(self):
+        if not self._locked:
+            raise RuntimeError('Lock is not acquired.')
+        if self._waiters.wake() is None:
+            self._locked = False
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Semaphore(object):
+    """A semaphore for green tasks, with an initial *value*."""
+
+    def __init__(self, value=1, loop=None):
+        if value < 0:
+            raise ValueError('Semaphore initial value must be >= 0')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._value = value
+        self._waiters = _Waiters(loop)
+
+    def __repr__(self):
+        return '<{} [value:{}, waiters:{}]>'.format(
+            self.__class__.__name__, self._value, len(self._waiters))
+
+    def locked(self):
+        return self._value == 0
+
+    def acquire(self, blocking=True, timeout=None):
+        if self._value > 0:
+            self._value -= 1
+            return True
+        if not blocking:
+            return False
+        try:
+            self._waiters.wait(timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def release(self):
+        if self._waiters.wake() is None:
+            self._value += 1
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class BoundedSemaphore(Semaphore):
+    """A semaphore that can't be released more times than acquired."""
+
+    def __init__(self, value=1, loop=None):
+        self._bound_value = value
+        super(BoundedSemaphore, self).__init__(value, loop=loop)
+
+    def release(self):
+        if self._value >= self._bound_value:
+            raise ValueError('BoundedSemaphore released too many times')
+        super(BoundedSemaphore, self).release()
+
+
+class Event(object):
+    """An event for green tasks, see ``threading.Event``."""
+
+    def __init__(self, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._value = False
+        self._waiters = _Waiters(loop)
+
+    def is_set(self):
+        return self._value
+
+    def set(self):
+        if not self._value:
+            self._value = True
+            self._waiters.wake_all()
+
+    def clear(self):
+        self._value = False
+
+    def wait(self, timeout=None):
+        """Wait until the event is set; return False on timeout."""
+
+        if self._value:
+            return True
+        try:
+            self._waiters.wait(timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class Condition(object):
+    """A condition variable for green tasks, see
+    ``threading.Condition``."""
+
+    def __init__(self, lock=None, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        if lock is None:
+            lock = Lock(loop=loop)
+        self._lock = lock
+        self._waiters = _Waiters(loop)
+
+        self.locked = lock.locked
+        self.acquire = lock.acquire
+        self.release = lock.release
+
+    def __enter__(self):
+        self._lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+    def wait(self, timeout=None):
+        """Release the lock and wait until notified (or for up to
+        *timeout* seconds, then return False), and re-acquire the
+        lock."""
+
+        if not self._lock.locked():
+            raise RuntimeError('cannot wait on un-acquired lock')
+
+        self._lock.release()
+        try:
+            try:
+                self._waiters.wait(timeout)
+            except asyncio.TimeoutError:
+                return False
+            return True
+        finally:
+            # The lock must be re-acquired even if we're cancelled
+            cancelled = False
+            while True:
+                try:
+                    self._lock.acquire()
+                    break
+                except asyncio.CancelledError:
+                    cancelled = True
+            if cancelled:
+                raise asyncio.CancelledError()
+
+    def wait_for(self, predicate, timeout=None):
+        """Wait until *predicate()* is true; return its last value."""
+
+        deadline = None
+        if timeout is not None:
+            deadline = self._waiters._loop.time() + timeout
+        result = predicate()
+        while not result:
+            if deadline is not None:
+                timeout = deadline - self._waiters._loop.time()
+                if timeout <= 0:
+                    break
+            self.wait(timeout)
+            result = predicate()
+        return result
+
+    def notify(self, n=1):
+        if not self._lock.locked():
+            raise RuntimeError('cannot notify on un-acquired lock')
+        for i in range(n):
+            if self._waiters.wake() is None:
+                break
+
+    def notify_all(self):
+        self.notify(len(self._waiters))
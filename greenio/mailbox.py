@@ -0,0 +1,155 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Calls between green event loops running in different threads.
+
+``call_in_loop`` runs a function as a green task on another loop and
+suspends the calling green task until it's finished::
+
+    @greenio.task
+    def handler(request):
+        user = greenio.call_in_loop(db_loop, load_user, request.user_id)
+
+Calls to a loop go through its ``Mailbox``, which wakes the loop up
+(with ``call_soon_threadsafe``, a write to its self-pipe) only once for
+all the calls posted before the loop gets to them.
+"""
+from __future__ import absolute_import
+import threading
+import weakref
+
+from greenio import asyncio
+
+from . import task, _task_greenlet, _suspend, _resume, _call_boxed
+
+
+__all__ = ['Mailbox', 'get_mailbox', 'call_in_loop']
+
+
+class Mailbox(object):
+    """Thread-safe queue of callbacks to run in a *loop*."""
+
+    def __init__(self, loop):
+        # Mailboxes are cached per loop in a WeakKeyDictionary, so they
+        # must not keep their loops alive
+        self._loop_ref = weakref.ref(loop)
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._scheduled = False
+        self.posted = 0
+        self.wakeups = 0
+
+    def post(self, callback, *args):
+        """Schedule ``callback(*args)`` in the loop; can be called from
+        any thread."""
+
+        entry = callback, args
+        with self._lock:
+            self._callbacks.append(entry)
+            self.posted += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self.wakeups += 1
+        try:
+            loop = self._loop_ref()
+            if loop is None:
+                raise RuntimeError('the event loop of the mailbox is gone')
+            # Raises RuntimeError if the loop is closed
+            loop.call_soon_threadsafe(self._run)
+        except BaseException:
+            # Let the next post schedule "_run" (and deliver the
+            # callbacks posted meanwhile); this one failed
+            with self._lock:
+                self._scheduled = False
+                for i, pending in enumerate(self._callbacks):
+                    if pending is entry:
+                        del self._callbacks[i]
+                        break
+            raise
+
+    def _run(self):
+        with self._lock:
+            callbacks = self._callbacks
+            self._callbacks = []
+            self._scheduled = False
+        for callback, args in callbacks:
+            try:
+                callback(*args)
+            except Exception as exc:
+                self._loop_ref().call_exception_handler({
+                    'message': 'Exception in mailbox callback',
+                    'exception': exc})
+
+
+_mailboxes = weakref.WeakKeyDictionary()
+_mailboxes_lock = threading.Lock()
+
+
+def get_mailbox(loop):
+    """Return the ``Mailbox`` of a *loop*."""
+
+    try:
+        return _mailboxes[loop]
+    except KeyError:
+        with _mailboxes_lock:
+            mailbox = _mailboxes.get(loop)
+            if mailbox is None:
+                mailbox = _mailboxes[loop] = Mailbox(loop)
+            return mailbox
+
+
+def _outcome(child):
+    if child.cancelled():
+        return None, asyncio.CancelledError()
+    exc = child.exception()
+    if exc is not None:
+        return None, exc
+    return child.result()[0], None
+
+
+def call_in_loop(loop, func, *args):
+    """Run ``func(*args)`` as a green task on the green event *loop*
+    (usually running in another thread), and return its result or
+    raise its exception.  Must be called from a green task.
+
+    Cancelling the calling task cancels the task on the *loop*."""
+
+    gl = _task_greenlet()
+    caller = gl.task
+    caller_loop = caller._loop
+    if loop is caller_loop:
+        return func(*args)
+
+    # "state" is shared between the threads: [pending, child task]
+    state = [True, None]
+
+    def start():
+        # In "loop"
+        if state[0]:
+            child = state[1] = task(_call_boxed, loop=loop)(func, *args)
+            child.add_done_callback(finished)
+
+    def finished(child):
+        # In "loop"
+        get_mailbox(caller_loop).post(reply, _outcome(child))
+
+    def reply(outcome):
+        # In the caller's loop
+        if state[0]:
+            state[0] = False
+            _resume(caller, *outcome)
+
+    def cancel_child():
+        # In "loop"
+        if state[1] is not None:
+            state[1].cancel()
+
+    def cancel():
+        # In the caller's loop
+        state[0] = False
+        get_mailbox(loop).post(cancel_child)
+
+    get_mailbox(loop).post(start)
+    return _suspend(gl, cancel)
@@ -0,0 +1,482 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Make blocking stdlib calls green.
+
+After ``greenio.patch()``, pure-Python libraries (HTTP, Redis, SMTP
+clients...) don't need to be ported to ``greenio.socket``::
+
+    greenio.patch()
+
+    @greenio.task
+    def fetch():
+        conn = http.client.HTTPConnection('example.com')
+        conn.request('GET', '/')
+        return conn.getresponse().read()
+
+The patched ``socket.socket``, ``socket.create_connection``,
+``select.select``, ``selectors.DefaultSelector`` and ``time.sleep``
+only suspend the calling task when they're called in a green task;
+in any other context (the event loop itself, other threads) they
+block like the originals.  Sockets created while patched are always
+non-blocking at the OS level, their timeouts are emulated.
+
+Requires Python 3.3+.
+"""
+from __future__ import absolute_import
+import errno
+import math
+import os
+import select as _select_module
+import socket as _std_socket
+import sys
+import time as _time
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+import greenlet
+
+from . import _TaskGreenlet, _suspend, _resume, _get_timers
+from .socket import _TRY_AGAIN, _wait_readable, _wait_writable, getaddrinfo
+
+
+__all__ = ['patch', 'unpatch', 'is_patched', 'GreenSocket']
+
+
+_base_socket = _std_socket.socket
+_blocking_select = _select_module.select
+_blocking_sleep = _time.sleep
+_blocking_create_connection = _std_socket.create_connection
+
+if hasattr(_time, 'monotonic'):
+    _monotonic = _time.monotonic
+else:
+    _monotonic = _time.time
+
+_SOCK_NONBLOCK = getattr(_std_socket, 'SOCK_NONBLOCK', 0)
+# Python 3.4+
+_SocketKind = getattr(_std_socket, 'SocketKind', int)
+
+
+def _green_task():
+    """Return the greenlet of the green task we're running in, or
+    None if we're not in one."""
+
+    gl = greenlet.getcurrent()
+    if isinstance(gl, _TaskGreenlet) and gl.task is not None:
+        return gl
+    return None
+
+
+def _wait_socket(sock, writing, deadline):
+    remaining = None
+    if deadline is not None:
+        remaining = deadline - _monotonic()
+        if remaining <= 0:
+            raise _std_socket.timeout('timed out')
+
+    gl = _green_task()
+    if gl is None:
+        if writing:
+            ready = _poll_select([], [sock], [], remaining)[1]
+        else:
+            ready = _poll_select([sock], [], [], remaining)[0]
+        if not ready:
+            raise _std_socket.timeout('timed out')
+        return
+
+    loop = gl.task._loop
+    if remaining is not None:
+        remaining += loop.time()
+    if writing:
+        _wait_writable(loop, sock, remaining)
+    else:
+        _wait_readable(loop, sock, remaining)
+
+
+def _wait_fds(gl, readers, writers, timeout):
+    """Suspend the task of *gl* until one of the file descriptors is
+    ready; return False if *timeout* expired first."""
+
+    task = gl.task
+    loop = task._loop
+    pending = [True]
+
+    def wakeup(ready):
+        if pending[0]:
+            pending[0] = False
+            _resume(task, ready)
+
+    def cleanup():
+        for fd in readers:
+            loop.remove_reader(fd)
+        for fd in writers:
+            loop.remove_writer(fd)
+        if handle is not None:
+            handle.cancel()
+
+    def cancel():
+        pending[0] = False
+        cleanup()
+
+    for fd in readers:
+        loop.add_reader(fd, wakeup, True)
+    for fd in writers:
+        loop.add_writer(fd, wakeup, True)
+    handle = None
+    if timeout is not None:
+        handle = _get_timers(loop).call_later(timeout, wakeup, False)
+
+    try:
+        return _suspend(gl, cancel)
+    finally:
+        cleanup()
+
+
+class GreenSocket(_base_socket):
+    """``socket.socket`` that suspends green tasks instead of blocking.
+
+    The OS-level socket is always non-blocking; ``settimeout`` and
+    ``setblocking`` only change how the blocking methods wait."""
+
+    __slots__ = ('_green_timeout',)
+
+    def __init__(self, *args, **kwargs):
+        super(GreenSocket, self).__init__(*args, **kwargs)
+        self._green_timeout = _std_socket.getdefaulttimeout()
+        _base_socket.settimeout(self, 0.0)
+
+    @property
+    def type(self):
+        sock_type = super(GreenSocket, self).type
+        if sock_type & _SOCK_NONBLOCK:
+            # Python < 3.7 reports the flag of non-blocking sockets
+            sock_type = _SocketKind(sock_type & ~_SOCK_NONBLOCK)
+        return sock_type
+
+    def settimeout(self, value):
+        if value is not None:
+            value = float(value)
+            if value < 0:
+                raise ValueError('Timeout value out of range')
+        self._green_timeout = value
+
+    def gettimeout(self):
+        return self._green_timeout
+
+    def setblocking(self, flag):
+        self._green_timeout = None if flag else 0.0
+
+    def getblocking(self):
+        return self._green_timeout != 0.0
+
+    def _io(self, method, writing, deadline, *args):
+        while True:
+            try:
+                return method(self, *args)
+            except _std_socket.error as exc:
+                if exc.errno not in _TRY_AGAIN:
+                    raise
+            _wait_socket(self, writing, deadline)
+
+    def _call(self, method, writing, *args):
+        timeout = self._green_timeout
+        if timeout == 0.0:
+            return method(self, *args)
+        if timeout is None:
+            deadline = None
+        else:
+            deadline = _monotonic() + timeout
+        return self._io(method, writing, deadline, *args)
+
+    def _accept(self):
+        return self._call(_base_socket._accept, False)
+
+    def recv(self, *args):
+        return self._call(_base_socket.recv, False, *args)
+
+    def recv_into(self, *args):
+        return self._call(_base_socket.recv_into, False, *args)
+
+    def recvfrom(self, *args):
+        return self._call(_base_socket.recvfrom, False, *args)
+
+    def recvfrom_into(self, *args):
+        return self._call(_base_socket.recvfrom_into, False, *args)
+
+    def send(self, *args):
+        return self._call(_base_socket.send, True, *args)
+
+    def sendto(self, *args):
+        return self._call(_base_socket.sendto, True, *args)
+
+    if hasattr(_base_socket, 'sendmsg'):
+        def recvmsg(self, *args):
+            return self._call(_base_socket.recvmsg, False, *args)
+
+        def recvmsg_into(self, *args):
+            return self._call(_base_socket.recvmsg_into, False, *args)
+
+        def sendmsg(self, *args):
+            return self._call(_base_socket.sendmsg, True, *args)
+
+    def sendall(self, data, flags=0):
+        timeout = self._green_timeout
+        if timeout == 0.0:
+            return _base_socket.sendall(self, data, flags)
+        deadline = None if timeout is None else _monotonic() + timeout
+
+        view = memoryview(data)
+        if view.itemsize != 1:
+            view = view.cast('B')
+        sent = 0
+        while sent < len(view):
+            sent += self._io(_base_socket.send, True, deadline,
+                             view[sent:], flags)
+
+    def connect(self, address):
+        timeout = self._green_timeout
+        if timeout == 0.0:
+            return _base_socket.connect(self, address)
+        deadline = None if timeout is None else _monotonic() + timeout
+
+        err = _base_socket.connect_ex(self, address)
+        if err in _TRY_AGAIN:
+            _wait_socket(self, True, deadline)
+            err = self.getsockopt(_std_socket.SOL_SOCKET,
+                                  _std_socket.SO_ERROR)
+        if err:
+            raise _std_socket.error(err, os.strerror(err))
+
+    def connect_ex(self, address):
+        try:
+            self.connect(address)
+        except _std_socket.timeout:
+            return errno.EAGAIN
+        except _std_socket.error as exc:
+            if exc.errno is None:
+                raise
+            return exc.errno
+        return 0
+
+
+def create_connection(address, timeout=_std_socket._GLOBAL_DEFAULT_TIMEOUT,
+                      source_address=None):
+    """``socket.create_connection`` resolving *address* with the green
+    ``greenio.socket.getaddrinfo`` in green tasks."""
+
+    if _green_task() is None:
+        return _blocking_create_connection(address, timeout, source_address)
+
+    host, port = address
+    err = None
+    for af, socktype, proto, canonname, sa in getaddrinfo(
+            host, port, 0, _std_socket.SOCK_STREAM):
+        sock = None
+        try:
+            sock = GreenSocket(af, socktype, proto)
+            if timeout is not _std_socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sa)
+            return sock
+        except _std_socket.error as exc:
+            err = exc
+            if sock is not None:
+                sock.close()
+    if err is not None:
+        raise err
+    raise _std_socket.error('getaddrinfo returns an empty list')
+
+
+def _fileno(fileobj):
+    if isinstance(fileobj, int):
+        return fileobj
+    return fileobj.fileno()
+
+
+if hasattr(_select_module, 'poll'):
+    # Events reported as readable and writable by "select" (see Linux'
+    # fs/select.c)
+    _POLL_READ = _select_module.POLLIN | _select_module.POLLHUP | \
+        _select_module.POLLERR
+    _POLL_WRITE = _select_module.POLLOUT | _select_module.POLLERR
+
+    def _poll_select(rlist, wlist, xlist, timeout=None):
+        """``select.select`` implemented with ``poll``, which isn't
+        limited to file descriptors below ``FD_SETSIZE``."""
+
+        if timeout is not None:
+            if timeout < 0:
+                raise ValueError('timeout must be non-negative')
+            # Milliseconds, rounded up not to wake up before the timeout
+            timeout = int(math.ceil(timeout * 1000))
+
+        events = {}
+        for objs, mask in ((rlist, _select_module.POLLIN),
+                           (wlist, _select_module.POLLOUT),
+                           (xlist, _select_module.POLLPRI)):
+            for obj in objs:
+                fd = _fileno(obj)
+                events[fd] = events.get(fd, 0) | mask
+        poller = _select_module.poll()
+        for fd, mask in events.items():
+            poller.register(fd, mask)
+
+        ready = dict(poller.poll(timeout))
+        for revents in ready.values():
+            if revents & _select_module.POLLNVAL:
+                raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+        return ([obj for obj in rlist
+                 if ready.get(_fileno(obj), 0) & _POLL_READ],
+                [obj for obj in wlist
+                 if ready.get(_fileno(obj), 0) & _POLL_WRITE],
+                [obj for obj in xlist
+                 if ready.get(_fileno(obj), 0) & _select_module.POLLPRI])
+else:
+    _poll_select = _blocking_select
+
+
+def select(rlist, wlist, xlist, timeout=None):
+    """``select.select`` suspending green tasks."""
+
+    gl = _green_task()
+    if gl is None or timeout is not None and timeout <= 0:
+        return _poll_select(rlist, wlist, xlist, timeout)
+
+    readers = set(_fileno(obj) for obj in rlist)
+    writers = [_fileno(obj) for obj in wlist]
+    if not xlist:
+        return _select_fds(gl, rlist, wlist, xlist, timeout, readers, writers)
+
+    if hasattr(_select_module, 'epoll'):
+        # The event loop can't wait for exceptional conditions (like
+        # out-of-band data), but an epoll descriptor is readable when
+        # any of the descriptors registered in it are ready
+        poller = _select_module.epoll()
+        try:
+            for fd in set(_fileno(obj) for obj in xlist):
+                poller.register(fd, _select_module.EPOLLPRI)
+            readers.add(poller.fileno())
+            return _select_fds(gl, rlist, wlist, xlist, timeout,
+                               readers, writers)
+        finally:
+            poller.close()
+
+    # Wait for descriptors in "xlist" to be readable, as selectors do
+    xonly = set(_fileno(obj) for obj in xlist) - readers
+    return _select_fds(gl, rlist, wlist, xlist, timeout,
+                       readers | xonly, writers, xonly)
+
+
+def _select_fds(gl, rlist, wlist, xlist, timeout, readers, writers,
+                xonly=()):
+    """Wait for *readers* and *writers* until ``select`` has something
+    to return; stop waiting for descriptors in *xonly* once they're
+    readable."""
+
+    deadline = None if timeout is None else _monotonic() + timeout
+    while True:
+        ready = _poll_select(rlist, wlist, xlist, 0)
+        if ready[0] or ready[1] or ready[2]:
+            return ready
+        if deadline is not None:
+            timeout = deadline - _monotonic()
+            if timeout <= 0:
+                return [], [], []
+        if not _wait_fds(gl, list(readers), writers, timeout):
+            return [], [], []
+        if xonly:
+            # Woken up by a descriptor only in "xlist" being readable,
+            # without an exceptional condition; don't wait for it again
+            readers -= set(_poll_select(list(xonly), [], [], 0)[0])
+
+# "patch" has a "select" argument
+_green_select = select
+
+
+class _GreenSelectorMixin(object):
+    def select(self, timeout=None):
+        gl = _green_task()
+        if gl is None or timeout is not None and timeout <= 0:
+            return super(_GreenSelectorMixin, self).select(timeout)
+
+        ready = super(_GreenSelectorMixin, self).select(0)
+        if ready:
+            return ready
+        readers = []
+        writers = []
+        for key in self.get_map().values():
+            if key.events & selectors.EVENT_READ:
+                readers.append(key.fd)
+            if key.events & selectors.EVENT_WRITE:
+                writers.append(key.fd)
+        if _wait_fds(gl, readers, writers, timeout):
+            return super(_GreenSelectorMixin, self).select(0)
+        return []
+
+
+if selectors is not None:
+    class GreenSelector(_GreenSelectorMixin, selectors.DefaultSelector):
+        """``selectors.DefaultSelector`` suspending green tasks."""
+else:
+    GreenSelector = None
+
+
+def sleep(seconds):
+    """``time.sleep`` suspending green tasks."""
+
+    gl = _green_task()
+    if gl is None:
+        return _blocking_sleep(seconds)
+    if seconds < 0:
+        raise ValueError('sleep length must be non-negative')
+    task = gl.task
+    handle = _get_timers(task._loop).call_later(seconds, _resume, task)
+    _suspend(gl, handle.cancel)
+
+
+_patched = {}
+
+
+def _patch(module, name, value):
+    key = module, name
+    if key not in _patched:
+        _patched[key] = getattr(module, name)
+    setattr(module, name, value)
+
+
+def patch(socket=True, select=True, time=True):
+    """Replace blocking stdlib functions with green ones: the socket
+    class and ``create_connection`` of the ``socket`` module (if
+    *socket*), ``select.select`` and ``selectors.DefaultSelector`` (if
+    *select*), and ``time.sleep`` (if *time*)."""
+
+    if sys.version_info < (3, 3):
+        raise RuntimeError('greenio.patch() requires Python 3.3+')
+    if socket:
+        _patch(_std_socket, 'socket', GreenSocket)
+        _patch(_std_socket, 'create_connection', create_connection)
+    if select:
+        _patch(_select_module, 'select', _green_select)
+        if selectors is not None:
+            _patch(selectors, 'DefaultSelector', GreenSelector)
+    if time:
+        _patch(_time, 'sleep', sleep)
+
+
+def unpatch():
+    """Undo ``patch``.  Sockets created meanwhile stay green."""
+
+    for (module, name), value in _patched.items():
+        setattr(module, name, value)
+    _patched.clear()
+
+
+def is_patched():
+    return bool(_patched)
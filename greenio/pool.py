@@ -0,0 +1,222 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Connection pool for green tasks.
+
+A ``Pool`` keeps connections opened by database drivers running on
+``greenio.socket`` (see ``examples/mysql.py``) alive between tasks::
+
+    pool = Pool(lambda: GreenConnection(host='localhost'), maxsize=20)
+
+    @greenio.task
+    def handler():
+        with pool.connection() as conn:
+            ...
+
+All methods that may open or wait for a connection must be called
+from a ``greenio.task`` or a coroutine invoked from it.
+"""
+from __future__ import absolute_import
+import collections
+import contextlib
+
+from greenio import asyncio
+
+from . import task
+from .locks import _Waiters
+
+
+def _close_connection(conn):
+    conn.close()
+
+
+class Pool(object):
+    """A pool of up to *maxsize* connections created by *factory*.
+
+    Idle connections are reused last-in first-out, so the pool stays
+    as small as the load allows and the rest of the idle connections
+    are closed once they've been idle for *max_idle* seconds (the pool
+    never shrinks below *minsize* that way), by a green task started
+    when the oldest of them expires.  *check* is called with an idle connection
+    before it's handed out, and should return False if it's broken;
+    *close* closes a connection the pool is done with.
+
+    When all connections are in use, ``acquire`` waits for a released
+    one for up to *timeout* seconds; waiting tasks are served in FIFO
+    order."""
+
+    def __init__(self, factory, minsize=0, maxsize=10, timeout=None,
+                 max_idle=None, check=None, close=_close_connection,
+                 loop=None):
+        if maxsize < 1 or minsize > maxsize:
+            raise ValueError('invalid pool size limits')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._factory = factory
+        self._check = check
+        self._close = close
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.max_idle = max_idle
+
+        # A stack of (connection, release time) pairs, expired from the
+        # bottom
+        self._idle = collections.deque()
+        self._in_use = set()
+        self._waiters = _Waiters(loop)
+        # Number of connections being opened by "factory" right now
+        self._opening = 0
+        self._closed = False
+        # Timer of the task closing expired idle connections
+        self._reaper = None
+
+        self.created = 0
+        self.evicted = 0
+
+    @property
+    def size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def stats(self):
+        return {'size': self.size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'waiters': len(self._waiters),
+                'created': self.created,
+                'evicted': self.evicted}
+
+    def _open(self):
+        self._opening += 1
+        try:
+            conn = self._factory()
+        except BaseException:
+            self._opening -= 1
+            self._wake_waiter()
+            raise
+        self._opening -= 1
+        self.created += 1
+        return conn
+
+    def _evict(self, conn):
+        self.evicted += 1
+        self._close(conn)
+
+    def _evict_expired(self):
+        if self.max_idle is None:
+            return
+        deadline = self._loop.time() - self.max_idle
+        # The oldest idle connections are at the bottom of the stack
+        while (self._idle and self._idle[0][1] <= deadline
+               and self.size > self.minsize):
+            conn, released = self._idle.popleft()
+            self._evict(conn)
+
+    def _schedule_reaper(self):
+        if (self.max_idle is None or self._reaper is not None or
+                not self._idle or self.size <= self.minsize):
+            return
+        # Closing connections may do I/O (e.g. say goodbye to a server)
+        self._reaper = self._loop.call_at(
+            self._idle[0][1] + self.max_idle,
+            task(self._reap, loop=self._loop))
+
+    def _reap(self):
+        self._reaper = None
+        if not self._closed:
+            self._evict_expired()
+            self._schedule_reaper()
+
+    def _wake_waiter(self, conn=None):
+        return self._waiters.wake(conn) is not None
+
+    def fill(self):
+        """Open connections until there are at least *minsize*."""
+
+        while self.size < self.minsize:
+            conn = self._open()
+            self._idle.append((conn, self._loop.time()))
+        self._schedule_reaper()
+
+    def acquire(self, timeout=None):
+        """Take a connection from the pool, opening a new one if needed.
+
+        Raises ``asyncio.TimeoutError`` if no connection was released
+        within *timeout* seconds (the pool's default *timeout* is used
+        if it's None)."""
+
+        if timeout is None:
+            timeout = self.timeout
+
+        while True:
+            if self._closed:
+                raise RuntimeError('pool is closed')
+
+            self._evict_expired()
+            while self._idle:
+                conn, released = self._idle.pop()
+                if self._check is None or self._check(conn):
+                    self._in_use.add(conn)
+                    return conn
+                self._evict(conn)
+
+            if self.size < self.maxsize:
+                conn = self._open()
+                self._in_use.add(conn)
+                return conn
+
+            # A released connection is handed to us directly; None means
+            # that a connection was closed, so there's room for a new one
+            conn = self._waiters.wait(timeout)
+            if conn is not None:
+                return conn
+
+    def release(self, conn, discard=False):
+        """Return *conn* to the pool, or close it if *discard* is set."""
+
+        self._in_use.remove(conn)
+        if discard or self._closed:
+            self._evict(conn)
+            self._wake_waiter()
+            return
+
+        if self._waiters:
+            self._in_use.add(conn)
+            self._wake_waiter(conn)
+            return
+
+        self._idle.append((conn, self._loop.time()))
+        self._evict_expired()
+        self._schedule_reaper()
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """Acquire a connection for a ``with`` block.
+
+        The connection is discarded if the block raises an exception,
+        as it might be left in an unknown state."""
+
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Close idle connections and fail waiting ``acquire`` calls;
+        connections in use are closed when they're released."""
+
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        while self._idle:
+            conn, released = self._idle.pop()
+            self._evict(conn)
+        while self._waiters:
+            self._waiters.wake(None, RuntimeError('pool is closed'))
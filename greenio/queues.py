@@ -0,0 +1,146 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""A queue for green tasks.
+
+``Queue`` follows the API of the standard ``queue.Queue``, but blocks
+the calling task greenlet instead of the thread.  Items are handed
+over to waiting consumers directly, and ``get_many``/``put_many``
+move batches of items at once::
+
+    @greenio.task
+    def consumer(queue):
+        while True:
+            for item in queue.get_many(100):
+                ...
+
+All blocking methods must be called from a green task.
+"""
+from __future__ import absolute_import
+import collections
+
+from greenio import asyncio
+
+from .locks import _Waiters
+
+
+__all__ = ['Queue', 'Empty', 'Full']
+
+
+Empty = asyncio.QueueEmpty
+Full = asyncio.QueueFull
+
+
+class Queue(object):
+    """A FIFO queue of up to *maxsize* items (unbounded if *maxsize*
+    is 0)."""
+
+    def __init__(self, maxsize=0, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self.maxsize = maxsize
+        self._queue = collections.deque()
+        # Tasks waiting for items; when there are any, the queue is empty
+        self._getters = _Waiters(loop)
+        # Tasks waiting for space, with their items; when there are any,
+        # the queue is full
+        self._putters = _Waiters(loop)
+
+    def __repr__(self):
+        return '<{} maxsize={} qsize={} getters:{} putters:{}>'.format(
+            self.__class__.__name__, self.maxsize, len(self._queue),
+            len(self._getters), len(self._putters))
+
+    def qsize(self):
+        return len(self._queue)
+
+    def empty(self):
+        return not self._queue
+
+    def full(self):
+        return 0 < self.maxsize <= len(self._queue)
+
+    def _fill(self):
+        # Move the items of waiting putters into the freed space
+        while self._putters and not self.full():
+            waiter = self._putters.wake()
+            self._queue.append(waiter.value)
+
+    def put(self, item, block=True, timeout=None):
+        """Put *item* into the queue, waiting for up to *timeout*
+        seconds for free space if *block*; raises ``Full`` if there's
+        none."""
+
+        if self._getters:
+            self._getters.wake(item)
+        elif not self.full():
+            self._queue.append(item)
+        elif not block:
+            raise Full
+        else:
+            try:
+                # "_fill" will put the item into the queue for us
+                self._putters.wait(timeout, item)
+            except asyncio.TimeoutError:
+                raise Full
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def put_many(self, items, block=True, timeout=None):
+        """Put all *items* into the queue, waiting for free space as
+        needed, for up to *timeout* seconds in total."""
+
+        deadline = None
+        if timeout is not None:
+            deadline = self._loop.time() + timeout
+
+        for item in items:
+            if self._getters:
+                self._getters.wake(item)
+            elif not self.full():
+                self._queue.append(item)
+            else:
+                if deadline is not None:
+                    timeout = max(0, deadline - self._loop.time())
+                self.put(item, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        """Remove and return an item, waiting for up to *timeout*
+        seconds for one if *block*; raises ``Empty`` if there's none."""
+
+        if self._queue:
+            item = self._queue.popleft()
+            if self._putters:
+                self._fill()
+            return item
+        if not block:
+            raise Empty
+        try:
+            return self._getters.wait(timeout)
+        except asyncio.TimeoutError:
+            raise Empty
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def get_many(self, max_items=None, block=True, timeout=None):
+        """Remove and return a list of up to *max_items* items (all of
+        them if None), waiting for at least one like ``get``."""
+
+        if not self._queue:
+            items = [self.get(block, timeout)]
+        else:
+            items = []
+        queue = self._queue
+        if max_items is None:
+            items.extend(queue)
+            queue.clear()
+        else:
+            while queue and len(items) < max_items:
+                items.append(queue.popleft())
+        if self._putters:
+            self._fill()
+        return items
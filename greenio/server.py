@@ -0,0 +1,229 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Green TCP servers.
+
+``serve`` runs a plain function for every accepted connection, in
+its own green task, so it can use blocking-style ``greenio.socket``
+calls::
+
+    def echo(sock, addr):
+        while True:
+            data = sock.recv(1024)
+            if not data:
+                break
+            sock.sendall(data)
+
+    server = serve(echo, '127.0.0.1', 8000)
+    loop.run_forever()
+"""
+from __future__ import absolute_import
+import errno
+import socket as std_socket
+
+from greenio import asyncio
+
+from . import task
+from .socket import error, socket, _TRY_AGAIN
+
+
+# Errors of "accept" meaning that a client went away before we
+# accepted it
+_ACCEPT_ABORTED = frozenset((errno.ECONNABORTED, errno.EPROTO))
+
+# Errors of "accept" meaning that we ran out of descriptors or memory,
+# (hopefully) for a while; the listening sockets stay readable, so we
+# stop accepting for ACCEPT_RETRY_DELAY seconds not to spin on them
+_ACCEPT_EXHAUSTED = frozenset((errno.EMFILE, errno.ENFILE, errno.ENOBUFS,
+                               errno.ENOMEM))
+
+ACCEPT_RETRY_DELAY = 1.0
+
+
+class Server(object):
+    """Accepts connections on listening *sockets*, see ``serve``."""
+
+    def __init__(self, handler, sockets, max_connections=1000,
+                 accept_batch=16, loop=None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._handler = handler
+        self._run = task(self._run_handler, loop=loop)
+        self.sockets = sockets
+        self.max_connections = max_connections
+        self.accept_batch = accept_batch
+
+        self.active = 0
+        self.accepted = 0
+        self._paused = True
+        self._closed = False
+        self._waiters = []
+        self._retry_handle = None
+
+        for sock in sockets:
+            sock.setblocking(False)
+        self._resume_accepting()
+
+    def stats(self):
+        return {'active': self.active,
+                'accepted': self.accepted,
+                'paused': self._paused and not self._closed}
+
+    def _pause_accepting(self):
+        # New connections wait in the listen backlog meanwhile
+        if not self._paused:
+            self._paused = True
+            for sock in self.sockets:
+                self._loop.remove_reader(sock.fileno())
+
+    def _resume_accepting(self):
+        if self._paused and not self._closed:
+            self._paused = False
+            for sock in self.sockets:
+                self._loop.add_reader(sock.fileno(), self._accept, sock)
+
+    def _retry_accepting(self):
+        self._retry_handle = None
+        self._resume_accepting()
+
+    def _accept(self, sock):
+        # Accept all pending connections (up to "accept_batch") on one
+        # readiness event
+        for i in range(self.accept_batch):
+            if self.active >= self.max_connections:
+                self._pause_accepting()
+                return
+
+            try:
+                conn, addr = sock.accept()
+            except error as exc:
+                if exc.errno in _TRY_AGAIN:
+                    return
+                if exc.errno in _ACCEPT_ABORTED:
+                    continue
+                if exc.errno not in _ACCEPT_EXHAUSTED:
+                    raise
+                self._loop.call_exception_handler({
+                    'message': 'Error accepting a connection, retrying '
+                               'in {} seconds'.format(ACCEPT_RETRY_DELAY),
+                    'exception': exc})
+                self._pause_accepting()
+                if self._retry_handle is None:
+                    self._retry_handle = self._loop.call_later(
+                        ACCEPT_RETRY_DELAY, self._retry_accepting)
+                return
+
+            self.active += 1
+            self.accepted += 1
+            self._run(conn, addr)
+
+    def _run_handler(self, conn, addr):
+        try:
+            sock = socket.from_socket(conn)
+            try:
+                self._handler(sock, addr)
+            finally:
+                sock.close()
+        except Exception as exc:
+            self._loop.call_exception_handler({
+                'message': 'Unhandled exception in connection handler',
+                'exception': exc})
+        finally:
+            self.active -= 1
+            if self._closed:
+                if not self.active:
+                    self._wakeup()
+            elif self.active < self.max_connections:
+                self._resume_accepting()
+
+    def _wakeup(self):
+        waiters = self._waiters
+        self._waiters = []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(None)
+
+    def close(self):
+        """Stop accepting connections and close the listening sockets.
+
+        Active connections are not interrupted."""
+
+        if self._closed:
+            return
+        self._pause_accepting()
+        self._closed = True
+        if self._retry_handle is not None:
+            self._retry_handle.cancel()
+            self._retry_handle = None
+        for sock in self.sockets:
+            sock.close()
+        if not self.active:
+            self._wakeup()
+
+    def wait_closed(self):
+        """Return a future that's done once the server is closed and
+        all its connections are finished."""
+
+        fut = asyncio.Future(loop=self._loop)
+        if self._closed and not self.active:
+            fut.set_result(None)
+        else:
+            self._waiters.append(fut)
+        return fut
+
+
+def _listen(host, port, backlog, reuse_port):
+    sockets = []
+    infos = std_socket.getaddrinfo(host, port, 0, std_socket.SOCK_STREAM,
+                                   0, std_socket.AI_PASSIVE)
+    try:
+        for af, socktype, proto, canonname, sa in infos:
+            sock = std_socket.socket(af, socktype, proto)
+            sockets.append(sock)
+            sock.setsockopt(std_socket.SOL_SOCKET, std_socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                sock.setsockopt(std_socket.SOL_SOCKET,
+                                std_socket.SO_REUSEPORT, 1)
+            if af == getattr(std_socket, 'AF_INET6', None):
+                # Don't let the IPv6 socket take the IPv4 port as well
+                sock.setsockopt(std_socket.IPPROTO_IPV6,
+                                std_socket.IPV6_V6ONLY, 1)
+            sock.bind(sa)
+            sock.listen(backlog)
+    except:
+        for sock in sockets:
+            sock.close()
+        raise
+    return sockets
+
+
+def serve(handler, host=None, port=None, sock=None, backlog=100,
+          max_connections=1000, reuse_port=False, accept_batch=16,
+          loop=None):
+    """Listen on *host* and *port* (or on the listening socket *sock*)
+    and call ``handler(sock, addr)`` for each connection, in a green
+    task, with a ``greenio.socket``.  The socket is closed when the
+    handler returns.
+
+    Up to *accept_batch* connections are accepted per readiness
+    event.  When *max_connections* handlers are running, the server
+    stops accepting until one of them finishes.  With *reuse_port*
+    the sockets are bound with ``SO_REUSEPORT``, so that several
+    processes can listen on the same port.
+
+    Returns a ``Server``."""
+
+    if sock is not None:
+        if host is not None or port is not None:
+            raise ValueError('host/port and sock can not be specified '
+                             'at the same time')
+        sockets = [sock]
+    else:
+        if reuse_port and not hasattr(std_socket, 'SO_REUSEPORT'):
+            raise ValueError('reuse_port not supported by socket module')
+        sockets = _listen(host, port, backlog, reuse_port)
+
+    return Server(handler, sockets, max_connections=max_connections,
+                  accept_batch=accept_batch, loop=loop)
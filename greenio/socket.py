@@ -9,12 +9,39 @@ Use ``greenio.socket`` in the same way as you would use stdlib's
 from them.
 """
 from __future__ import absolute_import
+import collections
+import errno
+import itertools
+
+try:
+    from itertools import zip_longest
+except ImportError:
+    # Python 2
+    from itertools import izip_longest as zip_longest
+
 from greenio import asyncio
-from socket import error, SOCK_STREAM
+from socket import error, timeout, SOCK_STREAM, SOL_SOCKET, SO_ERROR
+from socket import getdefaulttimeout
 from socket import socket as std_socket
 
-from . import yield_from
-from . import _GreenLoopMixin
+from . import task, yield_from
+from . import _is_green_loop, _task_greenlet, _suspend, _resume
+from . import _get_timers
+
+
+DEFAULT_BUFFER_SIZE = 65536
+
+# Max number of buffers passed to a single "sendmsg" call
+_IOV_MAX = 1024
+
+# Delay before starting a connection attempt to the next address
+# in "create_connection" (RFC 8305 recommends 250ms)
+HAPPY_EYEBALLS_DELAY = 0.25
+
+# Errors of non-blocking calls meaning "try again" (BlockingIOError and
+# InterruptedError, which don't exist on Python 2)
+_TRY_AGAIN = frozenset((errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR,
+                        errno.EINPROGRESS))
 
 
 class socket:
@@ -27,10 +54,14 @@ class socket:
         else:
             own_sock = std_socket(*args, **kwargs)
             self._sock = own_sock
+        # Write files created by "makefile", flushed before we block on
+        # reads, send directly, or close
+        self._wfiles = []
+        self._timeout = getdefaulttimeout()
         try:
             self._sock.setblocking(False)
             self._loop = asyncio.get_event_loop()
-            assert isinstance(self._loop, _GreenLoopMixin), \
+            assert _is_green_loop(self._loop), \
                 'greenio event loop is required'
         except:
             if own_sock is not None:
@@ -76,128 +107,645 @@ class socket:
             raise error('greenio.socket does not support blocking mode')
 
     @_copydoc
-    def recv(self, nbytes):
-        fut = self._loop.sock_recv(self._sock, nbytes)
-        yield_from(fut)
-        return fut.result()
+    def settimeout(self, value):
+        if value is not None:
+            value = float(value)
+            if value < 0:
+                raise ValueError('Timeout value out of range')
+            if not value:
+                # Green sockets are always non-blocking, see "setblocking"
+                value = None
+        self._timeout = value
+
+    @_copydoc
+    def gettimeout(self):
+        return self._timeout
+
+    def _flush_writes(self):
+        for wfile in self._wfiles:
+            wfile.flush()
+
+    @_copydoc
+    def recv(self, nbytes, flags=0):
+        if self._wfiles:
+            self._flush_writes()
+        return _recv(self._loop, self._sock, nbytes, flags, self._timeout)
+
+    @_copydoc
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if self._wfiles:
+            self._flush_writes()
+        return _read(self._loop, self._sock, self._sock.recv_into,
+                     (buffer, nbytes, flags), self._timeout)
+
+    @_copydoc
+    def recvfrom(self, bufsize, flags=0):
+        return _read(self._loop, self._sock, self._sock.recvfrom,
+                     (bufsize, flags), self._timeout)
+
+    @_copydoc
+    def recvfrom_into(self, buffer, nbytes=0, flags=0):
+        return _read(self._loop, self._sock, self._sock.recvfrom_into,
+                     (buffer, nbytes, flags), self._timeout)
+
+    def recv_many(self, buffers, flags=0):
+        """Receive datagrams into *buffers*, one per buffer.
+
+        Waits for the first datagram, then receives all the datagrams
+        that are ready, without waiting again, until they run out or
+        all the buffers are filled.  Returns a list of ``(nbytes,
+        address)`` pairs, one for each of the first buffers."""
+
+        return _recv_many(self._loop, self._sock, buffers, flags,
+                          self._timeout)
+
+    @_copydoc
+    def sendto(self, data, flags_or_addr, addr=None):
+        if self._wfiles:
+            self._flush_writes()
+        if addr is None:
+            args = data, flags_or_addr
+        else:
+            args = data, flags_or_addr, addr
+        return _write(self._loop, self._sock, self._sock.sendto, args,
+                      self._timeout)
 
     @_copydoc
     def connect(self, addr):
-        fut = self._loop.sock_connect(self._sock, addr)
-        yield_from(fut)
-        return fut.result()
+        try:
+            self._sock.connect(addr)
+        except error as exc:
+            if exc.errno not in _TRY_AGAIN:
+                raise
+            _wait_writable(self._loop, self._sock,
+                           _deadline(self._loop, self._timeout))
+            err = self._sock.getsockopt(SOL_SOCKET, SO_ERROR)
+            if err:
+                raise error(err, 'Connect call failed {}'.format(addr))
 
     @_copydoc
     def sendall(self, data, flags=0):
-        assert not flags
-        fut = self._loop.sock_sendall(self._sock, data)
-        yield_from(fut)
-        return fut.result()
+        if self._wfiles:
+            self._flush_writes()
+        _sendall(self._loop, self._sock, data, flags, self._timeout)
 
     @_copydoc
     def send(self, data, flags=0):
         self.sendall(data, flags)
         return len(data)
 
+    @_copydoc
+    def close(self):
+        try:
+            if self._wfiles:
+                self._flush_writes()
+        finally:
+            self._wfiles = []
+            self._sock.close()
+
     @_copydoc
     def accept(self):
-        fut = self._loop.sock_accept(self._sock)
-        yield_from(fut)
-        sock, addr = fut.result()
-        return self.__class__.from_socket(sock), addr
+        deadline = None
+        while True:
+            try:
+                sock, addr = self._sock.accept()
+            except error as exc:
+                if exc.errno not in _TRY_AGAIN:
+                    raise
+                if deadline is None:
+                    deadline = _deadline(self._loop, self._timeout)
+                _wait_readable(self._loop, self._sock, deadline)
+            else:
+                return self.__class__.from_socket(sock), addr
 
     @_copydoc
-    def makefile(self, mode, *args, **kwargs):
+    def makefile(self, mode, buffering=None, *args, **kwargs):
         if mode == 'rb':
-            return ReadFile(self._loop, self._sock)
+            if buffering is None or buffering <= 0:
+                buffering = DEFAULT_BUFFER_SIZE
+            return ReadFile(self._loop, self._sock, buffering,
+                            exact=kwargs.pop('exact', False),
+                            flush=self._flush_writes,
+                            gettimeout=self.gettimeout)
         elif mode == 'wb':
-            return WriteFile(self._loop, self._sock)
+            if buffering is None or buffering < 0:
+                buffering = 0
+            wfile = WriteFile(self._loop, self._sock, buffering,
+                              gettimeout=self.gettimeout,
+                              on_close=self._wfiles.remove)
+            self._wfiles.append(wfile)
+            return wfile
         raise NotImplementedError
 
     bind = _proxy('bind')
     listen = _proxy('listen')
     getsockname = _proxy('getsockname')
     getpeername = _proxy('getpeername')
-    gettimeout = _proxy('gettimeout')
     getsockopt = _proxy('getsockopt')
     setsockopt = _proxy('setsockopt')
     fileno = _proxy('fileno')
     # socket.detach() was added in Python 3.2
     if hasattr(std_socket, 'detach'):
         detach = _proxy('detach')
-    close = _proxy('close')
     shutdown = _proxy('shutdown')
 
     del _copydoc, _proxy
 
 
 class ReadFile:
+    """Buffered reader for green sockets.
+
+    Data is received in chunks of up to *bufsize* bytes and kept in
+    a queue of immutable ``bytes`` objects, so reads don't shift the
+    buffer, and ``peek`` and ``readexactly`` can return memoryviews
+    of the received chunks without copying them.
+
+    With *exact* set, ``read(size)`` keeps receiving until *size*
+    bytes are buffered or EOF is reached, instead of returning after
+    one receive like ``socket.recv`` does.  ``recv_calls`` counts all
+    receives and ``last_recv_calls`` the ones made by the last read
+    call, which shows how well reads are batched.
 
-    def __init__(self, loop, sock):
+    *flush* is called before receiving, so that buffered writes
+    are sent before the task waits for a response, and *gettimeout*
+    returns the timeout for receives."""
+
+    def __init__(self, loop, sock, bufsize=DEFAULT_BUFFER_SIZE, exact=False,
+                 flush=None, gettimeout=None):
         self._loop = loop
         self._sock = sock
-        self._buf = bytearray()
+        self._flush = flush
+        self._gettimeout = gettimeout
+        self._bufsize = bufsize
+        self.exact = exact
+        self.reads = 0
+        self.recv_calls = 0
+        self.last_recv_calls = 0
+        self._chunks = collections.deque()
+        # Offset of the first unread byte in "self._chunks[0]"
+        self._pos = 0
+        # Total number of unread bytes in "self._chunks"
+        self._size = 0
+        self._eof = False
+
+    def _begin_read(self):
+        self.reads += 1
+        self.last_recv_calls = 0
+
+    def _recv(self, size=0):
+        if self._flush is not None:
+            self._flush()
+        self.recv_calls += 1
+        self.last_recv_calls += 1
+        timeout = self._gettimeout() if self._gettimeout is not None else None
+        data = _recv(self._loop, self._sock, max(size, self._bufsize), 0,
+                     timeout)
+        if data:
+            self._chunks.append(data)
+            self._size += len(data)
+        else:
+            self._eof = True
+        return len(data)
+
+    def _find(self, char, start):
+        # Chunk offsets are relative to the first unread byte
+        base = -self._pos
+        for chunk in self._chunks:
+            if base + len(chunk) > start:
+                idx = chunk.find(char, max(start - base, 0))
+                if idx >= 0:
+                    return base + idx
+            base += len(chunk)
+        return -1
+
+    def _take(self, size):
+        """Consume *size* buffered bytes.
+
+        Returns the chunk itself if it's consumed as a whole, and
+        a memoryview of it if it's consumed partially.  Only reads
+        spanning several chunks copy data."""
+
+        if not size:
+            return b''
+
+        chunk = self._chunks[0]
+        pos = self._pos
+        end = pos + size
+        self._size -= size
+
+        if end < len(chunk):
+            self._pos = end
+            return memoryview(chunk)[pos:end]
+
+        self._chunks.popleft()
+        self._pos = 0
+        if end == len(chunk):
+            return chunk if not pos else memoryview(chunk)[pos:]
+
+        parts = [chunk[pos:]]
+        size = end - len(chunk)
+        while size:
+            chunk = self._chunks[0]
+            if len(chunk) > size:
+                parts.append(chunk[:size])
+                self._pos = size
+                break
+            parts.append(chunk)
+            self._chunks.popleft()
+            size -= len(chunk)
+        return b''.join(parts)
 
     def read(self, size):
-        while 1:
-            if size <= len(self._buf):
-                data = self._buf[:size]
-                del self._buf[:size]
-                return data
-
-            fut = self._loop.sock_recv(self._sock, size - len(self._buf))
-            yield_from(fut)
-            res = fut.result()
-            self._buf.extend(res)
-
-            if size <= len(self._buf):
-                data = self._buf[:size]
-                del self._buf[:size]
-                return data
-            else:
-                data = self._buf[:]
-                del self._buf[:]
-                return data
+        self._begin_read()
+        while self._size < size and not self._eof:
+            self._recv(size - self._size)
+            if not self.exact:
+                break
+        return _tobytes(self._take(min(size, self._size)))
+
+    def readinto(self, buf):
+        self._begin_read()
+        if not self._size and not self._eof:
+            self._recv(len(buf))
+        size = min(len(buf), self._size)
+        memoryview(buf)[:size] = self._take(size)
+        return size
+
+    def readline(self, limit=-1):
+        self._begin_read()
+        scanned = 0
+        while True:
+            idx = self._find(b'\n', scanned)
+            if idx >= 0:
+                size = idx + 1
+                break
+            scanned = self._size
+            if 0 <= limit <= self._size or self._eof or not self._recv():
+                size = self._size
+                break
+        if limit >= 0:
+            size = min(size, limit)
+        return _tobytes(self._take(size))
+
+    def readexactly(self, size):
+        """Read exactly *size* bytes and return them as a memoryview.
+
+        Raises ``asyncio.IncompleteReadError`` if EOF is reached
+        first."""
+
+        self._begin_read()
+        while self._size < size:
+            if self._eof or not self._recv(size - self._size):
+                partial = _tobytes(self._take(self._size))
+                raise asyncio.IncompleteReadError(partial, size)
+        return memoryview(self._take(size))
+
+    def peek(self, size=0):
+        """Return a memoryview of buffered data without consuming it.
+
+        Receives data only if the buffer is empty; the view can be
+        shorter or longer than *size*."""
+
+        self._begin_read()
+        if not self._size and not self._eof:
+            self._recv(size)
+        if not self._size:
+            return memoryview(b'')
+        return memoryview(self._chunks[0])[self._pos:]
 
     def close(self):
         pass
 
 
+def _tobytes(data):
+    return data if isinstance(data, bytes) else data.tobytes()
+
+
 class WriteFile:
+    """Buffered writer for green sockets.
+
+    Writes are queued until *bufsize* bytes are pending, ``flush``
+    is called, or a read on the same socket is about to wait for
+    data.  Queued buffers are sent with a single vectored ``sendmsg``
+    call where it's available.  With the default *bufsize* of 0 every
+    write is sent right away.  *on_close* is called with the file when
+    it's closed."""
 
-    def __init__(self, loop, sock):
+    def __init__(self, loop, sock, bufsize=0, gettimeout=None,
+                 on_close=None):
         self._loop = loop
+        self._on_close = on_close
         self._sock = sock
+        self._bufsize = bufsize
+        self._gettimeout = gettimeout
+        self._pending = []
+        self._pending_size = 0
 
     def write(self, data):
-        fut = self._loop.sock_sendall(self._sock, data)
-        yield_from(fut)
-        return fut.result()
+        if not isinstance(data, bytes):
+            data = memoryview(data).tobytes()
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self._bufsize:
+            self.flush()
 
     def flush(self):
-        pass
+        if not self._pending:
+            return
+        buffers = self._pending
+        self._pending = []
+        self._pending_size = 0
+        timeout = self._gettimeout() if self._gettimeout is not None else None
+        _sendall_vectored(self._loop, self._sock, buffers, timeout)
 
     def close(self):
-        pass
+        try:
+            self.flush()
+        finally:
+            on_close = self._on_close
+            if on_close is not None:
+                self._on_close = None
+                on_close(self)
 
 
-def create_connection(address, timeout=None):
-    loop = asyncio.get_event_loop()
-    host, port = address
+def _deadline(loop, timeout):
+    return None if timeout is None else loop.time() + timeout
+
+
+def _wait_fd(loop, fd, add, remove, deadline):
+    gl = _task_greenlet()
+    task = gl.task
+    add(fd, _resume, task)
+    timer = None
+    if deadline is not None:
+        timer = _get_timers(loop).call_at(
+            deadline, _resume, task, None, timeout('timed out'))
+
+    def cancel():
+        remove(fd)
+        if timer is not None:
+            timer.cancel()
+
+    try:
+        _suspend(gl, cancel)
+    finally:
+        cancel()
+
+
+def _wait_readable(loop, sock, deadline=None):
+    _wait_fd(loop, sock.fileno(), loop.add_reader, loop.remove_reader,
+             deadline)
+
+
+def _wait_writable(loop, sock, deadline=None):
+    _wait_fd(loop, sock.fileno(), loop.add_writer, loop.remove_writer,
+             deadline)
+
+
+# Socket operations first try the non-blocking call, and only if it
+# would block, wait for the socket readiness.  There are no futures
+# involved, and if the socket is ready the event loop isn't involved
+# at all.  *timeout* limits the whole operation, like "sendall" of
+# standard sockets does.
+
+def _recv(loop, sock, nbytes, flags=0, timeout=None):
+    deadline = None
+    while True:
+        try:
+            return sock.recv(nbytes, flags)
+        except error as exc:
+            if exc.errno not in _TRY_AGAIN:
+                raise
+        if deadline is None:
+            deadline = _deadline(loop, timeout)
+        _wait_readable(loop, sock, deadline)
+
+
+def _read(loop, sock, method, args, timeout=None):
+    deadline = None
+    while True:
+        try:
+            return method(*args)
+        except error as exc:
+            if exc.errno not in _TRY_AGAIN:
+                raise
+        if deadline is None:
+            deadline = _deadline(loop, timeout)
+        _wait_readable(loop, sock, deadline)
+
+
+def _write(loop, sock, method, args, timeout=None):
+    deadline = None
+    while True:
+        try:
+            return method(*args)
+        except error as exc:
+            if exc.errno not in _TRY_AGAIN:
+                raise
+        if deadline is None:
+            deadline = _deadline(loop, timeout)
+        _wait_writable(loop, sock, deadline)
+
+
+def _recv_many(loop, sock, buffers, flags=0, timeout=None):
+    buffers = iter(buffers)
+    for buf in buffers:
+        break
+    else:
+        return []
+
+    recvfrom_into = sock.recvfrom_into
+    received = [_read(loop, sock, recvfrom_into, (buf, 0, flags), timeout)]
+    # Drain the datagrams that are already queued: one wakeup of the
+    # task for the whole batch
+    for buf in buffers:
+        try:
+            received.append(recvfrom_into(buf, 0, flags))
+        except error:
+            # No more datagrams; other errors (like ECONNREFUSED of
+            # connected UDP sockets) don't discard the received ones
+            break
+    return received
+
+
+def _sendall(loop, sock, data, flags=0, timeout=None):
+    deadline = None
+    view = memoryview(data)
+    while view:
+        try:
+            sent = sock.send(view, flags)
+        except error as exc:
+            if exc.errno not in _TRY_AGAIN:
+                raise
+            if deadline is None:
+                deadline = _deadline(loop, timeout)
+            _wait_writable(loop, sock, deadline)
+        else:
+            view = view[sent:]
 
-    rslt = yield_from(
-        loop.getaddrinfo(host, port, family=0, type=SOCK_STREAM))
 
-    for res in rslt:
-        af, socktype, proto, canonname, sa = res
-        sock = None
+def _sendall_vectored(loop, sock, buffers, timeout=None):
+    if not hasattr(sock, 'sendmsg'):
+        return _sendall(loop, sock, b''.join(buffers), 0, timeout)
 
+    deadline = None
+    buffers = collections.deque(buffers)
+    while buffers:
         try:
-            sock = socket(af, socktype, proto)
-            sock.connect(sa)
-            return sock
-        except ConnectionError:
-            if sock:
-                sock.close()
-
-    raise error('unable to connect to {!r}'.format(address))
+            sent = sock.sendmsg(list(itertools.islice(buffers, _IOV_MAX)))
+        except error as exc:
+            if exc.errno not in _TRY_AGAIN:
+                raise
+            if deadline is None:
+                deadline = _deadline(loop, timeout)
+            _wait_writable(loop, sock, deadline)
+            continue
+
+        # Drop the buffers that were sent, and the sent part of
+        # a partially sent one
+        while sent:
+            size = len(buffers[0])
+            if sent < size:
+                buffers[0] = memoryview(buffers[0])[sent:]
+                break
+            buffers.popleft()
+            sent -= size
+
+
+class ResolverCache(object):
+    """LRU cache of up to *maxsize* ``getaddrinfo`` results, each kept
+    for *ttl* seconds."""
+
+    def __init__(self, maxsize=256, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now):
+        try:
+            expires, infos = self._entries.pop(key)
+        except KeyError:
+            return None
+        if expires <= now:
+            return None
+        # Re-insert the entry to mark it as the most recently used
+        self._entries[key] = expires, infos
+        return infos
+
+    def put(self, key, infos, now):
+        self._entries.pop(key, None)
+        self._entries[key] = now + self.ttl, infos
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+resolver_cache = ResolverCache()
+
+
+def getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """Green ``socket.getaddrinfo`` with results cached in
+    ``resolver_cache``."""
+
+    loop = asyncio.get_event_loop()
+    key = host, port, family, type, proto, flags
+
+    infos = resolver_cache.get(key, loop.time())
+    if infos is None:
+        infos = yield_from(loop.getaddrinfo(
+            host, port, family=family, type=type, proto=proto, flags=flags))
+        resolver_cache.put(key, infos, loop.time())
+    return infos
+
+
+def _interleave_families(infos):
+    # Alternate address families, so that if one of them doesn't work
+    # we don't have to wait for all of its addresses (RFC 8305, 4)
+    by_family = collections.OrderedDict()
+    for info in infos:
+        by_family.setdefault(info[0], []).append(info)
+    result = []
+    for group in zip_longest(*by_family.values()):
+        result.extend(info for info in group if info is not None)
+    return result
+
+
+def _connect(info, timeout):
+    af, socktype, proto, canonname, sa = info
+    sock = socket(af, socktype, proto)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(sa)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def create_connection(address, timeout=None, delay=HAPPY_EYEBALLS_DELAY):
+    """Connect to *address* (a ``(host, port)`` pair).
+
+    *timeout* is set on the socket with ``settimeout``, and limits
+    each connection attempt as well.
+
+    Connection attempts to the resolved addresses are started *delay*
+    seconds apart (or as soon as the previous one fails), each in its
+    own green task, and the first one to succeed wins ("Happy
+    Eyeballs", RFC 8305)."""
+
+    loop = asyncio.get_event_loop()
+    host, port = address
+
+    infos = _interleave_families(getaddrinfo(host, port, 0, SOCK_STREAM))
+
+    if len(infos) == 1:
+        return _connect(infos[0], timeout)
+
+    connect = task(_connect, loop=loop)
+    attempts = []
+    pending = set()
+    winner = None
+    # Raised if all the attempts fail, like "socket.create_connection"
+    # does, so that e.g. timeouts can be told from refused connections
+    last_exc = None
+    try:
+        while winner is None and (infos or pending):
+            if infos:
+                attempt = connect(infos.pop(0), timeout)
+                attempts.append(attempt)
+                pending.add(attempt)
+                wait_for = delay if infos else None
+            else:
+                wait_for = None
+
+            done, pending = yield_from(asyncio.wait(
+                pending, timeout=wait_for,
+                return_when=asyncio.FIRST_COMPLETED))
+
+            for attempt in done:
+                exc = attempt.exception()
+                if exc is None:
+                    if winner is None:
+                        winner = attempt.result()
+                elif isinstance(exc, error):
+                    last_exc = exc
+                else:
+                    raise exc
+    finally:
+        for attempt in attempts:
+            if not attempt.done():
+                attempt.cancel()
+            elif (not attempt.cancelled() and attempt.exception() is None
+                    and attempt.result() is not winner):
+                attempt.result().close()
+
+    if winner is None:
+        if last_exc is not None:
+            raise last_exc
+        raise error('getaddrinfo returns an empty list')
+    return winner
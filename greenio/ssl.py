@@ -0,0 +1,362 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""TLS for green sockets.
+
+``wrap_socket`` runs TLS on top of a connected ``greenio.socket``
+(or a socket created after ``greenio.patch()``) in a green task::
+
+    sock = greenio.socket.create_connection(('example.com', 443))
+    sock = greenio.ssl.wrap_socket(sock, server_hostname='example.com')
+    sock.sendall(b'GET / HTTP/1.0\\r\\n\\r\\n')
+
+The TLS layer works on memory buffers (``ssl.MemoryBIO``), and all
+network I/O goes through the green socket.  Sessions of client
+connections are cached per SSL context and resumed on the next
+connection to the same server.
+
+Requires Python 3.5+ (3.6+ for session resumption).
+"""
+from __future__ import absolute_import
+import collections
+import io
+import socket as std_socket
+import ssl as std_ssl
+import time
+import weakref
+
+from . import socket as greensocket
+from . import monkey
+
+
+__all__ = ['SSLContext', 'SSLSocket', 'SessionCache', 'wrap_socket',
+           'get_session_cache']
+
+
+# Bytes read from the socket at once for the TLS layer
+RECV_SIZE = 65536
+
+# Encrypted data is sent to the socket in batches of this size
+SEND_BATCH_SIZE = 262144
+
+# Plaintext written to the TLS layer at once (max TLS record size)
+_RECORD_SIZE = 16384
+
+_HAS_SESSIONS = hasattr(std_ssl, 'SSLSession')
+
+
+class SessionCache(object):
+    """An LRU cache of up to *maxsize* client TLS sessions, keyed by
+    server name and port."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._sessions = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, key):
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return None
+        if session.time + session.timeout < time.time():
+            return None
+        self._sessions[key] = session
+        return session
+
+    def put(self, key, session):
+        self._sessions.pop(key, None)
+        self._sessions[key] = session
+        if len(self._sessions) > self.maxsize:
+            self._sessions.popitem(last=False)
+
+    def clear(self):
+        self._sessions.clear()
+
+
+# Sessions can only be resumed by the context that created them
+_session_caches = weakref.WeakKeyDictionary()
+
+
+def get_session_cache(context):
+    """Return the ``SessionCache`` of an SSL *context*."""
+
+    try:
+        return _session_caches[context]
+    except KeyError:
+        cache = _session_caches[context] = SessionCache()
+        return cache
+
+
+class SSLSocket(object):
+    """A TLS connection over a connected green socket *sock*.
+
+    Use ``wrap_socket`` or ``SSLContext.wrap_socket`` to create one.
+    All methods that do I/O must be called from a green task."""
+
+    def __init__(self, sock, context, server_side=False,
+                 server_hostname=None, do_handshake_on_connect=True,
+                 suppress_ragged_eofs=True, session=None,
+                 session_cache=None):
+        if not hasattr(std_ssl, 'MemoryBIO'):
+            raise RuntimeError('greenio.ssl requires Python 3.5+')
+
+        self._sock = sock
+        self.context = context
+        self.suppress_ragged_eofs = suppress_ragged_eofs
+        self._incoming = std_ssl.MemoryBIO()
+        self._outgoing = std_ssl.MemoryBIO()
+
+        self._session_cache = None
+        self._session_key = None
+        if (session_cache is not None and _HAS_SESSIONS and
+                not server_side and server_hostname):
+            self._session_cache = session_cache
+            peer = sock.getpeername()
+            port = peer[1] if isinstance(peer, tuple) else None
+            self._session_key = server_hostname, port
+            if session is None:
+                session = session_cache.get(self._session_key)
+
+        kwargs = {}
+        if session is not None:
+            kwargs['session'] = session
+        self._sslobj = context.wrap_bio(self._incoming, self._outgoing,
+                                        server_side, server_hostname,
+                                        **kwargs)
+        if do_handshake_on_connect:
+            self.do_handshake()
+
+    def _flush(self):
+        if self._outgoing.pending:
+            self._sock.sendall(self._outgoing.read())
+
+    def _run(self, func, *args):
+        # Call a method of the TLS object, feeding it with data from the
+        # socket until it has enough
+        while True:
+            try:
+                return func(*args)
+            except std_ssl.SSLWantReadError:
+                self._flush()
+                data = self._sock.recv(RECV_SIZE)
+                if data:
+                    self._incoming.write(data)
+                else:
+                    self._incoming.write_eof()
+            except std_ssl.SSLWantWriteError:
+                self._flush()
+
+    def _save_session(self):
+        if self._session_cache is not None:
+            session = self._sslobj.session
+            if session is not None:
+                self._session_cache.put(self._session_key, session)
+
+    def _ragged_eof(self, exc):
+        # The peer closed the connection without a TLS shutdown (OpenSSL 3
+        # doesn't report this as SSLEOFError)
+        if not self.suppress_ragged_eofs:
+            return False
+        return (isinstance(exc, std_ssl.SSLEOFError) or
+                self._incoming.eof)
+
+    def do_handshake(self):
+        self._run(self._sslobj.do_handshake)
+        self._flush()
+        self._save_session()
+
+    def recv(self, bufsize, flags=0):
+        if flags:
+            raise ValueError('non-zero flags not allowed in calls to '
+                             'recv() on {}'.format(self.__class__))
+        try:
+            data = self._run(self._sslobj.read, bufsize)
+        except std_ssl.SSLError as exc:
+            if not self._ragged_eof(exc):
+                raise
+            return b''
+        # Reading could have produced a response (e.g. to a key update)
+        self._flush()
+        return data
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if flags:
+            raise ValueError('non-zero flags not allowed in calls to '
+                             'recv_into() on {}'.format(self.__class__))
+        try:
+            nbytes = self._run(self._sslobj.read, nbytes or len(buffer),
+                               buffer)
+        except std_ssl.SSLError as exc:
+            if not self._ragged_eof(exc):
+                raise
+            return 0
+        self._flush()
+        return nbytes
+
+    def sendall(self, data, flags=0):
+        if flags:
+            raise ValueError('non-zero flags not allowed in calls to '
+                             'sendall() on {}'.format(self.__class__))
+        view = memoryview(data)
+        offset = 0
+        while offset < len(view):
+            offset += self._run(self._sslobj.write,
+                                view[offset:offset + _RECORD_SIZE])
+            if self._outgoing.pending >= SEND_BATCH_SIZE:
+                self._flush()
+        self._flush()
+
+    def send(self, data, flags=0):
+        self.sendall(data, flags)
+        return len(data)
+
+    def pending(self):
+        return self._sslobj.pending()
+
+    def makefile(self, mode='r', buffering=None, encoding=None,
+                 errors=None, newline=None):
+        """Return a file object reading and/or writing the decrypted
+        data, like ``socket.makefile``; closing it doesn't close the
+        connection."""
+
+        if not set(mode) <= set('rwb'):
+            raise ValueError('invalid mode {!r} (only r, w, b '
+                             'allowed)'.format(mode))
+        reading = 'r' in mode
+        writing = 'w' in mode
+        if not reading and not writing:
+            reading = True
+        rawmode = ('r' if reading else '') + ('w' if writing else '')
+        raw = std_socket.SocketIO(self, rawmode)
+        if buffering is None:
+            buffering = -1
+        if buffering < 0:
+            buffering = io.DEFAULT_BUFFER_SIZE
+        if buffering == 0:
+            if 'b' not in mode:
+                raise ValueError('unbuffered streams must be binary')
+            return raw
+        if reading and writing:
+            buffer = io.BufferedRWPair(raw, raw, buffering)
+        elif reading:
+            buffer = io.BufferedReader(raw, buffering)
+        else:
+            buffer = io.BufferedWriter(raw, buffering)
+        if 'b' in mode:
+            return buffer
+        text = io.TextIOWrapper(buffer, encoding, errors, newline)
+        text.mode = mode
+        return text
+
+    def _decref_socketios(self):
+        # Called by "socket.SocketIO" on close
+        pass
+
+    def unwrap(self):
+        """Shut down the TLS layer and return the plain socket."""
+
+        try:
+            self._run(self._sslobj.unwrap)
+        finally:
+            self._flush()
+        self._save_session()
+        return self._sock
+
+    def close(self):
+        self._save_session()
+        self._sock.close()
+
+    @property
+    def server_side(self):
+        return self._sslobj.server_side
+
+    @property
+    def server_hostname(self):
+        return self._sslobj.server_hostname
+
+    @property
+    def session(self):
+        return self._sslobj.session
+
+    @property
+    def session_reused(self):
+        return self._sslobj.session_reused
+
+    def getpeercert(self, binary_form=False):
+        return self._sslobj.getpeercert(binary_form)
+
+    def cipher(self):
+        return self._sslobj.cipher()
+
+    def version(self):
+        return self._sslobj.version()
+
+    def selected_alpn_protocol(self):
+        return self._sslobj.selected_alpn_protocol()
+
+    def settimeout(self, value):
+        self._sock.settimeout(value)
+
+    def gettimeout(self):
+        return self._sock.gettimeout()
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def getpeername(self):
+        return self._sock.getpeername()
+
+    def getsockname(self):
+        return self._sock.getsockname()
+
+
+def _is_green(sock):
+    return isinstance(sock, (greensocket.socket, monkey.GreenSocket))
+
+
+class SSLContext(std_ssl.SSLContext):
+    """``ssl.SSLContext`` wrapping green sockets into ``SSLSocket``."""
+
+    def wrap_socket(self, sock, server_side=False,
+                    do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if not _is_green(sock):
+            # "session" is new in Python 3.6
+            kwargs = {}
+            if session is not None:
+                kwargs['session'] = session
+            return super(SSLContext, self).wrap_socket(
+                sock, server_side=server_side,
+                do_handshake_on_connect=do_handshake_on_connect,
+                suppress_ragged_eofs=suppress_ragged_eofs,
+                server_hostname=server_hostname, **kwargs)
+        return SSLSocket(sock, self, server_side, server_hostname,
+                         do_handshake_on_connect, suppress_ragged_eofs,
+                         session, get_session_cache(self))
+
+
+_default_context = None
+
+
+def wrap_socket(sock, context=None, server_side=False,
+                server_hostname=None, do_handshake_on_connect=True,
+                suppress_ragged_eofs=True, session=None):
+    """Run TLS over a connected green socket *sock*; the handshake is
+    done right away, unless *do_handshake_on_connect* is False.
+
+    Client connections use a shared default context (see
+    ``ssl.create_default_context``) if *context* is None."""
+
+    global _default_context
+    if context is None:
+        if server_side:
+            raise ValueError('server sockets require an SSL context')
+        if _default_context is None:
+            _default_context = std_ssl.create_default_context()
+        context = _default_context
+    return SSLSocket(sock, context, server_side, server_hostname,
+                     do_handshake_on_connect, suppress_ragged_eofs,
+                     session, get_session_cache(context))
@@ -0,0 +1,143 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Per-task instrumentation of green tasks.
+
+Once enabled, every green task counts how many times it was switched
+into, how long it ran, and how long it waited in ``yield_from`` (or
+in a blocking ``greenio.socket`` call)::
+
+    greenio.stats.enable(threshold=0.1)
+    ...
+    print(greenio.stats.get_stats(task))
+
+Task steps that run longer than *threshold* seconds without yielding
+to the event loop are reported with the stack of the task's greenlet,
+which points at the slow synchronous code.
+"""
+from __future__ import absolute_import
+import logging
+import time
+import traceback
+
+import greenio
+
+
+__all__ = ['enable', 'disable', 'is_enabled', 'get_stats', 'TaskStats']
+
+
+logger = logging.getLogger('greenio')
+
+if hasattr(time, 'perf_counter'):
+    _clock = time.perf_counter
+else:
+    _clock = time.time
+
+
+class TaskStats(object):
+    """Counters of a green task.
+
+    *switches* is the number of times the task was switched into,
+    *run_time* and *wait_time* are in seconds, *max_run_time* is the
+    duration of the longest step."""
+
+    __slots__ = ('switches', 'run_time', 'wait_time', 'max_run_time',
+                 '_started', '_suspended')
+
+    def __init__(self):
+        self.switches = 0
+        self.run_time = 0.0
+        self.wait_time = 0.0
+        self.max_run_time = 0.0
+        self._started = None
+        self._suspended = None
+
+    def __repr__(self):
+        return ('<TaskStats switches={} run_time={:.6f} wait_time={:.6f} '
+                'max_run_time={:.6f}>'.format(self.switches, self.run_time,
+                                              self.wait_time,
+                                              self.max_run_time))
+
+
+def _log_slow_task(task, duration, stack):
+    if stack is None:
+        logger.warning('Green task %r ran for %.3f seconds without '
+                       'yielding', task, duration)
+    else:
+        logger.warning('Green task %r ran for %.3f seconds without '
+                       'yielding, suspended at:\n%s', task, duration,
+                       ''.join(stack))
+
+
+class _Monitor(object):
+    def __init__(self, threshold, hook):
+        self.threshold = threshold
+        self.hook = hook
+
+    def step_started(self, task):
+        stats = task._green_stats
+        if stats is None:
+            stats = task._green_stats = TaskStats()
+        now = _clock()
+        if stats._suspended is not None:
+            stats.wait_time += now - stats._suspended
+            stats._suspended = None
+        stats.switches += 1
+        stats._started = now
+
+    def step_finished(self, task, gl):
+        # "gl" is the task's greenlet if the task is suspended now
+        stats = task._green_stats
+        now = _clock()
+        duration = now - stats._started
+        stats.run_time += duration
+        if duration > stats.max_run_time:
+            stats.max_run_time = duration
+        if gl is not None:
+            stats._suspended = now
+
+        if self.threshold is not None and duration > self.threshold:
+            if gl is not None and gl.gr_frame is not None:
+                stack = traceback.format_stack(gl.gr_frame)
+            else:
+                stack = None
+            try:
+                self.hook(task, duration, stack)
+            except Exception as exc:
+                task._loop.call_exception_handler({
+                    'message': 'Exception in greenio stats hook',
+                    'exception': exc})
+
+
+def enable(threshold=None, hook=None):
+    """Start collecting stats of green tasks.
+
+    Steps longer than *threshold* seconds are reported by calling
+    ``hook(task, duration, stack)``, where *stack* is a list of
+    formatted stack entries of the task's greenlet (None if the task
+    finished in that step); by default they're logged as warnings to
+    the "greenio" logger."""
+
+    if threshold is not None and threshold < 0:
+        raise ValueError('threshold must be a non-negative number or None')
+    if hook is None:
+        hook = _log_slow_task
+    greenio._monitor = _Monitor(threshold, hook)
+
+
+def disable():
+    """Stop collecting stats; the collected ones are kept."""
+
+    greenio._monitor = None
+
+
+def is_enabled():
+    return greenio._monitor is not None
+
+
+def get_stats(task):
+    """Return the ``TaskStats`` of a green *task*, or None if it
+    hasn't run since stats were enabled."""
+
+    return task._green_stats
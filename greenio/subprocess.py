@@ -0,0 +1,242 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Run child processes from green tasks.
+
+``Popen``, ``run`` and ``check_output`` work like the ones of the
+``subprocess`` module, but suspend only the calling green task::
+
+    @greenio.task
+    def revision():
+        return greenio.subprocess.check_output(['git', 'rev-parse', 'HEAD'])
+
+Processes are started with the event loop's ``subprocess_exec``, which
+also reports their exit.  The pipes are ``greenio.fileio`` files read
+and written directly by the tasks, in chunks of up to *bufsize*
+bytes, with no thread or protocol buffering in between.
+
+Requires Python 3.3+ (3.5+ for ``run``).
+"""
+from __future__ import absolute_import
+import os
+import subprocess as std_subprocess
+
+from greenio import asyncio
+
+from . import task, yield_from, _task_greenlet
+from .fileio import PipeReader, PipeWriter, PIPE_BUFFER_SIZE
+from .locks import Event
+
+
+__all__ = ['Popen', 'run', 'check_output', 'PIPE', 'STDOUT', 'DEVNULL',
+           'CalledProcessError', 'TimeoutExpired', 'CompletedProcess']
+
+
+PIPE = std_subprocess.PIPE
+STDOUT = std_subprocess.STDOUT
+DEVNULL = std_subprocess.DEVNULL
+CalledProcessError = std_subprocess.CalledProcessError
+TimeoutExpired = std_subprocess.TimeoutExpired
+# Python 3.5+
+CompletedProcess = getattr(std_subprocess, 'CompletedProcess', None)
+
+
+class _ProcessProtocol(asyncio.SubprocessProtocol):
+    def __init__(self, loop):
+        self.exited = Event(loop=loop)
+
+    def process_exited(self):
+        self.exited.set()
+
+
+def _retrieve_exception(fut):
+    if not fut.cancelled():
+        fut.exception()
+
+
+class Popen(object):
+    """A child process started with *args*; see ``subprocess.Popen``.
+
+    With ``PIPE``, ``stdin`` is a ``greenio.fileio.PipeWriter`` and
+    ``stdout``/``stderr`` are ``greenio.fileio.PipeReader`` objects.
+    Must be created in a green task."""
+
+    def __init__(self, args, stdin=None, stdout=None, stderr=None,
+                 shell=False, bufsize=-1, **kwargs):
+        loop = _task_greenlet().task._loop
+        self._loop = loop
+        self.args = args
+        self.returncode = None
+        self.stdin = self.stdout = self.stderr = None
+        if bufsize <= 0:
+            bufsize = PIPE_BUFFER_SIZE
+
+        # Pipes are created by us and not by the transport, so that the
+        # tasks can read them directly
+        child_fds = []
+        try:
+            if stdin == PIPE:
+                stdin, wfd = os.pipe()
+                child_fds.append(stdin)
+                self.stdin = PipeWriter(loop, wfd)
+            if stdout == PIPE:
+                rfd, stdout = os.pipe()
+                child_fds.append(stdout)
+                self.stdout = PipeReader(loop, rfd, bufsize, exact=False)
+            if stderr == PIPE:
+                rfd, stderr = os.pipe()
+                child_fds.append(stderr)
+                self.stderr = PipeReader(loop, rfd, bufsize, exact=False)
+
+            factory = lambda: _ProcessProtocol(loop)
+            if shell:
+                coro = loop.subprocess_shell(factory, args, stdin=stdin,
+                                             stdout=stdout, stderr=stderr,
+                                             **kwargs)
+            else:
+                if isinstance(args, (str, bytes)):
+                    args = [args]
+                coro = loop.subprocess_exec(factory, *args, stdin=stdin,
+                                            stdout=stdout, stderr=stderr,
+                                            **kwargs)
+            self._transport, self._protocol = yield_from(coro)
+        except BaseException:
+            self._close_pipes()
+            raise
+        finally:
+            for fd in child_fds:
+                os.close(fd)
+        self.pid = self._transport.get_pid()
+
+    def _close_pipes(self):
+        for pipe in (self.stdin, self.stdout, self.stderr):
+            if pipe is not None:
+                pipe.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if self.stdin is not None:
+                try:
+                    self.stdin.close()
+                except BrokenPipeError:
+                    pass
+            self.wait()
+        finally:
+            self._close_pipes()
+
+    def poll(self):
+        if self.returncode is None and self._protocol.exited.is_set():
+            self._set_returncode()
+        return self.returncode
+
+    def _set_returncode(self):
+        self.returncode = self._transport.get_returncode()
+        self._transport.close()
+
+    def wait(self, timeout=None):
+        """Wait for the process to exit and return its returncode;
+        raises ``TimeoutExpired`` after *timeout* seconds."""
+
+        if self.returncode is None:
+            if not self._protocol.exited.wait(timeout):
+                raise TimeoutExpired(self.args, timeout)
+            self._set_returncode()
+        return self.returncode
+
+    def _feed_stdin(self, input):
+        try:
+            if input:
+                self.stdin.write(input)
+            self.stdin.close()
+        except BrokenPipeError:
+            # The process exited without reading all of its input
+            pass
+
+    def communicate(self, input=None, timeout=None):
+        """Send *input* to stdin, then read stdout and stderr until EOF
+        and wait for the process to exit; returns ``(stdout, stderr)``.
+
+        stdin and the output pipes are served by separate green tasks,
+        so that a process filling one pipe doesn't deadlock on another.
+        The process isn't killed on timeout."""
+
+        loop = self._loop
+        deadline = None if timeout is None else loop.time() + timeout
+        tasks = []
+        if self.stdin is not None:
+            tasks.append(task(self._feed_stdin, loop=loop)(input))
+        for pipe in (self.stdout, self.stderr):
+            if pipe is not None:
+                tasks.append(task(pipe.read, loop=loop)())
+        gathered = asyncio.gather(*tasks, loop=loop)
+        try:
+            results = yield_from(asyncio.wait_for(gathered, timeout,
+                                                  loop=loop))
+        except asyncio.TimeoutError:
+            # Cancelling "gather" may leave it with a CancelledError
+            # nobody would retrieve
+            gathered.add_done_callback(_retrieve_exception)
+            raise TimeoutExpired(self.args, timeout)
+
+        if self.stdin is not None:
+            results.pop(0)
+        stdout = results.pop(0) if self.stdout is not None else None
+        stderr = results.pop(0) if self.stderr is not None else None
+        self._close_pipes()
+        if deadline is not None:
+            timeout = max(deadline - loop.time(), 0)
+        self.wait(timeout)
+        return stdout, stderr
+
+    def send_signal(self, signal):
+        if self.returncode is None:
+            self._transport.send_signal(signal)
+
+    def terminate(self):
+        if self.returncode is None:
+            self._transport.terminate()
+
+    def kill(self):
+        if self.returncode is None:
+            self._transport.kill()
+
+
+def _run(args, input, stdout, stderr, timeout, check, kwargs):
+    # Returns "(args, returncode, stdout, stderr)"
+    if input is not None:
+        kwargs['stdin'] = PIPE
+    with Popen(args, stdout=stdout, stderr=stderr, **kwargs) as process:
+        try:
+            out, err = process.communicate(input, timeout)
+        except BaseException:
+            process.kill()
+            raise
+        retcode = process.returncode
+    if check and retcode:
+        raise CalledProcessError(retcode, process.args, out, err)
+    return process.args, retcode, out, err
+
+
+def run(args, input=None, stdout=None, stderr=None, timeout=None,
+        check=False, **kwargs):
+    """Run a process and wait for it to exit, see ``subprocess.run``.
+
+    The process is killed if it doesn't exit in *timeout* seconds,
+    and ``TimeoutExpired`` is raised.  Requires Python 3.5+."""
+
+    if CompletedProcess is None:
+        raise RuntimeError('greenio.subprocess.run() requires Python 3.5+')
+    return CompletedProcess(*_run(args, input, stdout, stderr, timeout,
+                                  check, kwargs))
+
+
+def check_output(args, input=None, timeout=None, **kwargs):
+    """Run a process and return its output, see
+    ``subprocess.check_output``."""
+
+    return _run(args, input, PIPE, kwargs.pop('stderr', None), timeout,
+                True, kwargs)[2]
@@ -0,0 +1,98 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Green-task-local data: ``threading.local`` for green tasks.
+
+Attributes of a ``greenio.local`` object have separate values in every
+green task (and in every thread, outside of green tasks)::
+
+    request = greenio.local()
+
+    def handler(sock, addr):
+        request.addr = addr
+        ...
+        log('done')    # sees "request.addr" of its own connection
+
+A green task starts with the values of the green task that created it
+(e.g. the children of ``greenio.gather``); later changes in either
+task are not seen by the other.  The values themselves are not copied,
+as with ``contextvars``.
+
+The values of a task hang off the task, and are looked up through the
+current greenlet, so switching between tasks costs nothing, however
+many locals there are.  A new task shares the data of its parent until
+one of them sets or deletes an attribute, which copies it.
+
+On Python 3.7+, ``contextvars`` are per task as well: the greenlet of a
+green task runs in the task's context, which pooled greenlets are
+switched to whenever they start running a task.
+"""
+from __future__ import absolute_import
+import threading
+
+import greenlet
+
+from . import _TaskGreenlet
+
+
+__all__ = ['local']
+
+
+# Data of the code running outside of green tasks
+_thread_data = threading.local()
+
+
+def _get_data(create):
+    """Return the dict of ``{local: attributes}`` of the current green
+    task (or thread); with *create*, make it ready for changes."""
+
+    gl = greenlet.getcurrent()
+    task = gl.task if isinstance(gl, _TaskGreenlet) else None
+    if task is None:
+        data = getattr(_thread_data, 'locals', None)
+        if data is None and create:
+            data = _thread_data.locals = {}
+        return data
+
+    data = task._green_locals
+    if create:
+        if data is None:
+            data = task._green_locals = {}
+        elif task._green_locals_shared:
+            # Shared with the parent or a child task
+            data = task._green_locals = dict(
+                (key, attrs.copy()) for key, attrs in data.items())
+            task._green_locals_shared = False
+    return data
+
+
+class local(object):
+    """An object with attributes local to the current green task.
+
+    Subclasses can define methods and class attributes (as defaults),
+    but unlike with ``threading.local``, ``__init__`` isn't called
+    again for every task."""
+
+    __slots__ = ('__weakref__',)
+
+    def __getattribute__(self, name):
+        data = _get_data(False)
+        if data:
+            attrs = data.get(self)
+            if attrs is not None and name in attrs:
+                return attrs[name]
+        return object.__getattribute__(self, name)
+
+    def __setattr__(self, name, value):
+        data = _get_data(True)
+        attrs = data.get(self)
+        if attrs is None:
+            attrs = data[self] = {}
+        attrs[name] = value
+
+    def __delattr__(self, name):
+        data = _get_data(False)
+        if not data or name not in data.get(self, ()):
+            raise AttributeError(name)
+        del _get_data(True)[self][name]
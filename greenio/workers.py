@@ -0,0 +1,428 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Run a green server on all cores: one worker process per core.
+
+``run`` forks worker processes, each running a green event loop with
+``greenio.server.serve``, and supervises them::
+
+    def echo(sock, addr):
+        ...
+
+    greenio.workers.run(echo, '0.0.0.0', 8000)
+
+The listening sockets are created by the supervisor and inherited by
+the workers, or (with *reuse_port*) created by every worker with
+``SO_REUSEPORT``, so that the kernel balances connections between
+them.  Workers that die are restarted.  On SIGTERM or SIGINT the
+workers stop accepting connections and exit once their active
+connections are finished.  Workers send their stats to the supervisor
+over pipes; see ``Supervisor.stats``.
+
+Unix only.
+"""
+from __future__ import absolute_import
+import errno
+import json
+import os
+import select
+import signal
+import socket as std_socket
+import time
+import traceback
+
+from greenio import asyncio
+
+from . import GreenEventLoopPolicy
+from .server import Server, serve, _listen
+from .socket import _TRY_AGAIN
+
+
+__all__ = ['Supervisor', 'run']
+
+
+# Workers that die within this many seconds after starting are
+# restarted after RESTART_DELAY seconds, not to spin on a crash loop
+MIN_UPTIME = 1.0
+RESTART_DELAY = 1.0
+
+
+class _WorkerStats(object):
+    """Stats of a worker process, reported to the supervisor."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self.server = None
+        self.handled = 0
+        self.latency_total = 0.0
+        # Longest connection since the last report
+        self.latency_max = 0.0
+
+    def wrap(self, handler):
+        loop = self._loop
+
+        def measured(sock, addr):
+            started = loop.time()
+            try:
+                handler(sock, addr)
+            finally:
+                latency = loop.time() - started
+                self.handled += 1
+                self.latency_total += latency
+                if latency > self.latency_max:
+                    self.latency_max = latency
+
+        return measured
+
+    def report(self, fd):
+        stats = self.server.stats()
+        stats.update(pid=os.getpid(), handled=self.handled,
+                     latency_total=self.latency_total,
+                     latency_max=self.latency_max)
+        self.latency_max = 0.0
+        try:
+            os.write(fd, (json.dumps(stats) + '\n').encode('ascii'))
+        except OSError as exc:
+            # The supervisor doesn't keep up; it gets the next report
+            if exc.errno not in _TRY_AGAIN:
+                raise
+
+
+class _Worker(object):
+    def __init__(self, pid, fd):
+        self.pid = pid
+        self.fd = fd
+        self.started = time.time()
+        self.stats = {}
+        self._buffer = b''
+
+    def read_stats(self):
+        # Returns False on EOF
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as exc:
+            if exc.errno in _TRY_AGAIN:
+                return True
+            raise
+        if not data:
+            return False
+        lines = (self._buffer + data).split(b'\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            self.stats = json.loads(line.decode('ascii'))
+        return True
+
+
+def _set_nonblocking(fd):
+    import fcntl
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+class Supervisor(object):
+    """Runs *workers* processes (one per CPU by default) serving
+    connections with *handler*, see ``greenio.server.serve``.
+
+    Workers report their stats every *stats_interval* seconds, and
+    *on_stats* is called with the aggregated ``stats()`` as often.
+    On shutdown, workers get *shutdown_timeout* seconds to finish
+    their connections before they're killed.  Workers create their
+    event loops with *loop_factory*, if given (see ``greenio.install``).
+    """
+
+    def __init__(self, handler, host=None, port=None, workers=None,
+                 reuse_port=False, backlog=100, max_connections=1000,
+                 accept_batch=16, stats_interval=1.0, on_stats=None,
+                 shutdown_timeout=30.0, loop_factory=None):
+        if reuse_port and not hasattr(std_socket, 'SO_REUSEPORT'):
+            raise ValueError('reuse_port not supported by socket module')
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.workers = workers or _cpu_count()
+        self.reuse_port = reuse_port
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.accept_batch = accept_batch
+        self.stats_interval = stats_interval
+        self.on_stats = on_stats
+        self.shutdown_timeout = shutdown_timeout
+        self.loop_factory = loop_factory
+
+        self.sockets = []
+        self.restarts = 0
+        self._workers = {}
+        # Totals of the workers that exited
+        self._retired = {'accepted': 0, 'handled': 0, 'latency_total': 0.0}
+        self._last_report = None
+        self._stopping = False
+        self._wakeup_r = self._wakeup_w = None
+
+    # Supervisor side
+
+    def stats(self):
+        """Return the stats of all workers: the numbers of workers,
+        restarts, and accepted, active and handled connections; the
+        average handling time of connections (``latency_avg``), the
+        longest one since the last report (``latency_max``); and
+        handled connections per second since the previous call
+        (``throughput``)."""
+
+        totals = dict(self._retired)
+        active = 0
+        latency_max = 0.0
+        for worker in self._workers.values():
+            stats = worker.stats
+            for key in totals:
+                totals[key] += stats.get(key, 0)
+            active += stats.get('active', 0)
+            latency_max = max(latency_max, stats.get('latency_max', 0.0))
+
+        now = time.time()
+        throughput = 0.0
+        if self._last_report is not None:
+            last_time, last_handled = self._last_report
+            if now > last_time:
+                throughput = (totals['handled'] - last_handled) / \
+                    (now - last_time)
+        self._last_report = now, totals['handled']
+
+        handled = totals['handled']
+        latency_avg = 0.0
+        if handled:
+            latency_avg = totals['latency_total'] / handled
+        return {'workers': len(self._workers),
+                'restarts': self.restarts,
+                'accepted': totals['accepted'],
+                'active': active,
+                'handled': handled,
+                'latency_avg': latency_avg,
+                'latency_max': latency_max,
+                'throughput': throughput}
+
+    def pids(self):
+        return list(self._workers)
+
+    def stop(self):
+        """Stop the workers gracefully and make ``run`` return.  Can be
+        called from any thread, or from a signal handler."""
+
+        self._stopping = True
+        self._wakeup()
+
+    def _wakeup(self, *args):
+        if self._wakeup_w is not None:
+            try:
+                os.write(self._wakeup_w, b'\0')
+            except OSError:
+                pass
+
+    def _on_signal(self, signum, frame):
+        self.stop()
+
+    def run(self):
+        """Start the workers and supervise them until they have all
+        exited after ``stop`` (or SIGTERM/SIGINT).  Must be called from
+        the main thread."""
+
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        _set_nonblocking(self._wakeup_r)
+        _set_nonblocking(self._wakeup_w)
+        handlers = {}
+        for signum, handler in [(signal.SIGTERM, self._on_signal),
+                                (signal.SIGINT, self._on_signal),
+                                (signal.SIGCHLD, self._wakeup)]:
+            handlers[signum] = signal.signal(signum, handler)
+        try:
+            if not self.reuse_port:
+                self.sockets = _listen(self.host, self.port, self.backlog,
+                                       False)
+            self._supervise()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            for sock in self.sockets:
+                sock.close()
+            self.sockets = []
+            os.close(self._wakeup_r)
+            os.close(self._wakeup_w)
+            self._wakeup_r = self._wakeup_w = None
+
+    def _supervise(self):
+        restart_at = []
+        for i in range(self.workers):
+            self._spawn()
+        next_report = time.time() + self.stats_interval
+        signaled = False
+        kill_at = None
+
+        while self._workers or (restart_at and not self._stopping):
+            now = time.time()
+            if self._stopping:
+                restart_at = []
+                if not signaled:
+                    signaled = True
+                    kill_at = now + self.shutdown_timeout
+                    self._signal_all(signal.SIGTERM)
+                elif now >= kill_at:
+                    self._signal_all(signal.SIGKILL)
+                    kill_at = now + self.shutdown_timeout
+
+            timeouts = [next_report - now]
+            if restart_at:
+                timeouts.append(min(restart_at) - now)
+            if kill_at is not None:
+                timeouts.append(kill_at - now)
+            self._poll(max(min(timeouts), 0))
+
+            for worker in self._reap():
+                if self._stopping:
+                    continue
+                self.restarts += 1
+                if time.time() - worker.started < MIN_UPTIME:
+                    restart_at.append(time.time() + RESTART_DELAY)
+                else:
+                    self._spawn()
+
+            now = time.time()
+            while restart_at and min(restart_at) <= now and \
+                    not self._stopping:
+                restart_at.remove(min(restart_at))
+                self._spawn()
+
+            if now >= next_report:
+                next_report = now + self.stats_interval
+                if self.on_stats is not None:
+                    self.on_stats(self.stats())
+
+    def _poll(self, timeout):
+        fds = [self._wakeup_r] + [w.fd for w in self._workers.values()]
+        try:
+            ready = select.select(fds, [], [], timeout)[0]
+        except (OSError, select.error) as exc:
+            if exc.args[0] != errno.EINTR:
+                raise
+            return
+        for worker in list(self._workers.values()):
+            if worker.fd in ready:
+                worker.read_stats()
+        if self._wakeup_r in ready:
+            try:
+                while os.read(self._wakeup_r, 4096):
+                    pass
+            except OSError as exc:
+                if exc.errno not in _TRY_AGAIN:
+                    raise
+
+    def _reap(self):
+        exited = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as exc:
+                if exc.errno != errno.ECHILD:
+                    raise
+                break
+            if not pid:
+                break
+            worker = self._workers.pop(pid, None)
+            if worker is None:
+                continue
+            # Read the last report of the worker
+            while worker.read_stats():
+                pass
+            os.close(worker.fd)
+            for key in self._retired:
+                self._retired[key] += worker.stats.get(key, 0)
+            exited.append(worker)
+        return exited
+
+    def _signal_all(self, signum):
+        for pid in self._workers:
+            try:
+                os.kill(pid, signum)
+            except OSError as exc:
+                if exc.errno != errno.ESRCH:
+                    raise
+
+    def _spawn(self):
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if not pid:
+            status = 1
+            try:
+                os.close(rfd)
+                os.close(self._wakeup_r)
+                os.close(self._wakeup_w)
+                for worker in self._workers.values():
+                    os.close(worker.fd)
+                status = self._worker_main(wfd)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+
+        os.close(wfd)
+        _set_nonblocking(rfd)
+        self._workers[pid] = _Worker(pid, rfd)
+
+    # Worker side
+
+    def _worker_main(self, stats_fd):
+        # The supervisor stops the workers with SIGTERM; Ctrl+C in
+        # a terminal is sent to the workers as well, ignore it
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        _set_nonblocking(stats_fd)
+
+        policy = GreenEventLoopPolicy(self.loop_factory)
+        asyncio.set_event_loop_policy(policy)
+        loop = policy.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        stats = _WorkerStats(loop)
+        handler = stats.wrap(self.handler)
+        if self.reuse_port:
+            server = serve(handler, self.host, self.port,
+                           backlog=self.backlog,
+                           max_connections=self.max_connections,
+                           reuse_port=True, accept_batch=self.accept_batch,
+                           loop=loop)
+        else:
+            server = Server(handler, self.sockets,
+                            max_connections=self.max_connections,
+                            accept_batch=self.accept_batch, loop=loop)
+        stats.server = server
+
+        def report():
+            stats.report(stats_fd)
+            loop.call_later(self.stats_interval, report)
+
+        def drain():
+            loop.remove_signal_handler(signal.SIGTERM)
+            server.close()
+            server.wait_closed().add_done_callback(lambda fut: loop.stop())
+            loop.call_later(self.shutdown_timeout, loop.stop)
+
+        loop.add_signal_handler(signal.SIGTERM, drain)
+        loop.call_soon(report)
+        loop.run_forever()
+        stats.report(stats_fd)
+        return 0
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+
+
+def run(handler, host=None, port=None, workers=None, **kwargs):
+    """Serve connections with *handler* in *workers* processes until
+    SIGTERM or SIGINT, see ``Supervisor``."""
+
+    Supervisor(handler, host, port, workers, **kwargs).run()
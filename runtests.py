@@ -147,6 +147,8 @@ def runtests():
         print("Tests directory is not found: {}\n".format(testsdir))
         ARGS.print_help()
         return
+    # Test modules import their shared helpers (e.g. "_greentest")
+    sys.path.insert(0, testsdir)
 
     excludes = includes = []
     if args.exclude:
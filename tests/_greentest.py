@@ -0,0 +1,34 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+"""Base test case of the tests running green tasks."""
+
+
+import asyncio
+import greenio
+import unittest
+
+
+class GreenTestCase(unittest.TestCase):
+    """Runs every test with a new green event loop, ``self.loop``."""
+
+    def setUp(self):
+        policy = greenio.GreenEventLoopPolicy()
+        asyncio.set_event_loop_policy(policy)
+        self.loop = policy.new_event_loop()
+        policy.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop_policy(None)
+
+    def run_task(self, func, *args):
+        return self.loop.run_until_complete(greenio.task(func)(*args))
+
+    def run_tasks(self, *funcs):
+        return self.loop.run_until_complete(asyncio.gather(
+            *[greenio.task(func)() for func in funcs]))
+
+    def sleep(self, delay=0):
+        greenio.yield_from(asyncio.sleep(delay))
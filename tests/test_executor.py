@@ -0,0 +1,125 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import concurrent.futures
+import greenio
+import threading
+import time
+
+from greenio.executor import Executor, get_executor, set_executor
+from _greentest import GreenTestCase
+
+
+class ExecutorTests(GreenTestCase):
+    def tearDown(self):
+        get_executor(self.loop).close()
+        super(ExecutorTests, self).tearDown()
+
+    def test_run_in_executor(self):
+        ticks = []
+
+        def ticker():
+            while len(ticks) < 3:
+                ticks.append(1)
+                greenio.yield_from(asyncio.sleep(0.005))
+
+        def blocking(a, b):
+            time.sleep(0.05)
+            return a + b, threading.current_thread()
+
+        def test():
+            greenio.task(ticker)()
+            result, thread = greenio.run_in_executor(blocking, 1, 2)
+            self.assertEqual(result, 3)
+            self.assertIsNot(thread, threading.current_thread())
+            # The event loop wasn't blocked meanwhile
+            self.assertEqual(len(ticks), 3)
+
+            with self.assertRaises(ZeroDivisionError):
+                greenio.run_in_executor(lambda: 1 / 0)
+
+        self.run_task(test)
+        self.assertEqual(get_executor(self.loop).stats(), {
+            'running': 0, 'queued': 0, 'max_queued': 0,
+            'submitted': 2, 'completed': 2, 'limit': None})
+
+    def test_executor_limit(self):
+        executor = Executor(max_workers=4, limit=2, loop=self.loop)
+        self.addCleanup(executor.close)
+        set_executor(executor, self.loop)
+        order = []
+
+        def blocking(i):
+            order.append(i)
+            time.sleep(0.01)
+
+        def test():
+            tasks = [greenio.task(greenio.run_in_executor)(blocking, i)
+                     for i in range(6)]
+            greenio.yield_from(asyncio.sleep(0))
+            self.assertEqual(executor.stats()['running'], 2)
+            self.assertEqual(executor.stats()['queued'], 4)
+            greenio.yield_from(asyncio.wait(tasks))
+
+        self.run_task(test)
+        self.assertEqual(order, list(range(6)))
+        stats = executor.stats()
+        self.assertEqual(stats['max_queued'], 4)
+        self.assertEqual(stats['completed'], 6)
+        self.assertEqual(stats['running'], 0)
+
+    def test_executor_cancel(self):
+        pool = concurrent.futures.ThreadPoolExecutor(1)
+        self.addCleanup(pool.shutdown)
+        executor = Executor(pool, limit=1, loop=self.loop)
+        event = threading.Event()
+
+        def test():
+            running = greenio.task(executor.run)(event.wait)
+            queued = greenio.task(executor.run)(time.sleep, 0)
+            greenio.yield_from(asyncio.sleep(0))
+            queued.cancel()
+            running.cancel()
+            greenio.yield_from(asyncio.sleep(0))
+            self.assertTrue(running.cancelled())
+            self.assertTrue(queued.cancelled())
+            # The call keeps its slot until it's finished
+            self.assertEqual(executor.stats()['running'], 1)
+            event.set()
+            greenio.yield_from(asyncio.sleep(0.01))
+            self.assertEqual(executor.stats()['running'], 0)
+            self.assertEqual(executor.run(abs, -1), 1)
+
+        self.run_task(test)
+
+    def test_set_executor(self):
+        pool = concurrent.futures.ThreadPoolExecutor(1)
+        self.addCleanup(pool.shutdown)
+        set_executor(pool, self.loop)
+        executor = get_executor(self.loop)
+        self.assertIs(executor.executor, pool)
+
+        self.assertEqual(self.run_task(greenio.run_in_executor, abs, -5), 5)
+        executor.close()
+        # The pool wasn't created by the executor, so it's still usable
+        self.assertEqual(pool.submit(abs, -1).result(), 1)
+
+        with self.assertRaises(ValueError):
+            Executor(pool, limit=0, loop=self.loop)
+
+    def test_executor_doesnt_keep_loop_alive(self):
+        import gc
+        import weakref
+
+        loop = asyncio.SelectorEventLoop()
+        executor = get_executor(loop)
+        self.addCleanup(executor.close)
+        loop.close()
+        ref = weakref.ref(loop)
+        del loop
+        gc.collect()
+        self.assertIsNone(ref())
@@ -0,0 +1,157 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+
+from _greentest import GreenTestCase
+
+
+class FanoutTests(GreenTestCase):
+    def test_gather(self):
+        def child(value, delay):
+            self.sleep(delay)
+            return value
+
+        def fail():
+            raise ZeroDivisionError
+
+        def test():
+            self.assertEqual(greenio.gather(lambda: child(1, 0.02),
+                                            lambda: child(2, 0),
+                                            lambda: 3),
+                             [1, 2, 3])
+            self.assertEqual(greenio.gather(), [])
+
+            slow = []
+            with self.assertRaises(ZeroDivisionError):
+                greenio.gather(lambda: slow.append(child(1, 1)), fail)
+            results = greenio.gather(fail, lambda: 1,
+                                     return_exceptions=True)
+            self.assertIsInstance(results[0], ZeroDivisionError)
+            self.assertEqual(results[1], 1)
+            self.sleep(0.01)
+            # The slow child was cancelled
+            self.assertEqual(slow, [])
+
+        self.run_task(test)
+
+    def test_plain_results(self):
+        # Generators and futures returned by the functions are results
+        # like any other, not coroutines to run
+        gen = (i for i in range(3))
+        fut = asyncio.Future(loop=self.loop)
+
+        def test():
+            self.assertEqual(greenio.gather(lambda: gen, lambda: fut),
+                             [gen, fut])
+            self.assertEqual(list(greenio.map(lambda item: gen, [1])), [gen])
+            self.assertIs(greenio.first_completed(lambda: fut), fut)
+
+        self.run_task(test)
+        self.assertFalse(fut.done())
+
+    def test_gather_cancel(self):
+        cancelled = []
+
+        def child():
+            try:
+                self.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        def parent():
+            greenio.gather(child, child)
+
+        def test():
+            task = greenio.task(parent)()
+            self.sleep()
+            self.sleep()
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                greenio.yield_from(task)
+            self.sleep()
+            self.assertEqual(cancelled, [True, True])
+
+        self.run_task(test)
+
+    def test_map(self):
+        running = []
+        max_running = []
+
+        def work(delay):
+            running.append(delay)
+            max_running.append(len(running))
+            self.sleep(delay)
+            running.remove(delay)
+            return delay
+
+        delays = [0.03, 0.01, 0.02, 0]
+
+        def test():
+            results = greenio.map(work, delays, concurrency=2)
+            self.assertEqual(list(results), delays)
+            self.assertEqual(max(max_running), 2)
+
+            results = greenio.map(work, delays, ordered=False)
+            self.assertEqual(list(results), sorted(delays))
+            self.assertEqual(max(max_running), 4)
+
+            with self.assertRaises(ValueError):
+                greenio.map(work, delays, concurrency=0)
+
+        self.run_task(test)
+
+    def test_map_not_exported(self):
+        namespace = {}
+        exec('from greenio import *', namespace)
+        self.assertNotIn('map', namespace)
+        self.assertIn('gather', namespace)
+        self.assertIs(greenio.map, greenio.fanout.map)
+
+    def test_map_errors(self):
+        started = []
+
+        def work(item):
+            started.append(item)
+            self.sleep(0.01 * item)
+            return 1 / item
+
+        def test():
+            results = greenio.map(work, [1, 2, 0, 4, 5], concurrency=3)
+            with self.assertRaises(ZeroDivisionError):
+                list(results)
+            # No more items were started after the error
+            self.assertEqual(started, [1, 2, 0])
+
+            # Closing the generator early cancels the running children
+            results = greenio.map(work, range(1, 10))
+            self.assertEqual(next(results), 1)
+            results.close()
+            self.sleep(0.1)
+            self.assertEqual(len(started), 12)
+
+        self.run_task(test)
+
+    def test_first_completed(self):
+        def child(value, delay):
+            self.sleep(delay)
+            return value
+
+        def test():
+            self.assertEqual(greenio.first_completed(
+                lambda: child('slow', 0.5), lambda: child('fast', 0.01)),
+                'fast')
+            with self.assertRaises(KeyError):
+                greenio.first_completed(lambda: {}['x'],
+                                        lambda: child('slow', 0.5))
+            with self.assertRaises(ValueError):
+                greenio.first_completed()
+
+        started = self.loop.time()
+        self.run_task(test)
+        self.assertLess(self.loop.time() - started, 0.4)
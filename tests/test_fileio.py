@@ -0,0 +1,150 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+import os
+import shutil
+import tempfile
+import unittest
+
+from greenio import fileio
+from _greentest import GreenTestCase
+
+
+class FileIOTests(GreenTestCase):
+    def setUp(self):
+        super(FileIOTests, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def tearDown(self):
+        greenio.executor.get_executor(self.loop).close()
+        super(FileIOTests, self).tearDown()
+
+    def make_file(self, data):
+        path = os.path.join(self.tmpdir, 'data')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_file_read(self):
+        lines = [('line %d\n' % i).encode() * (i % 7 + 1) for i in range(5000)]
+        data = b''.join(lines)
+        path = self.make_file(data)
+
+        def test():
+            with fileio.open(path, 'rb', 4096) as f:
+                self.assertIsInstance(f, fileio.FileReader)
+                self.assertEqual(f.readline(), lines[0])
+                self.assertEqual(f.read(10), lines[1][:10])
+                self.assertEqual(f.tell(), len(lines[0]) + 10)
+                rest = f.read()
+            self.assertEqual(rest, data[len(lines[0]) + 10:])
+            self.assertTrue(f.closed)
+
+            with fileio.open(path) as f:
+                # A single chunk covers the whole file
+                self.assertEqual(f.read(), data)
+                self.assertEqual(f.recv_calls, 2)
+
+        self.run_tasks(test)
+
+    def test_file_mmap(self):
+        data = os.urandom(3 * fileio.CHUNK_SIZE + 100)
+        path = self.make_file(data)
+
+        def test():
+            with open(path, 'rb') as raw:
+                f = fileio.MappedFile(self.loop, raw.fileno(), closefd=False)
+                view = f.readexactly(10)
+                self.assertIsInstance(view, memoryview)
+                self.assertEqual(view, data[:10])
+                view.release()
+                self.assertEqual(f.prefaults, 1)
+                self.assertEqual(f.read(fileio.CHUNK_SIZE),
+                                 data[10:fileio.CHUNK_SIZE + 10])
+                self.assertEqual(f.peek(5)[:5], data[f.tell():f.tell() + 5])
+                pos = f.tell()
+                self.assertEqual(f.readline(),
+                                 data[pos:data.index(b'\n', pos) + 1])
+                f.read()
+                with self.assertRaises(asyncio.IncompleteReadError):
+                    f.readexactly(1)
+                f.close()
+
+        self.run_tasks(test)
+
+    def test_file_mmap_threshold(self):
+        path = self.make_file(b'spam\neggs\n' * 100)
+        self.addCleanup(setattr, fileio, 'MMAP_THRESHOLD',
+                        fileio.MMAP_THRESHOLD)
+        fileio.MMAP_THRESHOLD = 1000
+
+        def test():
+            with fileio.open(path) as f:
+                self.assertIsInstance(f, fileio.MappedFile)
+                self.assertEqual(f.readline(), b'spam\n')
+                self.assertEqual(f.readline(3), b'egg')
+                self.assertEqual(len(f.read()), 992)
+                self.assertEqual(f.readline(), b'')
+
+        self.run_tasks(test)
+
+    def test_file_write(self):
+        path = os.path.join(self.tmpdir, 'out')
+
+        def test():
+            with fileio.open(path, 'wb') as f:
+                self.assertIsInstance(f, fileio.FileWriter)
+                for i in range(1000):
+                    f.write(b'x' * 100)
+            with fileio.open(path, 'ab', 0) as f:
+                f.write(b'end')
+            with fileio.open(path) as f:
+                self.assertEqual(f.read(), b'x' * 100000 + b'end')
+            with self.assertRaisesRegex(ValueError, "invalid mode: 'r'"):
+                fileio.open(path, 'r')
+
+        self.run_tasks(test)
+
+    def test_pipe(self):
+        rfd, wfd = os.pipe()
+        received = []
+
+        def reader():
+            with fileio.open(rfd, 'rb') as f:
+                self.assertIsInstance(f, fileio.PipeReader)
+                received.append(f.readline())
+                received.append(f.read())
+
+        def writer():
+            with fileio.open(wfd, 'wb') as f:
+                self.assertIsInstance(f, fileio.PipeWriter)
+                f.write(b'hello\n')
+                greenio.yield_from(asyncio.sleep(0.01))
+                # More than the pipe buffer: waits for the reader
+                f.write(b'x' * 1000000)
+
+        self.run_tasks(reader, writer)
+        self.assertEqual(received, [b'hello\n', b'x' * 1000000])
+
+    @unittest.skipUnless(hasattr(os, 'mkfifo'), 'requires os.mkfifo')
+    def test_fifo(self):
+        path = os.path.join(self.tmpdir, 'fifo')
+        os.mkfifo(path)
+
+        def reader():
+            with fileio.open(path) as f:
+                self.assertIsInstance(f, fileio.PipeReader)
+                self.assertEqual(f.read(), b'data')
+
+        def writer():
+            greenio.yield_from(asyncio.sleep(0.01))
+            with fileio.open(path, 'wb') as f:
+                f.write(b'data')
+
+        self.run_tasks(reader, writer)
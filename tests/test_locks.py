@@ -0,0 +1,139 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+
+from greenio.locks import Lock, Semaphore, BoundedSemaphore, Event, Condition
+from _greentest import GreenTestCase
+
+
+class LockTests(GreenTestCase):
+    def test_lock_fifo(self):
+        lock = Lock(loop=self.loop)
+        order = []
+
+        def worker(name):
+            for i in range(2):
+                with lock:
+                    order.append(name)
+                    self.sleep()
+
+        def test():
+            tasks = [greenio.task(worker)(name) for name in 'abc']
+            self.sleep()
+            self.assertTrue(lock.locked())
+            greenio.yield_from(asyncio.wait(tasks))
+            self.assertFalse(lock.locked())
+
+        self.run_task(test)
+        # The lock is handed over to the waiting tasks in turn
+        self.assertEqual(order, list('abcabc'))
+
+    def test_lock_timeout(self):
+        lock = Lock(loop=self.loop)
+
+        def test():
+            self.assertTrue(lock.acquire())
+            self.assertFalse(lock.acquire(blocking=False))
+            self.assertFalse(lock.acquire(timeout=0.01))
+            lock.release()
+            with self.assertRaises(RuntimeError):
+                lock.release()
+
+        self.run_task(test)
+
+    def test_lock_cancel(self):
+        lock = Lock(loop=self.loop)
+
+        def test():
+            lock.acquire()
+            waiter = greenio.task(lock.acquire)()
+            self.sleep()
+            waiter.cancel()
+            self.sleep()
+            self.assertTrue(waiter.cancelled())
+            lock.release()
+            self.assertFalse(lock.locked())
+
+        self.run_task(test)
+
+    def test_semaphore(self):
+        sem = Semaphore(2, loop=self.loop)
+        active = []
+        seen = []
+
+        def worker():
+            with sem:
+                active.append(1)
+                seen.append(len(active))
+                self.sleep(0.001)
+                active.pop()
+
+        def test():
+            greenio.yield_from(asyncio.wait(
+                [greenio.task(worker)() for i in range(5)]))
+            self.assertFalse(sem.locked())
+
+        self.run_task(test)
+        self.assertEqual(max(seen), 2)
+
+        bounded = BoundedSemaphore(1, loop=self.loop)
+        with self.assertRaises(ValueError):
+            bounded.release()
+        with self.assertRaises(ValueError):
+            Semaphore(-1, loop=self.loop)
+
+    def test_event(self):
+        event = Event(loop=self.loop)
+
+        def test():
+            waiters = [greenio.task(event.wait)() for i in range(3)]
+            self.sleep()
+            self.assertFalse(event.wait(0.001))
+            event.set()
+            self.assertTrue(event.is_set())
+            self.assertEqual(greenio.yield_from(asyncio.gather(*waiters)),
+                             [True] * 3)
+            self.assertTrue(event.wait())
+            event.clear()
+            self.assertFalse(event.is_set())
+
+        self.run_task(test)
+
+    def test_condition(self):
+        cond = Condition(loop=self.loop)
+        items = []
+        consumed = []
+
+        def consumer():
+            with cond:
+                cond.wait_for(lambda: items)
+                consumed.append(items.pop(0))
+
+        def test():
+            tasks = [greenio.task(consumer)() for i in range(3)]
+            self.sleep()
+            with cond:
+                items.extend([1, 2])
+                cond.notify(2)
+            self.sleep()
+            self.assertEqual(consumed, [1, 2])
+            with cond:
+                items.append(3)
+                cond.notify_all()
+            greenio.yield_from(asyncio.wait(tasks))
+
+            with cond:
+                self.assertFalse(cond.wait(0.001))
+                self.assertTrue(cond.locked())
+            with self.assertRaises(RuntimeError):
+                cond.wait()
+            with self.assertRaises(RuntimeError):
+                cond.notify()
+
+        self.run_task(test)
+        self.assertEqual(consumed, [1, 2, 3])
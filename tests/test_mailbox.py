@@ -0,0 +1,131 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+import threading
+
+from greenio import mailbox
+from _greentest import GreenTestCase
+
+
+class MailboxTests(GreenTestCase):
+    def setUp(self):
+        super(MailboxTests, self).setUp()
+        # A second green loop, running in its own thread
+        self.other = asyncio.get_event_loop_policy().new_event_loop()
+        self.thread = threading.Thread(target=self.run_other)
+        self.thread.start()
+
+    def run_other(self):
+        asyncio.set_event_loop(self.other)
+        self.other.run_forever()
+
+    def tearDown(self):
+        self.other.call_soon_threadsafe(self.other.stop)
+        self.thread.join()
+        self.other.close()
+        super(MailboxTests, self).tearDown()
+
+    def test_call_in_loop(self):
+        def remote(value):
+            self.assertIs(asyncio.get_event_loop(), self.other)
+            greenio.yield_from(asyncio.sleep(0))
+            return value * 2
+
+        def call(value):
+            return greenio.call_in_loop(self.other, remote, value)
+
+        def test():
+            results = greenio.gather(*[
+                (lambda i=i: call(i)) for i in range(100)])
+            self.assertEqual(results, [i * 2 for i in range(100)])
+            # The same loop: called right away
+            self.assertEqual(greenio.call_in_loop(self.loop, len, 'abc'), 3)
+
+        self.run_task(test)
+        box = mailbox.get_mailbox(self.other)
+        self.assertEqual(box.posted, 100)
+        # Calls posted in one iteration of the loop woke it up once
+        self.assertLess(box.wakeups, 50)
+        # Results are posted back as the calls finish, while this loop
+        # may be running already
+        self.assertLess(mailbox.get_mailbox(self.loop).wakeups, 100)
+
+    def test_call_in_loop_plain_results(self):
+        gen = (i for i in range(3))
+        fut = asyncio.Future(loop=self.other)
+
+        def test():
+            self.assertIs(greenio.call_in_loop(self.other, lambda: gen), gen)
+            self.assertIs(greenio.call_in_loop(self.other, lambda: fut), fut)
+
+        self.run_task(test)
+        self.assertFalse(fut.done())
+
+    def test_mailbox_post_error(self):
+        loop = asyncio.SelectorEventLoop()
+        self.addCleanup(loop.close)
+        box = mailbox.Mailbox(loop)
+        calls = []
+
+        def fail(callback):
+            raise RuntimeError('Event loop is closed')
+
+        loop.call_soon_threadsafe = fail
+        with self.assertRaises(RuntimeError):
+            box.post(calls.append, 1)
+        del loop.call_soon_threadsafe
+
+        # The failed post doesn't block the next ones
+        box.post(calls.append, 2)
+        loop.run_until_complete(asyncio.sleep(0, loop=loop))
+        self.assertEqual(calls, [2])
+
+    def test_call_in_loop_error(self):
+        def fail():
+            raise ZeroDivisionError
+
+        def test():
+            with self.assertRaises(ZeroDivisionError):
+                greenio.call_in_loop(self.other, fail)
+
+        self.run_task(test)
+
+    def test_call_in_loop_cancel(self):
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        def remote():
+            started.set()
+            try:
+                greenio.yield_from(asyncio.sleep(10))
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        def test():
+            caller = greenio.task(greenio.call_in_loop)(self.other, remote)
+            while not started.is_set():
+                greenio.yield_from(asyncio.sleep(0.001))
+            caller.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                greenio.yield_from(caller)
+
+        self.run_task(test)
+        self.assertTrue(cancelled.wait(1))
+
+    def test_mailbox_doesnt_keep_loop_alive(self):
+        import gc
+        import weakref
+
+        loop = asyncio.SelectorEventLoop()
+        mailbox.get_mailbox(loop)
+        loop.close()
+        ref = weakref.ref(loop)
+        del loop
+        gc.collect()
+        self.assertIsNone(ref())
@@ -0,0 +1,204 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+import select
+import selectors
+import socket
+import time
+
+from greenio import monkey
+from _greentest import GreenTestCase
+
+
+class MonkeyTests(GreenTestCase):
+    def setUp(self):
+        super(MonkeyTests, self).setUp()
+        greenio.patch()
+        self.addCleanup(greenio.unpatch)
+
+    def test_patch_unpatch(self):
+        self.assertTrue(monkey.is_patched())
+        self.assertIs(socket.socket, monkey.GreenSocket)
+        self.assertIs(socket.create_connection, monkey.create_connection)
+        self.assertIs(select.select, monkey.select)
+        self.assertIs(selectors.DefaultSelector, monkey.GreenSelector)
+        self.assertIs(time.sleep, monkey.sleep)
+
+        greenio.unpatch()
+        self.assertFalse(monkey.is_patched())
+        self.assertIsNot(socket.socket, monkey.GreenSocket)
+        self.assertIsNot(time.sleep, monkey.sleep)
+
+        greenio.patch(socket=False, select=False)
+        self.assertIsNot(socket.socket, monkey.GreenSocket)
+        self.assertIs(time.sleep, monkey.sleep)
+
+    def test_patched_socket(self):
+        a, b = socket.socketpair()
+        self.assertIsInstance(a, monkey.GreenSocket)
+        self.assertEqual(a.type, socket.SOCK_STREAM)
+        self.assertIsNone(a.gettimeout())
+
+        def echo():
+            rfile = b.makefile('rb')
+            for line in rfile:
+                b.sendall(line.upper())
+            rfile.close()
+            b.close()
+
+        def client():
+            a.sendall(b'spam\n')
+            self.assertEqual(a.recv(5), b'SPAM\n')
+            a.sendall(b'x' * 1000000 + b'\n')
+            received = 0
+            while received < 1000001:
+                received += len(a.recv(65536))
+            a.settimeout(0.01)
+            with self.assertRaises(socket.timeout):
+                a.recv(1)
+            a.close()
+
+        self.run_tasks(echo, client)
+
+    def test_patched_socket_blocking(self):
+        # Outside of green tasks the sockets block as usual
+        a, b = socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        a.sendall(b'spam')
+        self.assertEqual(b.recv(4), b'spam')
+        b.settimeout(0.01)
+        with self.assertRaises(socket.timeout):
+            b.recv(1)
+        b.setblocking(False)
+        with self.assertRaises(BlockingIOError):
+            b.recv(1)
+
+    def test_patched_select_exceptional(self):
+        listener = socket.socket()
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        a = socket.create_connection(listener.getsockname())
+        self.addCleanup(a.close)
+        b, addr = listener.accept()
+        self.addCleanup(b.close)
+
+        def writer():
+            time.sleep(0.01)
+            a.send(b'!', socket.MSG_OOB)
+
+        def waiter():
+            self.assertEqual(select.select([], [], [b], 1), ([], [], [b]))
+
+        self.run_tasks(writer, waiter)
+
+    def high_fd_socketpair(self):
+        import os
+        import resource
+
+        # Beyond FD_SETSIZE, which "select.select" can't handle
+        fd = 1100
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft <= fd:
+            if hard != resource.RLIM_INFINITY and hard <= fd:
+                self.skipTest('RLIMIT_NOFILE is too low')
+            resource.setrlimit(resource.RLIMIT_NOFILE, (fd + 1, hard))
+            self.addCleanup(resource.setrlimit, resource.RLIMIT_NOFILE,
+                            (soft, hard))
+
+        a, b = socket.socketpair()
+        self.addCleanup(a.close)
+        os.dup2(b.fileno(), fd)
+        b.close()
+        b = socket.socket(fileno=fd)
+        self.addCleanup(b.close)
+        return a, b
+
+    def test_patched_high_fds(self):
+        a, b = self.high_fd_socketpair()
+
+        # Outside of green tasks
+        b.settimeout(0.01)
+        with self.assertRaises(socket.timeout):
+            b.recv(1)
+        self.assertEqual(select.select([b], [b], [], 0), ([], [b], []))
+        a.sendall(b'x')
+        self.assertEqual(select.select([b], [], [], 1), ([b], [], []))
+        self.assertEqual(b.recv(1), b'x')
+
+        def writer():
+            time.sleep(0.01)
+            a.sendall(b'y')
+
+        def waiter():
+            self.assertEqual(select.select([b], [], []), ([b], [], []))
+
+        self.run_tasks(writer, waiter)
+
+    def test_patched_create_connection(self):
+        listener = socket.socket()
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        addr = listener.getsockname()
+
+        def server():
+            conn, peer = listener.accept()
+            self.assertIsInstance(conn, monkey.GreenSocket)
+            conn.sendall(b'hello')
+            conn.close()
+
+        def client():
+            sock = socket.create_connection(addr, timeout=1)
+            self.assertEqual(sock.gettimeout(), 1)
+            self.assertEqual(sock.recv(5), b'hello')
+            sock.close()
+
+        self.run_tasks(server, client)
+
+    def test_patched_sleep(self):
+        def sleeper():
+            time.sleep(0.05)
+
+        started = time.time()
+        self.run_tasks(sleeper, sleeper, sleeper)
+        self.assertLess(time.time() - started, 0.1)
+
+        def cancelled():
+            task = greenio.task(sleeper)()
+            greenio.yield_from(asyncio.sleep(0))
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                greenio.yield_from(task)
+            self.assertEqual(len(greenio._get_timers(self.loop)), 0)
+
+        self.run_tasks(cancelled)
+
+    def test_patched_select(self):
+        a, b = socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+
+        def writer():
+            time.sleep(0.01)
+            a.sendall(b'x')
+
+        def waiter():
+            self.assertEqual(select.select([b], [], [], 0.001), ([], [], []))
+            self.assertEqual(select.select([b], [], []), ([b], [], []))
+
+            sel = selectors.DefaultSelector()
+            sel.register(b, selectors.EVENT_READ)
+            events = sel.select(1)
+            self.assertEqual([key.fileobj for key, mask in events], [b])
+            b.recv(1)
+            self.assertEqual(sel.select(0.001), [])
+            sel.close()
+
+        self.run_tasks(writer, waiter)
@@ -0,0 +1,176 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+
+from greenio.pool import Pool
+from _greentest import GreenTestCase
+
+
+class Connection:
+    def __init__(self, num):
+        self.num = num
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class PoolTests(GreenTestCase):
+    def setUp(self):
+        super(PoolTests, self).setUp()
+        self.opened = []
+
+    def factory(self):
+        conn = Connection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+    def test_pool_lifo_reuse(self):
+        pool = Pool(self.factory, maxsize=3, loop=self.loop)
+
+        def test():
+            c0 = pool.acquire()
+            c1 = pool.acquire()
+            pool.release(c0)
+            pool.release(c1)
+            self.assertIs(pool.acquire(), c1)
+            with pool.connection() as conn:
+                self.assertIs(conn, c0)
+            self.assertEqual(pool.stats(), {'size': 2, 'idle': 1,
+                                            'in_use': 1, 'waiters': 0,
+                                            'created': 2, 'evicted': 0})
+
+        self.run_task(test)
+
+    def test_pool_fill(self):
+        pool = Pool(self.factory, minsize=2, maxsize=3, loop=self.loop)
+        self.run_task(pool.fill)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+        with self.assertRaises(ValueError):
+            Pool(self.factory, minsize=2, maxsize=1, loop=self.loop)
+
+    def test_pool_waiters(self):
+        pool = Pool(self.factory, maxsize=1, loop=self.loop)
+        order = []
+
+        def user(name, delay):
+            with pool.connection() as conn:
+                order.append((name, conn.num))
+                greenio.yield_from(asyncio.sleep(delay))
+
+        def test():
+            tasks = [greenio.task(user)(name, 0.01) for name in 'abc']
+            greenio.yield_from(asyncio.sleep(0.005))
+            self.assertEqual(pool.stats()['waiters'], 2)
+            greenio.yield_from(asyncio.wait(tasks))
+
+        self.run_task(test)
+        self.assertEqual(order, [('a', 0), ('b', 0), ('c', 0)])
+        self.assertEqual(len(self.opened), 1)
+
+    def test_pool_acquire_timeout(self):
+        pool = Pool(self.factory, maxsize=1, timeout=0.01, loop=self.loop)
+
+        def test():
+            conn = pool.acquire()
+            with self.assertRaises(asyncio.TimeoutError):
+                pool.acquire()
+            self.assertEqual(pool.stats()['waiters'], 0)
+            pool.release(conn)
+
+        self.run_task(test)
+
+    def test_pool_acquire_cancel(self):
+        pool = Pool(self.factory, maxsize=1, loop=self.loop)
+
+        def test():
+            conn = pool.acquire()
+            waiter = greenio.task(pool.acquire)()
+            greenio.yield_from(asyncio.sleep(0))
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                greenio.yield_from(waiter)
+            self.assertEqual(pool.stats()['waiters'], 0)
+            pool.release(conn)
+
+        self.run_task(test)
+
+    def test_pool_discard_wakes_waiter(self):
+        pool = Pool(self.factory, maxsize=1, loop=self.loop)
+
+        def test():
+            conn = pool.acquire()
+            waiter = greenio.task(pool.acquire)()
+            greenio.yield_from(asyncio.sleep(0))
+            pool.release(conn, discard=True)
+            self.assertTrue(conn.closed)
+            self.assertEqual(greenio.yield_from(waiter).num, 1)
+
+        self.run_task(test)
+
+    def test_pool_check_and_idle_eviction(self):
+        pool = Pool(self.factory, maxsize=2, max_idle=0.01,
+                    check=lambda conn: conn.num != 0, loop=self.loop)
+
+        def test():
+            c0 = pool.acquire()
+            pool.release(c0)
+            # c0 fails the check
+            c1 = pool.acquire()
+            self.assertEqual(c1.num, 1)
+            pool.release(c1)
+            greenio.yield_from(asyncio.sleep(0.02))
+            # c1 has expired
+            self.assertEqual(pool.acquire().num, 2)
+
+        self.run_task(test)
+        self.assertEqual([conn.closed for conn in self.opened],
+                         [True, True, False])
+
+    def test_pool_idle_reaper(self):
+        pool = Pool(self.factory, minsize=1, maxsize=3, max_idle=0.01,
+                    loop=self.loop)
+
+        def test():
+            conns = [pool.acquire() for i in range(3)]
+            for conn in conns:
+                pool.release(conn)
+            # Expired connections are closed without using the pool
+            greenio.yield_from(asyncio.sleep(0.05))
+            self.assertEqual([conn.closed for conn in conns],
+                             [True, True, False])
+            self.assertEqual(pool.stats()['idle'], 1)
+            self.assertIsNone(pool._reaper)
+
+            pool.release(pool.acquire())
+            pool.release(pool.acquire())
+            self.assertIsNone(pool._reaper)
+            conn = pool.acquire()
+            pool.release(pool.acquire())
+            self.assertIsNotNone(pool._reaper)
+            pool.close()
+            self.assertIsNone(pool._reaper)
+            pool.release(conn)
+
+        self.run_task(test)
+
+    def test_pool_close(self):
+        pool = Pool(self.factory, maxsize=1, loop=self.loop)
+
+        def test():
+            conn = pool.acquire()
+            waiter = greenio.task(pool.acquire)()
+            greenio.yield_from(asyncio.sleep(0))
+            pool.close()
+            with self.assertRaisesRegex(RuntimeError, 'closed'):
+                greenio.yield_from(waiter)
+            pool.release(conn)
+            self.assertTrue(conn.closed)
+
+        self.run_task(test)
@@ -0,0 +1,96 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+
+from greenio.queues import Queue, Empty, Full
+from _greentest import GreenTestCase
+
+
+class QueueTests(GreenTestCase):
+    def test_queue_handoff(self):
+        queue = Queue(loop=self.loop)
+
+        def test():
+            getters = [greenio.task(queue.get)() for i in range(3)]
+            self.sleep()
+            queue.put_many([1, 2, 3, 4])
+            # The first three items went straight to the getters
+            self.assertEqual(queue.qsize(), 1)
+            self.assertEqual(greenio.yield_from(asyncio.gather(*getters)),
+                             [1, 2, 3])
+            self.assertEqual(queue.get(), 4)
+            self.assertTrue(queue.empty())
+
+        self.run_task(test)
+
+    def test_queue_bounded(self):
+        queue = Queue(2, loop=self.loop)
+
+        def producer():
+            queue.put_many(range(6))
+
+        def test():
+            task = greenio.task(producer)()
+            self.sleep()
+            self.assertTrue(queue.full())
+            self.assertEqual(queue.get_many(), [0, 1])
+            # The item of the blocked producer was moved into the queue
+            self.assertEqual(queue.qsize(), 1)
+            self.sleep()
+            self.assertTrue(queue.full())
+            self.assertEqual(queue.get(), 2)
+            self.sleep()
+            self.assertEqual(queue.get_many(2), [3, 4])
+            self.assertEqual(queue.get_many(10), [5])
+            greenio.yield_from(task)
+
+        self.run_task(test)
+
+    def test_queue_timeouts(self):
+        queue = Queue(1, loop=self.loop)
+
+        def test():
+            with self.assertRaises(Empty):
+                queue.get_nowait()
+            with self.assertRaises(Empty):
+                queue.get(timeout=0.001)
+            with self.assertRaises(Empty):
+                queue.get_many(timeout=0.001)
+            queue.put_nowait(1)
+            with self.assertRaises(Full):
+                queue.put_nowait(2)
+            with self.assertRaises(Full):
+                queue.put(2, timeout=0.001)
+            with self.assertRaises(Full):
+                queue.put_many([2, 3], timeout=0.001)
+            self.assertEqual(queue.get_many(), [1])
+
+        self.run_task(test)
+
+    def test_queue_pipeline(self):
+        queue = Queue(10, loop=self.loop)
+        received = []
+
+        def producer():
+            for i in range(0, 100, 5):
+                queue.put_many(range(i, i + 5))
+            queue.put(None)
+
+        def consumer():
+            while True:
+                for item in queue.get_many(7):
+                    if item is None:
+                        return
+                    received.append(item)
+
+        def test():
+            greenio.yield_from(asyncio.wait(
+                [greenio.task(producer)(), greenio.task(consumer)()]))
+
+        self.run_task(test)
+        self.assertEqual(received, list(range(100)))
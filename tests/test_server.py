@@ -0,0 +1,244 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+try:
+    import trollius
+except ImportError:
+    trollius = None
+if asyncio is None and trollius is None:
+    raise ImportError("asyncio and trollius modules are missing")
+
+try:
+    from trollius.test_utils import TestCase
+except ImportError:
+    from unittest import TestCase
+
+import greenio
+import greenio.socket as greensocket
+import greenio.server as greenserver
+
+import socket as std_socket
+
+
+def echo(sock, addr):
+    while True:
+        data = sock.recv(1024)
+        if not data:
+            break
+        sock.sendall(data)
+
+
+class ServerMixin(object):
+    asyncio = None
+    event_loop_policy = greenio.GreenEventLoopPolicy
+
+    def setUp(self):
+        policy = self.event_loop_policy()
+        self.asyncio.set_event_loop_policy(policy)
+        self.loop = policy.new_event_loop()
+        policy.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        self.asyncio.set_event_loop_policy(None)
+
+    def serve(self, handler, **kwargs):
+        server = greenserver.serve(handler, '127.0.0.1', 0, loop=self.loop,
+                                   **kwargs)
+        self.addCleanup(server.close)
+        return server, server.sockets[0].getsockname()
+
+    def test_server_echo(self):
+        server, addr = self.serve(echo)
+
+        def client(data):
+            sock = greensocket.create_connection(addr)
+            sock.sendall(data)
+            sock.shutdown(std_socket.SHUT_WR)
+            received = b''
+            while True:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    break
+                received += chunk
+            sock.close()
+            return received
+
+        def test():
+            clients = [greenio.task(client)(b'client' + str(i).encode())
+                       for i in range(10)]
+            greenio.yield_from(self.asyncio.wait(clients))
+            return [c.result() for c in clients]
+
+        results = self.loop.run_until_complete(greenio.task(test)())
+        self.assertEqual(results, [b'client' + str(i).encode()
+                                   for i in range(10)])
+        self.assertEqual(server.stats(), {'active': 0, 'accepted': 10,
+                                          'paused': False})
+
+    def test_server_max_connections(self):
+        active = []
+        seen = []
+
+        def handler(sock, addr):
+            active.append(sock)
+            seen.append(len(active))
+            sock.recv(1)
+            active.remove(sock)
+
+        server, addr = self.serve(handler, max_connections=2)
+
+        def test():
+            clients = [greensocket.create_connection(addr) for i in range(4)]
+            greenio.yield_from(self.asyncio.sleep(0.02))
+            self.assertEqual(len(active), 2)
+            self.assertTrue(server.stats()['paused'])
+            for sock in clients:
+                sock.sendall(b'x')
+            greenio.yield_from(self.asyncio.sleep(0.02))
+            for sock in clients:
+                sock.close()
+
+        self.loop.run_until_complete(greenio.task(test)())
+        self.assertEqual(server.accepted, 4)
+        self.assertLessEqual(max(seen), 2)
+        self.assertFalse(server.stats()['paused'])
+
+    def test_server_handler_error(self):
+        errors = []
+        self.loop.set_exception_handler(
+            lambda loop, context: errors.append(context['exception']))
+
+        def handler(sock, addr):
+            raise ZeroDivisionError
+
+        server, addr = self.serve(handler)
+
+        def test():
+            sock = greensocket.create_connection(addr)
+            # The connection is closed after the handler fails
+            self.assertEqual(sock.recv(1), b'')
+            sock.close()
+
+        self.loop.run_until_complete(greenio.task(test)())
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], ZeroDivisionError)
+        self.assertEqual(server.active, 0)
+
+    def test_server_close(self):
+        def handler(sock, addr):
+            sock.recv(1)
+
+        server, addr = self.serve(handler)
+
+        def test():
+            sock = greensocket.create_connection(addr)
+            greenio.yield_from(self.asyncio.sleep(0.01))
+            server.close()
+            closed = server.wait_closed()
+            greenio.yield_from(self.asyncio.sleep(0.01))
+            self.assertFalse(closed.done())
+            sock.sendall(b'x')
+            greenio.yield_from(closed)
+            sock.close()
+
+            with self.assertRaises(greensocket.error):
+                greensocket.create_connection(addr)
+
+        self.loop.run_until_complete(greenio.task(test)())
+
+    def test_server_accept_errors(self):
+        import errno
+
+        errors = []
+        self.loop.set_exception_handler(
+            lambda loop, context: errors.append(context['exception']))
+        a, b = std_socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+
+        class Listener(object):
+            accepts = 0
+
+            def __init__(self, *errnos):
+                self.errnos = list(errnos)
+
+            def setblocking(self, flag):
+                pass
+
+            def fileno(self):
+                return b.fileno()
+
+            def accept(self):
+                Listener.accepts += 1
+                if len(self.errnos) == 1:
+                    # The last error is EAGAIN, the backlog is empty
+                    b.recv(1)
+                raise greensocket.error(self.errnos.pop(0), 'accept')
+
+            def close(self):
+                pass
+
+        # Clients that went away are skipped; "b" is readable like a
+        # listening socket with connections in its backlog
+        a.sendall(b'x')
+        server = greenserver.Server(
+            echo, [Listener(errno.ECONNABORTED, errno.EPROTO, errno.EAGAIN)],
+            loop=self.loop)
+        self.loop.run_until_complete(self.asyncio.sleep(0.01))
+        server.close()
+        self.assertEqual(errors, [])
+        self.assertEqual(Listener.accepts, 3)
+
+        # Out of descriptors: accepting is paused for a while
+        self.addCleanup(setattr, greenserver, 'ACCEPT_RETRY_DELAY',
+                        greenserver.ACCEPT_RETRY_DELAY)
+        greenserver.ACCEPT_RETRY_DELAY = 0.05
+        Listener.accepts = 0
+        a.sendall(b'x')
+        server = greenserver.Server(
+            echo, [Listener(errno.EMFILE, errno.EAGAIN)], loop=self.loop)
+        self.loop.run_until_complete(self.asyncio.sleep(0.02))
+        self.assertEqual(Listener.accepts, 1)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].errno, errno.EMFILE)
+        self.assertTrue(server.stats()['paused'])
+        self.loop.run_until_complete(self.asyncio.sleep(0.1))
+        self.assertEqual(Listener.accepts, 2)
+        self.assertFalse(server.stats()['paused'])
+        server.close()
+
+    def test_server_sock(self):
+        listener = std_socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(10)
+        with self.assertRaises(ValueError):
+            greenserver.serve(echo, '127.0.0.1', sock=listener,
+                              loop=self.loop)
+
+        server = greenserver.serve(echo, sock=listener, loop=self.loop)
+        self.addCleanup(server.close)
+        self.assertEqual(server.sockets, [listener])
+
+if asyncio is not None:
+    class ServerTests(ServerMixin, TestCase):
+        asyncio = asyncio
+        event_loop_policy = greenio.GreenEventLoopPolicy
+
+if trollius is not None:
+    class TrolliusServerTests(ServerMixin, TestCase):
+        asyncio = trollius
+        event_loop_policy = greenio.GreenTrolliusEventLoopPolicy
+
+        def setUp(self):
+            super(TrolliusServerTests, self).setUp()
+            if asyncio is not None:
+                policy = trollius.get_event_loop_policy()
+                asyncio.set_event_loop_policy(policy)
@@ -23,6 +23,7 @@ except ImportError:
 import greenio
 import greenio.socket as greensocket
 
+import errno
 import socket as std_socket
 
 
@@ -54,7 +55,7 @@ class SocketMixin(object):
 
     def test_socket_setblocking(self):
         sock = greensocket.socket()
-        self.assertEquals(sock.gettimeout(), 0)
+        self.assertEquals(sock._sock.gettimeout(), 0)
         with self.assertRaisesRegex(
                 greensocket.error, 'does not support blocking mode'):
             sock.setblocking(True)
@@ -200,6 +201,399 @@ class SocketMixin(object):
         thread.join(1)
         self.assertEqual(non_local['check'], 1)
 
+    def test_socket_recv_ready(self):
+        a, b = std_socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        calls = []
+
+        def reader():
+            sock = greensocket.socket.from_socket(a)
+            b.sendall(b'ready')
+            self.loop.call_soon(calls.append, 'loop')
+            self.assertEqual(sock.recv(1024), b'ready')
+            calls.append('recv')
+
+            self.loop.call_later(0.01, b.sendall, b'later')
+            self.assertEqual(sock.recv(1024), b'later')
+            calls.append('recv')
+
+        self.loop.run_until_complete(greenio.task(reader)())
+        self.assertEqual(calls, ['recv', 'loop', 'recv'])
+
+    def test_socket_recv_cancel(self):
+        a, b = std_socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+
+        def reader():
+            greensocket.socket.from_socket(a).recv(1024)
+
+        task = greenio.task(reader)()
+        self.loop.call_later(0.01, task.cancel)
+        self.assertRaises(greenio.asyncio.CancelledError,
+                          self.loop.run_until_complete, task)
+        self.assertTrue(task.cancelled())
+        # the reader callback was removed
+        self.assertFalse(self.loop.remove_reader(a.fileno()))
+
+    def test_socket_datagrams(self):
+        def udp():
+            sock = greensocket.socket(std_socket.AF_INET,
+                                      std_socket.SOCK_DGRAM)
+            self.addCleanup(sock.close)
+            sock.bind(('127.0.0.1', 0))
+            return sock
+
+        def test():
+            a, b = udp(), udp()
+            addr_a, addr_b = a.getsockname(), b.getsockname()
+
+            self.loop.call_later(0.01, a.sendto, b'ping', addr_b)
+            self.assertEqual(b.recvfrom(1024), (b'ping', addr_a))
+            a.sendto(b'pong', 0, addr_b)
+            buf = bytearray(10)
+            self.assertEqual(b.recvfrom_into(buf), (4, addr_a))
+            self.assertEqual(buf[:4], b'pong')
+
+            b.connect(addr_a)
+            b.sendto(b'spam', addr_a)
+            self.assertEqual(a.recv_into(buf, 2), 2)
+            self.assertEqual(buf[:2], b'sp')
+
+            b.settimeout(0.01)
+            self.assertRaises(greensocket.timeout, b.recvfrom, 1024)
+
+        self.loop.run_until_complete(greenio.task(test)())
+
+    def test_socket_recv_many(self):
+        a = std_socket.socket(std_socket.AF_INET, std_socket.SOCK_DGRAM)
+        self.addCleanup(a.close)
+        a.bind(('127.0.0.1', 0))
+        b = greensocket.socket(std_socket.AF_INET, std_socket.SOCK_DGRAM)
+        self.addCleanup(b.close)
+        b.bind(('127.0.0.1', 0))
+        addr_a, addr_b = a.getsockname(), b.getsockname()
+        buffers = [bytearray(16) for i in range(4)]
+
+        def send(*datagrams):
+            for data in datagrams:
+                a.sendto(data, addr_b)
+
+        def test():
+            self.loop.call_later(0.01, send, b'1', b'22', b'333')
+            # All the queued datagrams are received at once
+            self.assertEqual(b.recv_many(buffers),
+                             [(1, addr_a), (2, addr_a), (3, addr_a)])
+            self.assertEqual(bytes(buffers[2][:3]), b'333')
+
+            send(*[b'x'] * 6)
+            self.assertEqual(len(b.recv_many(buffers)), 4)
+            self.assertEqual(len(b.recv_many(buffers)), 2)
+            self.assertEqual(b.recv_many([]), [])
+
+        self.loop.run_until_complete(greenio.task(test)())
+
+    def test_socket_connect_refused(self):
+        listener = std_socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        addr = listener.getsockname()
+        listener.close()
+
+        def client():
+            sock = greensocket.socket()
+            try:
+                with self.assertRaises(std_socket.error) as cm:
+                    sock.connect(addr)
+                self.assertEqual(cm.exception.errno, errno.ECONNREFUSED)
+            finally:
+                sock.close()
+
+        self.loop.run_until_complete(greenio.task(client)())
+
+    def test_socket_timeout(self):
+        a, b = std_socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+
+        def reader():
+            sock = greensocket.socket.from_socket(a)
+            self.assertIsNone(sock.gettimeout())
+            sock.settimeout(0.01)
+            self.assertEqual(sock.gettimeout(), 0.01)
+            self.assertRaises(greensocket.timeout, sock.recv, 1024)
+            self.assertRaises(greensocket.timeout,
+                              sock.makefile('rb').read, 1024)
+
+            self.loop.call_later(0.001, b.sendall, b'data')
+            self.assertEqual(sock.recv(1024), b'data')
+
+            sock.settimeout(0)
+            self.assertIsNone(sock.gettimeout())
+            self.assertRaises(ValueError, sock.settimeout, -1)
+
+        self.loop.run_until_complete(greenio.task(reader)())
+        self.assertFalse(self.loop.remove_reader(a.fileno()))
+
+    def test_socket_timeout_many(self):
+        socks = [std_socket.socketpair() for i in range(10)]
+        for a, b in socks:
+            self.addCleanup(a.close)
+            self.addCleanup(b.close)
+        results = []
+
+        def reader(sock, timeout):
+            sock = greensocket.socket.from_socket(sock)
+            sock.settimeout(timeout)
+            try:
+                results.append(sock.recv(1024))
+            except greensocket.timeout:
+                results.append(timeout)
+
+        def test():
+            tasks = [greenio.task(reader)(a, 0.02 * (i + 1))
+                     for i, (a, b) in enumerate(socks)]
+            # these two get data before their timeouts
+            socks[1][1].sendall(b'1')
+            self.loop.call_later(0.03, socks[5][1].sendall, b'5')
+            greenio.yield_from(self.asyncio.wait(tasks))
+
+        self.loop.run_until_complete(greenio.task(test)())
+        self.assertEqual(
+            results, [b'1', 0.02, b'5', 0.06, 0.08, 0.1, 0.14, 0.16,
+                      0.18, 0.2])
+
+    def test_files_read_methods(self):
+        def reader(sock, buffering):
+            rfile = greensocket.socket.from_socket(sock).makefile(
+                'rb', buffering)
+
+            self.assertEqual(rfile.readline(), b'line one\n')
+            self.assertEqual(rfile.peek()[:1].tobytes(), b'l')
+            self.assertEqual(rfile.read(5), b'line ')
+            self.assertEqual(rfile.readexactly(4).tobytes(), b'two\n')
+            self.assertEqual(rfile.readline(2), b'ab')
+
+            buf = bytearray(3)
+            self.assertEqual(rfile.readinto(buf), 3)
+            self.assertEqual(buf, b'cde')
+
+            with self.assertRaises(greenio.asyncio.IncompleteReadError) as cm:
+                rfile.readexactly(10)
+            self.assertEqual(cm.exception.partial, b'fgh')
+            self.assertEqual(rfile.read(10), b'')
+            self.assertEqual(rfile.readline(), b'')
+
+        for buffering in (None, 4):
+            a, b = std_socket.socketpair()
+            self.addCleanup(a.close)
+            self.addCleanup(b.close)
+            b.sendall(b'line one\nline two\nabcdefgh')
+            b.shutdown(std_socket.SHUT_WR)
+
+            self.loop.run_until_complete(
+                greenio.task(reader)(a, buffering))
+
+    def test_files_read_exact(self):
+        a, b = std_socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+
+        def reader():
+            rfile = greensocket.socket.from_socket(a).makefile('rb')
+
+            b.sendall(b'abc')
+            self.loop.call_later(0.01, b.sendall, b'def')
+            self.assertEqual(rfile.read(6), b'abc')
+            self.assertEqual(rfile.last_recv_calls, 1)
+
+            rfile.exact = True
+            self.assertEqual(rfile.read(3), b'def')
+            b.sendall(b'ghi')
+            self.loop.call_later(0.01, b.sendall, b'jkl')
+            self.assertEqual(rfile.read(6), b'ghijkl')
+            self.assertEqual(rfile.last_recv_calls, 2)
+
+            b.close()
+            self.assertEqual(rfile.read(6), b'')
+            self.assertEqual(rfile.reads, 4)
+            self.assertEqual(rfile.recv_calls, 5)
+
+        self.loop.run_until_complete(greenio.task(reader)())
+
+    def test_files_write_buffering(self):
+        a, b = std_socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        b.setblocking(False)
+
+        def echo():
+            b.sendall(b.recv(1024))
+
+        def writer():
+            sock = greensocket.socket.from_socket(a)
+            wfile = sock.makefile('wb', 16)
+            rfile = sock.makefile('rb')
+
+            wfile.write(b'hello ')
+            wfile.write(bytearray(b'world'))
+            self.assertRaises(std_socket.error, b.recv, 1024)
+            wfile.flush()
+            self.assertEqual(b.recv(1024), b'hello world')
+
+            wfile.write(b'0123456789abcdef')
+            self.assertEqual(b.recv(1024), b'0123456789abcdef')
+
+            # pending writes are sent before waiting for a response
+            self.loop.add_reader(b.fileno(), echo)
+            wfile.write(b'ping')
+            self.assertEqual(rfile.read(4), b'ping')
+            self.loop.remove_reader(b.fileno())
+
+            # a flush larger than the socket buffer is sent in parts
+            received = bytearray()
+            self.loop.add_reader(
+                b.fileno(), lambda: received.extend(b.recv(65536)))
+            wfile = sock.makefile('wb', 1 << 22)
+            for i in range(32):
+                wfile.write(bytearray([i]) * 65536)
+            wfile.flush()
+            while len(received) < 32 * 65536:
+                greenio.yield_from(greenio.asyncio.sleep(0.01))
+            self.assertEqual(received[::65536], bytearray(range(32)))
+            self.loop.remove_reader(b.fileno())
+
+        self.loop.run_until_complete(greenio.task(writer)())
+
+    def test_files_flushed_before_direct_writes(self):
+        a, b = std_socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+
+        def writer():
+            sock = greensocket.socket.from_socket(a)
+            wfile = sock.makefile('wb', 1024)
+
+            # buffered data goes out before data sent on the socket
+            wfile.write(b'hdr')
+            sock.sendall(b'BODY')
+            self.assertEqual(b.recv(1024), b'hdrBODY')
+            wfile.write(b'hdr')
+            sock.send(b'BODY')
+            self.assertEqual(b.recv(1024), b'hdrBODY')
+
+            # closed files are no longer flushed by the socket
+            wfile.close()
+            self.assertEqual(sock._wfiles, [])
+
+            # and closing the socket sends what's still buffered
+            wfile = sock.makefile('wb', 1024)
+            wfile.write(b'bye')
+            sock.close()
+            self.assertEqual(b.recv(1024), b'bye')
+            self.assertEqual(b.recv(1024), b'')
+
+        self.loop.run_until_complete(greenio.task(writer)())
+
+    def patch_getaddrinfo(self, infos):
+        calls = []
+
+        def getaddrinfo(host, port, **kwargs):
+            calls.append((host, port))
+            fut = self.asyncio.Future(loop=self.loop)
+            fut.set_result(infos)
+            return fut
+
+        self.loop.getaddrinfo = getaddrinfo
+        greensocket.resolver_cache.clear()
+        self.addCleanup(greensocket.resolver_cache.clear)
+        return calls
+
+    def test_socket_getaddrinfo_cache(self):
+        infos = [(std_socket.AF_INET, std_socket.SOCK_STREAM, 6, '',
+                  ('127.0.0.1', 80))]
+        calls = self.patch_getaddrinfo(infos)
+
+        def test():
+            for i in range(2):
+                self.assertEqual(
+                    greensocket.getaddrinfo('example.com', 80), infos)
+
+        self.loop.run_until_complete(greenio.task(test)())
+        self.assertEqual(calls, [('example.com', 80)])
+
+    def test_socket_resolver_cache(self):
+        cache = greensocket.ResolverCache(maxsize=2, ttl=10)
+        cache.put('a', 1, 0)
+        cache.put('b', 2, 0)
+        self.assertEqual(cache.get('a', 1), 1)
+        cache.put('c', 3, 2)
+        # "b" was the least recently used entry
+        self.assertIsNone(cache.get('b', 2))
+        self.assertEqual(cache.get('a', 2), 1)
+        self.assertEqual(cache.get('c', 2), 3)
+        self.assertIsNone(cache.get('a', 10))
+        self.assertEqual(len(cache), 1)
+
+    def test_socket_create_connection(self):
+        import time
+
+        listener = std_socket.socket()
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+
+        closed = std_socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        closed_addr = closed.getsockname()
+        closed.close()
+
+        # connections to a listener with a full backlog hang
+        full = std_socket.socket()
+        self.addCleanup(full.close)
+        full.bind(('127.0.0.1', 0))
+        full.listen(0)
+        full_addr = full.getsockname()
+        for i in range(3):
+            filler = std_socket.socket()
+            self.addCleanup(filler.close)
+            filler.setblocking(False)
+            filler.connect_ex(full_addr)
+
+        tcp = (std_socket.AF_INET, std_socket.SOCK_STREAM, 6, '')
+        self.patch_getaddrinfo([
+            # unroutable (TEST-NET-1), never answers or fails
+            tcp + (('192.0.2.1', 80),),
+            tcp + (closed_addr,),
+            tcp + (listener.getsockname(),)])
+
+        def test():
+            started = time.time()
+            sock = greensocket.create_connection(('example.com', 80),
+                                                 delay=0.05)
+            self.assertLess(time.time() - started, 1)
+            self.assertEqual(sock.getpeername(), listener.getsockname())
+            sock.close()
+
+            # the error of the (last) failed attempt is raised
+            self.patch_getaddrinfo([tcp + (closed_addr,)])
+            with self.assertRaises(greensocket.error) as cm:
+                greensocket.create_connection(('example.com', 80))
+            self.assertEqual(cm.exception.errno, errno.ECONNREFUSED)
+
+            self.patch_getaddrinfo([tcp + (full_addr,)])
+            started = time.time()
+            with self.assertRaises(greensocket.timeout):
+                greensocket.create_connection(('example.com', 80), 0.01)
+            self.assertLess(time.time() - started, 1)
+
+            self.patch_getaddrinfo([tcp + (closed_addr,),
+                                    tcp + (full_addr,)])
+            with self.assertRaises(greensocket.timeout):
+                greensocket.create_connection(('example.com', 80), 0.01)
+
+        self.loop.run_until_complete(greenio.task(test)())
+
 if asyncio is not None:
     class SocketTests(SocketMixin, TestCase):
         asyncio = asyncio
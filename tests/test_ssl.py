@@ -0,0 +1,177 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+import os
+import socket
+import ssl
+import unittest
+
+from greenio import socket as greensocket
+from greenio import ssl as greenssl
+
+
+CERTFILE = os.path.join(os.path.dirname(__file__), 'keycert.pem')
+
+
+@unittest.skipUnless(hasattr(ssl, 'PROTOCOL_TLS_SERVER'),
+                     'requires Python 3.6+')
+class SSLTests(unittest.TestCase):
+    def setUp(self):
+        policy = greenio.GreenEventLoopPolicy()
+        asyncio.set_event_loop_policy(policy)
+        self.loop = policy.new_event_loop()
+        policy.set_event_loop(self.loop)
+
+        self.server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.server_context.load_cert_chain(CERTFILE)
+        self.client_context = greenssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.client_context.load_verify_locations(CERTFILE)
+        # Sessions of TLS 1.3 arrive after the handshake, with data
+        self.client_context.options |= ssl.OP_NO_TLSv1_3
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop_policy(None)
+
+    def socketpair(self):
+        a, b = socket.socketpair()
+        return (greensocket.socket.from_socket(a),
+                greensocket.socket.from_socket(b))
+
+    def run_tasks(self, *funcs):
+        return self.loop.run_until_complete(asyncio.gather(
+            *[greenio.task(func)() for func in funcs]))
+
+    def test_ssl_echo(self):
+        a, b = self.socketpair()
+        data = os.urandom(1000000)
+
+        def server():
+            conn = greenssl.wrap_socket(b, self.server_context,
+                                        server_side=True)
+            received = bytearray()
+            while len(received) < len(data):
+                received += conn.recv(65536)
+            conn.sendall(received)
+            buf = bytearray(10)
+            self.assertEqual(conn.recv_into(buf), 0)
+            conn.close()
+
+        def client():
+            conn = self.client_context.wrap_socket(
+                a, server_hostname='localhost')
+            self.assertIsInstance(conn, greenssl.SSLSocket)
+            self.assertEqual(
+                dict(item[0] for item in conn.getpeercert()['subject']),
+                {'commonName': 'localhost'})
+            conn.sendall(data)
+            received = bytearray()
+            while len(received) < len(data):
+                received += conn.recv(65536)
+            self.assertEqual(received, data)
+            conn.close()
+
+        self.run_tasks(server, client)
+
+    def test_ssl_makefile(self):
+        a, b = self.socketpair()
+
+        def server():
+            conn = greenssl.wrap_socket(b, self.server_context,
+                                        server_side=True)
+            with conn.makefile('rwb') as f:
+                f.write(f.readline().upper())
+                f.flush()
+            conn.close()
+
+        def client():
+            conn = self.client_context.wrap_socket(
+                a, server_hostname='localhost')
+            with conn.makefile('w') as f:
+                f.write('hello\n')
+            with conn.makefile() as f:
+                self.assertEqual(f.read(), 'HELLO\n')
+            conn.close()
+
+        self.run_tasks(server, client)
+
+    def test_ssl_plain_socket(self):
+        a, b = socket.socketpair()
+        self.addCleanup(a.close)
+        self.addCleanup(b.close)
+        conn = self.client_context.wrap_socket(
+            a, server_hostname='localhost', do_handshake_on_connect=False)
+        self.assertIsInstance(conn, ssl.SSLSocket)
+        self.assertIsNone(conn.session)
+
+    def test_ssl_verify_failed(self):
+        a, b = self.socketpair()
+
+        def server():
+            with self.assertRaises(ssl.SSLError):
+                greenssl.wrap_socket(b, self.server_context,
+                                     server_side=True)
+            b.close()
+
+        def client():
+            with self.assertRaises(ssl.SSLError):
+                greenssl.wrap_socket(a, server_hostname='localhost')
+            a.close()
+
+        self.run_tasks(server, client)
+
+    def test_ssl_session_resumption(self):
+        listener = socket.socket()
+        self.addCleanup(listener.close)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(2)
+        listener = greensocket.socket.from_socket(listener)
+        addr = listener.getsockname()
+        reused = []
+
+        def server():
+            for i in range(2):
+                sock, peer = listener.accept()
+                conn = greenssl.wrap_socket(sock, self.server_context,
+                                            server_side=True)
+                conn.sendall(conn.recv(5))
+                conn.close()
+
+        def client():
+            for i in range(2):
+                sock = greensocket.create_connection(addr)
+                conn = self.client_context.wrap_socket(
+                    sock, server_hostname='localhost')
+                reused.append(conn.session_reused)
+                conn.sendall(b'hello')
+                self.assertEqual(conn.recv(5), b'hello')
+                conn.close()
+
+        self.run_tasks(server, client)
+        self.assertEqual(reused, [False, True])
+        cache = greenssl.get_session_cache(self.client_context)
+        self.assertEqual(len(cache), 1)
+
+    def test_session_cache(self):
+        cache = greenssl.SessionCache(maxsize=2)
+
+        class Session:
+            time = 0
+            timeout = 1e12
+
+        for key in 'abc':
+            cache.put(key, Session())
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('b'))
+
+        expired = Session()
+        expired.timeout = 0
+        cache.put('d', expired)
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(len(cache), 1)
@@ -0,0 +1,95 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import subprocess as std_subprocess
+import sys
+import time
+import unittest
+
+from greenio import subprocess
+from _greentest import GreenTestCase
+
+
+PYTHON = [sys.executable, '-c']
+
+
+class SubprocessTests(GreenTestCase):
+    def test_popen_pipes(self):
+        code = ('import sys\n'
+                'for line in sys.stdin:\n'
+                '    sys.stdout.write(line.upper())\n'
+                '    sys.stdout.flush()\n'
+                'sys.stderr.write("done")\n')
+
+        def test():
+            proc = subprocess.Popen(PYTHON + [code], stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            self.assertIsNone(proc.poll())
+            proc.stdin.write(b'spam\n')
+            self.assertEqual(proc.stdout.readline(), b'SPAM\n')
+            # Large output doesn't deadlock
+            out, err = proc.communicate(b'x' * 1000000 + b'\n')
+            self.assertEqual(out, b'X' * 1000000 + b'\n')
+            self.assertEqual(err, b'done')
+            self.assertEqual(proc.returncode, 0)
+            self.assertEqual(proc.poll(), 0)
+
+        self.run_tasks(test)
+
+    @unittest.skipUnless(hasattr(std_subprocess, 'run'), 'requires Python 3.5+')
+    def test_run(self):
+        def test():
+            result = subprocess.run(
+                PYTHON + ['import sys; sys.stdout.write(sys.stdin.read()); '
+                          'sys.exit(3)'],
+                input=b'data', stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT)
+            self.assertEqual(result.returncode, 3)
+            self.assertEqual(result.stdout, b'data')
+            self.assertIsNone(result.stderr)
+
+        self.run_tasks(test)
+
+    def test_check_output(self):
+        def test():
+            self.assertEqual(
+                subprocess.check_output(
+                    PYTHON + ['import sys; print(sys.stdin.read())'],
+                    input=b'data'),
+                b'data\n')
+            self.assertEqual(
+                subprocess.check_output('echo $((6 * 7))', shell=True),
+                b'42\n')
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                subprocess.check_output(PYTHON + ['print(1); exit(1)'])
+            self.assertEqual(cm.exception.output, b'1\n')
+
+        self.run_tasks(test)
+
+    def test_timeout(self):
+        def test():
+            with self.assertRaises(subprocess.TimeoutExpired):
+                subprocess.check_output(
+                    PYTHON + ['import time; time.sleep(10)'], timeout=0.1)
+
+            proc = subprocess.Popen(PYTHON + ['import time; time.sleep(10)'])
+            with self.assertRaises(subprocess.TimeoutExpired):
+                proc.wait(0.01)
+            proc.terminate()
+            self.assertLess(proc.wait(), 0)
+
+        self.run_tasks(test)
+
+    def test_concurrent(self):
+        def child():
+            return subprocess.check_output(
+                PYTHON + ['import time; time.sleep(0.2); print("ok")'])
+
+        started = time.time()
+        self.assertEqual(self.run_tasks(*[child] * 20), [b'ok\n'] * 20)
+        # The processes ran at the same time
+        self.assertLess(time.time() - started, 2)
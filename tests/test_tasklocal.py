@@ -0,0 +1,116 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import asyncio
+import greenio
+import threading
+import unittest
+
+from _greentest import GreenTestCase
+
+
+class TaskLocalTests(GreenTestCase):
+    def test_local_per_task(self):
+        data = greenio.local()
+        seen = []
+
+        def worker(value):
+            self.assertFalse(hasattr(data, 'value'))
+            data.value = value
+            self.sleep(0.01 * value)
+            seen.append(data.value)
+            del data.value
+            with self.assertRaises(AttributeError):
+                data.value
+            with self.assertRaises(AttributeError):
+                del data.value
+
+        self.loop.run_until_complete(asyncio.wait(
+            [greenio.task(worker)(value) for value in (3, 1, 2)]))
+        self.assertEqual(seen, [1, 2, 3])
+
+        # Outside of green tasks, values are per thread
+        data.value = 'main'
+        thread = threading.Thread(
+            target=lambda: seen.append(hasattr(data, 'value')))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen[-1], False)
+        self.assertEqual(data.value, 'main')
+
+    def test_local_inherited(self):
+        data = greenio.local()
+        other = greenio.local()
+
+        def child():
+            self.assertEqual(data.value, 'parent')
+            self.assertFalse(hasattr(other, 'value'))
+            data.value = 'child'
+            self.sleep(0.01)
+            return data.value
+
+        def test():
+            data.value = 'parent'
+            results = greenio.gather(child, child)
+            self.assertEqual(results, ['child', 'child'])
+            self.assertEqual(data.value, 'parent')
+
+            # Changes made after a child is created are not seen by it
+            child_task = greenio.task(lambda: (data.value, other.value))()
+            data.value = 'changed'
+            other.value = 'set'
+            with self.assertRaises(AttributeError):
+                greenio.yield_from(child_task)
+            self.assertEqual(data.value, 'changed')
+
+            # Tasks started by plain coroutines inherit the data too
+            @asyncio.coroutine
+            def coro():
+                return data.value
+
+            self.assertEqual(
+                greenio.yield_from(self.loop.create_task(coro())), 'changed')
+
+        self.run_task(test)
+
+    def test_local_subclass(self):
+        class Request(greenio.local):
+            user = None
+
+            def describe(self):
+                return 'request of {}'.format(self.user)
+
+        request = Request()
+
+        def test(user):
+            self.assertIsNone(request.user)
+            request.user = user
+            self.sleep()
+            return request.describe()
+
+        self.assertEqual(self.run_task(test, 'alice'), 'request of alice')
+        self.assertEqual(self.run_task(test, 'bob'), 'request of bob')
+
+    @unittest.skipUnless(greenio._GR_CONTEXT,
+                         'greenlets have no contextvars context')
+    def test_contextvars(self):
+        import contextvars
+        var = contextvars.ContextVar('var', default=None)
+
+        def worker(value):
+            self.assertIsNone(var.get())
+            var.set(value)
+            self.sleep()
+            return var.get()
+
+        # Tasks reuse the pooled greenlet, but not its context
+        for value in range(3):
+            self.assertEqual(self.run_task(worker, value), value)
+        self.assertIsNone(var.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
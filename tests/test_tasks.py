@@ -6,6 +6,7 @@
 
 import asyncio
 import greenio
+import greenio.socket
 import unittest
 
 
@@ -95,3 +96,238 @@ class TaskTests(unittest.TestCase):
                 greenio.yield_from(bar)
 
         self.loop.run_until_complete(foo())
+
+    def test_task_greenlet_pool(self):
+        pool = greenio.get_greenlet_pool(self.loop)
+        self.assertIs(pool, greenio.get_greenlet_pool(self.loop))
+
+        @greenio.task
+        def foo(i):
+            fut = asyncio.Future(loop=self.loop)
+            self.loop.call_soon(fut.set_result, 1)
+            return greenio.yield_from(fut) + i
+
+        for i in range(5):
+            fut = foo(i)
+            self.loop.run_until_complete(fut)
+            self.assertEqual(fut.result(), i + 1)
+
+        self.assertEqual(pool.misses, 1)
+        self.assertEqual(pool.hits, 4)
+        self.assertEqual(len(pool), 1)
+
+    def test_task_greenlet_pool_disabled(self):
+        pool = greenio.get_greenlet_pool(self.loop)
+        pool.maxsize = 0
+
+        @greenio.task
+        def foo():
+            return 42
+
+        for i in range(3):
+            fut = foo()
+            self.loop.run_until_complete(fut)
+            self.assertEqual(fut.result(), 42)
+
+        self.assertEqual(pool.stats(), {'size': 0, 'maxsize': 0,
+                                        'hits': 0, 'misses': 3})
+
+    def test_task_greenlets_collected(self):
+        import gc
+        import weakref
+
+        def count_greenlets():
+            gc.collect()
+            return sum(isinstance(obj, greenio._TaskGreenlet)
+                       for obj in gc.get_objects())
+
+        before = count_greenlets()
+        loop = greenio.GreenEventLoopPolicy().new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, self.loop)
+        pool = greenio.get_greenlet_pool(loop)
+        pool.maxsize = 2
+
+        @greenio.task
+        def foo():
+            greenio.yield_from(asyncio.sleep(0, loop=loop))
+
+        # More tasks at once than the pool keeps greenlets for
+        tasks = [foo() for i in range(10)]
+        loop.run_until_complete(asyncio.wait(tasks, loop=loop))
+        task_refs = [weakref.ref(task) for task in tasks]
+        del tasks
+        # Only the pooled greenlets are left
+        self.assertEqual(count_greenlets(), before + 2)
+        self.assertEqual([ref() for ref in task_refs], [None] * 10)
+
+        loop.close()
+        asyncio.set_event_loop(self.loop)
+        ref = weakref.ref(loop)
+        del loop, pool, foo
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_task_yield_from_done_future(self):
+        calls = []
+
+        @greenio.task
+        def foo():
+            fut = asyncio.Future(loop=self.loop)
+            fut.set_result(1)
+            self.loop.call_soon(calls.append, 'loop')
+            res = greenio.yield_from(fut)
+            calls.append(res)
+
+            fut = asyncio.Future(loop=self.loop)
+            fut.set_exception(ZeroDivisionError())
+            with self.assertRaises(ZeroDivisionError):
+                greenio.yield_from(fut)
+            calls.append(2)
+
+        self.loop.run_until_complete(foo())
+        self.assertEqual(calls, [1, 2, 'loop'])
+
+    def test_task_yield_from_fast_path_budget(self):
+        calls = []
+
+        @greenio.task
+        def foo():
+            fut = asyncio.Future(loop=self.loop)
+            fut.set_result(None)
+            self.loop.call_soon(calls.append, 'loop')
+            for i in range(3):
+                greenio.yield_from(fut)
+                calls.append(i)
+
+        greenio.set_fast_path_budget(2)
+        self.addCleanup(greenio.set_fast_path_budget, None)
+        self.loop.run_until_complete(foo())
+        self.assertEqual(calls, [0, 'loop', 1, 2])
+
+        with self.assertRaises(ValueError):
+            greenio.set_fast_path_budget(0)
+
+    def test_timers(self):
+        timers = greenio._get_timers(self.loop)
+        self.assertIs(timers, greenio._get_timers(self.loop))
+        calls = []
+
+        timers.call_later(0.02, calls.append, 2)
+        timers.call_later(0.01, calls.append, 1)
+        cancelled = timers.call_later(0.005, calls.append, 0)
+        for i in range(100):
+            timers.call_later(0.01, calls.append, 'x').cancel()
+        cancelled.cancel()
+        self.assertEqual(len(timers), 2)
+
+        self.loop.run_until_complete(asyncio.sleep(0.03))
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(len(timers), 0)
+
+    def test_timers_dont_keep_loop_alive(self):
+        import gc
+        import weakref
+
+        loop = asyncio.SelectorEventLoop()
+        greenio._get_timers(loop).call_later(10, lambda: None).cancel()
+        loop.close()
+        ref = weakref.ref(loop)
+        del loop
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_task_stats(self):
+        import time
+        import greenio.stats
+
+        slow = []
+        greenio.stats.enable(
+            threshold=0.005,
+            hook=lambda task, duration, stack: slow.append((task, stack)))
+        self.addCleanup(greenio.stats.disable)
+        self.assertTrue(greenio.stats.is_enabled())
+
+        def busy():
+            time.sleep(0.01)
+            greenio.yield_from(asyncio.sleep(0.01))
+
+        @greenio.task
+        def test():
+            busy()
+            greenio.yield_from(asyncio.sleep(0.01))
+
+        task = test()
+        self.loop.run_until_complete(task)
+
+        stats = greenio.stats.get_stats(task)
+        self.assertEqual(stats.switches, 3)
+        self.assertGreaterEqual(stats.run_time, 0.01)
+        self.assertGreaterEqual(stats.wait_time, 0.015)
+        self.assertGreaterEqual(stats.max_run_time, 0.01)
+
+        # Only the first step was slow, it yielded in "busy"
+        self.assertEqual(len(slow), 1)
+        self.assertIs(slow[0][0], task)
+        self.assertIn('in busy', slow[0][1][-2])
+
+        greenio.stats.disable()
+        task = test()
+        self.loop.run_until_complete(task)
+        self.assertIsNone(greenio.stats.get_stats(task))
+
+    def test_task_current_task(self):
+        current = []
+
+        def check():
+            current.append(asyncio.Task.current_task(self.loop))
+
+        @greenio.task
+        def test():
+            check()
+            self.loop.call_soon(check)
+            greenio.yield_from(asyncio.sleep(0.001))
+            check()
+            greenio.yield_from(asyncio.sleep(0.001))
+
+        task = test()
+        self.loop.run_until_complete(task)
+        self.assertEqual(current, [task, None, task])
+        self.assertIsNone(asyncio.Task.current_task(self.loop))
+
+    def test_install(self):
+        loop = asyncio.SelectorEventLoop()
+        self.addCleanup(loop.close)
+        self.assertIs(greenio.install(loop), loop)
+        self.assertIs(greenio.install(loop), loop)
+        self.assertNotIsInstance(loop, greenio._GreenLoopMixin)
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, self.loop)
+
+        @asyncio.coroutine
+        def bar():
+            yield from asyncio.sleep(0.001)
+            return 'bar'
+
+        def test():
+            sock = greenio.socket.socket()
+            sock.close()
+            return greenio.yield_from(bar())
+
+        task = greenio.task(test)()
+        self.assertIsInstance(task, greenio._GreenTaskMixin)
+        self.assertEqual(loop.run_until_complete(task), 'bar')
+
+        other = asyncio.SelectorEventLoop()
+        self.addCleanup(other.close)
+        other.set_task_factory(lambda loop, coro: asyncio.Task(coro,
+                                                               loop=loop))
+        with self.assertRaises(RuntimeError):
+            greenio.install(other)
+
+        policy = greenio.GreenEventLoopPolicy(asyncio.SelectorEventLoop)
+        loop = policy.new_event_loop()
+        self.addCleanup(loop.close)
+        self.assertNotIsInstance(loop, greenio.GreenUnixSelectorLoop)
+        self.assertEqual(loop.run_until_complete(
+            greenio.task(lambda: 42, loop=loop)()), 42)
@@ -0,0 +1,116 @@
+##
+# Copyright (c) 2013 Yury Selivanov
+# License: Apache 2.0
+##
+
+
+import os
+import signal
+import socket
+import threading
+import time
+import unittest
+
+from greenio import workers
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+def echo(sock, addr):
+    sock.sendall(sock.recv(1024))
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+class WorkersTests(unittest.TestCase):
+    def echo_request(self, port, data):
+        conn = socket.create_connection(('127.0.0.1', port))
+        try:
+            conn.sendall(data)
+            return conn.recv(1024)
+        finally:
+            conn.close()
+
+    def test_workers(self):
+        reports = []
+        supervisor = workers.Supervisor(echo, '127.0.0.1', 0, workers=2,
+                                        stats_interval=0.05,
+                                        on_stats=reports.append)
+        errors = []
+
+        def client():
+            try:
+                wait_for(lambda: len(supervisor.pids()) == 2)
+                port = supervisor.sockets[0].getsockname()[1]
+                for i in range(10):
+                    data = 'request {}'.format(i).encode()
+                    self.assertEqual(self.echo_request(port, data), data)
+                wait_for(lambda: reports and reports[-1]['handled'] == 10)
+
+                # A dead worker is restarted
+                pid = supervisor.pids()[0]
+                os.kill(pid, signal.SIGKILL)
+                wait_for(lambda: supervisor.restarts == 1 and
+                         len(supervisor.pids()) == 2)
+                self.assertNotIn(pid, supervisor.pids())
+                self.assertEqual(self.echo_request(port, b'again'),
+                                 b'again')
+            except BaseException as exc:
+                errors.append(exc)
+            finally:
+                supervisor.stop()
+
+        thread = threading.Thread(target=client)
+        thread.start()
+        supervisor.run()
+        thread.join()
+        if errors:
+            raise errors[0]
+
+        self.assertEqual(reports[0]['workers'], 2)
+        stats = supervisor.stats()
+        self.assertEqual(stats['workers'], 0)
+        self.assertEqual(stats['restarts'], 1)
+        self.assertGreaterEqual(stats['handled'], 1)
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(supervisor.sockets, [])
+
+    def test_workers_drain(self):
+        supervisor = workers.Supervisor(echo, '127.0.0.1', 0, workers=1)
+        received = []
+
+        def client():
+            try:
+                wait_for(lambda: supervisor.pids())
+                port = supervisor.sockets[0].getsockname()[1]
+                conn = socket.create_connection(('127.0.0.1', port))
+                # Make sure the connection was accepted
+                conn.sendall(b'1')
+                received.append(conn.recv(1024))
+                conn.close()
+
+                conn = socket.create_connection(('127.0.0.1', port))
+                time.sleep(0.1)
+                supervisor.stop()
+                # The active connection is finished before the worker
+                # exits
+                time.sleep(0.1)
+                conn.sendall(b'2')
+                received.append(conn.recv(1024))
+                conn.close()
+            except BaseException:
+                supervisor.stop()
+                raise
+
+        thread = threading.Thread(target=client)
+        thread.start()
+        started = time.time()
+        supervisor.run()
+        thread.join()
+        self.assertEqual(received, [b'1', b'2'])
+        self.assertLess(time.time() - started, 5)